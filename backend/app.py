@@ -1,20 +1,51 @@
 import os
 import sys
 import time
+import csv
+import io
+import json
+import uuid
+import asyncio
+import base64
+import select
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from itertools import repeat
 from datetime import datetime, timedelta, timezone
 from typing import List, Dict, Any, Optional
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
+import anyio
 from pydantic import BaseModel
 from dotenv import load_dotenv
 import psycopg2
 from psycopg2.extras import RealDictCursor, execute_values
+from psycopg2.pool import ThreadedConnectionPool, PoolError
 import pytz
 import statistics
+import numpy as np
 
-from prometheus_client import Counter, Histogram, Gauge, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client import Counter, Histogram, Gauge, CollectorRegistry, REGISTRY, multiprocess, generate_latest, CONTENT_TYPE_LATEST
 from fastapi.responses import Response
+from fastapi.encoders import jsonable_encoder
+
+# Optional shared backing for the /data response cache
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# Arrow IPC responses are optional; /data?format=arrow returns 406 without pyarrow
+try:
+    import pyarrow as pa
+    ARROW_AVAILABLE = True
+except ImportError:
+    pa = None
+    ARROW_AVAILABLE = False
 
 # Load environment variables
 load_dotenv()
@@ -35,18 +66,81 @@ MAX_DATE_RANGE_DAYS = 60
 DEFAULT_PAGE_SIZE = 1000
 SYNTHETIC_DATA_SEED = 42
 
-# Prometheus Metrics
+# Query routing: ranges up to RAW_DATA_MAX_DAYS read raw points, longer ranges read aggregates
+RAW_DATA_MAX_DAYS = 7
+DAILY_AGGREGATE_MAX_DAYS = 180
+RESOLUTIONS = ["raw", "1h", "1d", "1w"]
+
+# Server-side downsampling for chart queries (/data?max_points=N)
+DOWNSAMPLE_METHODS = ["lttb", "minmax"]
+MIN_DOWNSAMPLE_POINTS = 3
+
+# Where /data gets gaps from: the data_gaps table or a fresh scan of raw_data
+GAP_SOURCES = ["stored", "detect"]
+GAP_TYPES = ["short", "medium", "long"]
+
+# /data response formats and their media types
+DATA_FORMATS = {
+    "json": "application/json",
+    "columnar": "application/vnd.snyderlab.columnar+json",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+# Streaming export settings
+EXPORT_BATCH_SIZE = 5000
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+EXPORT_COLUMNS = ["timestamp", "user_id", "metric_type", "value", "is_imputed", "imputation_method"]
+
+# Generated batches of at least this many rows are loaded with COPY into a staging table
+COPY_MIN_ROWS = int(os.getenv("COPY_MIN_ROWS", "5000"))
+
+# Job log streaming: lines per read, seconds between polls of a quiet job, and seconds of
+# silence before a keepalive comment is sent
+JOB_LOG_PAGE_SIZE = 1000
+JOB_LOG_POLL_SECONDS = float(os.getenv("JOB_LOG_POLL_SECONDS", "0.5"))
+JOB_LOG_KEEPALIVE_SECONDS = 15
+
+# /data response cache: entries per process (0 disables the in-process cache), lifetime, and
+# an optional Redis URL that replaces the in-process store with one shared by all processes
+DATA_CACHE_MAX_ENTRIES = int(os.getenv("DATA_CACHE_MAX_ENTRIES", "256"))
+DATA_CACHE_TTL_SECONDS = int(os.getenv("DATA_CACHE_TTL_SECONDS", "300"))
+DATA_CACHE_REDIS_URL = os.getenv("DATA_CACHE_REDIS_URL", "")
+# A changed point alters the aggregate bucket containing it, which cached responses up to one
+# bucket width (at most a week) before or after the point may hold
+DATA_CACHE_BUCKET_MARGIN = timedelta(weeks=1)
+
+# Continuous aggregate view and bucket width for each aggregate resolution (see init.sql)
+AGGREGATE_VIEWS = {
+    "1h": ("data_1h", "1 hour"),
+    "1d": ("data_1d", "1 day"),
+    "1w": ("data_1w", "1 week"),
+}
+
+# Prometheus Metrics. With several server processes (see gunicorn.conf.py) each one writes
+# its samples under PROMETHEUS_MULTIPROC_DIR and /prom-metrics merges them; gauges report
+# the sum over live processes.
 api_requests_total = Counter('api_requests_total', 'Total API requests', ['method', 'endpoint', 'status'])
 api_request_duration = Histogram('api_request_duration_seconds', 'API request duration')
 data_points_processed = Counter('data_points_processed_total', 'Total data points processed')
-database_connections = Gauge('database_connections_active', 'Active database connections')
+database_connections = Gauge('database_connections_active', 'Active database connections', multiprocess_mode='livesum')
+database_pool_idle = Gauge('database_pool_idle_connections', 'Idle connections held open by the database pool', multiprocess_mode='livesum')
+database_pool_size = Gauge('database_pool_max_connections', 'Maximum size of the database connection pool', multiprocess_mode='livesum')
 imputation_operations = Counter('imputation_operations_total', 'Total imputation operations', ['type'])
+data_cache_requests = Counter('data_cache_requests_total', 'Cacheable /data requests by cache result', ['result'])
+data_cache_evictions = Counter('data_cache_evictions_total', 'Entries dropped from the /data response cache', ['reason'])
 
 # Add ingestion module to Python path
 current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
 sys.path.append(parent_dir)
 
+# SQL and helpers every raw_data writer shares with ingestion (gap refresh, baselines, user
+# stats, change notifications)
+from ingestion.shared_sql import (
+    SHORT_GAP_MAX_HOURS, MEDIUM_GAP_MAX_HOURS, MAX_STEP_HOURS, BASELINE_TIMEZONE, DATA_CHANGED_CHANNEL,
+    baseline_upsert_sql, user_daily_stats_upsert_sql, refresh_data_gaps, refresh_user_stats, notify_data_changed,
+)
+
 class UserEnrollment(BaseModel):
     user_id: str
     enrollment_date: datetime
@@ -66,126 +160,274 @@ class DatabaseConfig:
         self.name = os.getenv("DB_NAME")
         self.user = os.getenv("DB_USER")
         self.password = os.getenv("DB_PASSWORD")
+        self.pool_min = int(os.getenv("DB_POOL_MIN", "1"))
+        self.pool_max = int(os.getenv("DB_POOL_MAX", "10"))
+        self.pool_timeout = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+        self._pool = None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+        # ThreadedConnectionPool raises as soon as it is exhausted, so waiting is done here
+        self._pool_slots = threading.BoundedSemaphore(self.pool_max)
+        self._in_use = 0
     
-    def get_connection(self):
-        return psycopg2.connect(
-            host=self.host,
-            port=self.port,
-            user=self.user,
-            password=self.password,
-            dbname=self.name
-        )
-
-# Capture print statements for API clients
-class LogCapture:
-    def __init__(self):
-        self.logs = []
+    def _get_pool(self) -> ThreadedConnectionPool:
+        # Created lazily so importing the app does not require a reachable database, and per
+        # process: a pool inherited through fork shares its sockets with the parent, so a
+        # forked server worker drops it (without closing) and opens its own
+        if self._pool is not None and self._pool_pid != os.getpid():
+            self._pool = None
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ThreadedConnectionPool(
+                        self.pool_min,
+                        self.pool_max,
+                        host=self.host,
+                        port=self.port,
+                        user=self.user,
+                        password=self.password,
+                        dbname=self.name
+                    )
+                    self._pool_pid = os.getpid()
+                    database_pool_size.set(self.pool_max)
+        return self._pool
     
-    def write(self, msg: str):
-        if msg.strip():
-            self.logs.append(msg.strip())
+    @contextmanager
+    def connection(self):
+        # Borrow a pooled connection, waiting up to pool_timeout seconds for a free slot
+        if not self._pool_slots.acquire(timeout=self.pool_timeout):
+            raise PoolError(f"Timed out after {self.pool_timeout}s waiting for a database connection")
+        
+        conn = None
+        try:
+            pool = self._get_pool()
+            conn = pool.getconn()
+            self._track_usage(1)
+            try:
+                yield conn
+            except Exception:
+                # A connection whose transaction failed is rolled back before it is returned
+                if not conn.closed:
+                    conn.rollback()
+                raise
+            finally:
+                # Broken connections are discarded instead of being handed out again
+                pool.putconn(conn, close=bool(conn.closed))
+                self._track_usage(-1)
+        finally:
+            self._pool_slots.release()
     
-    def flush(self):
-        pass
+    def _track_usage(self, delta: int):
+        with self._pool_lock:
+            self._in_use += delta
+            database_connections.set(self._in_use)
+            database_pool_idle.set(len(self._pool._pool) if self._pool else 0)
     
-    def get_logs(self) -> List[str]:
-        return self.logs.copy()
+    def connect(self):
+        # Dedicated connection outside the pool, for long-lived uses such as LISTEN
+        return psycopg2.connect(host=self.host, port=self.port, user=self.user,
+                                password=self.password, dbname=self.name)
     
-    def clear(self):
-        self.logs.clear()
+    def close(self):
+        if self._pool is not None:
+            self._pool.closeall()
+            self._pool = None
 
 # Gap Detection Service - Identifies missing data periods
 class GapDetectionService:
+    # Gap tiers by duration in hours: short <= 2, medium <= 10, long beyond that
+    SHORT_GAP_MAX_HOURS = SHORT_GAP_MAX_HOURS
+    MEDIUM_GAP_MAX_HOURS = MEDIUM_GAP_MAX_HOURS
+
     def __init__(self, db_config: DatabaseConfig):
         self.db_config = db_config
-        self.expected_interval_hours = 1
     
-    def detect_gaps(self, data_points: List[Dict], user_id: str, metric: str) -> List[Dict]:
-        # Detect gaps in time series data and categorize them
-        try:
-            if len(data_points) < 2:
-                return []
-            
-            gaps = []
-            
-            for i in range(len(data_points) - 1):
-                try:
-                    current_time = datetime.fromisoformat(data_points[i]['timestamp'].replace('Z', '+00:00'))
-                    next_time = datetime.fromisoformat(data_points[i + 1]['timestamp'].replace('Z', '+00:00'))
-                    
-                    time_diff = next_time - current_time
-                    expected_diff = timedelta(hours=self.expected_interval_hours)
-                    
-                    # If gap is larger than expected interval, record it
-                    if time_diff > expected_diff * 1.5:  # Allow 50% tolerance
-                        gap_hours = time_diff.total_seconds() / 3600
-                        gap_type = self._categorize_gap(gap_hours)
-                        
-                        gap = {
-                            'gap_start': current_time,
-                            'gap_end': next_time,
-                            'gap_duration_hours': int(gap_hours),
-                            'gap_type': gap_type,
-                            'before_point': data_points[i],
-                            'after_point': data_points[i + 1]
-                        }
-                        gaps.append(gap)
-                except Exception as e:
-                    continue
-            
-            return gaps
-            
-        except Exception as e:
-            return []
+    def detect_gaps_in_range(self, user_id: str, metrics: List[str], start_time: datetime, end_time: datetime) -> List[Dict]:
+        # Detect gaps between measured points over the whole range in one pass, using LEAD()
+        # over each metric's series; gaps that span /data pages are found as well. A gap that
+        # already holds imputed points counts as imputed, like the flag kept in data_gaps.
+        with self.db_config.connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT metric_type, timestamp, value, next_timestamp, next_value,
+                       EXTRACT(EPOCH FROM next_timestamp - timestamp) / 3600 AS gap_hours,
+                       EXISTS (
+                           SELECT 1 FROM raw_data imputed
+                           WHERE imputed.user_id = %s AND imputed.metric_type = steps.metric_type
+                           AND imputed.is_imputed
+                           AND imputed.timestamp > steps.timestamp AND imputed.timestamp < steps.next_timestamp
+                       ) AS imputation_applied
+                FROM (
+                    SELECT metric_type, timestamp, value,
+                           LEAD(timestamp) OVER series AS next_timestamp,
+                           LEAD(value) OVER series AS next_value
+                    FROM raw_data
+                    WHERE user_id = %s AND metric_type = ANY(%s)
+                    AND timestamp BETWEEN %s AND %s
+                    AND COALESCE(is_imputed, FALSE) = FALSE
+                    WINDOW series AS (PARTITION BY metric_type ORDER BY timestamp)
+                ) steps
+                WHERE next_timestamp - timestamp > %s * INTERVAL '1 hour'
+                ORDER BY metric_type, timestamp
+            """, (user_id, user_id, list(metrics), start_time, end_time, MAX_STEP_HOURS))
+            rows = cur.fetchall()
+            cur.close()
+        
+        gap_hours = np.array([float(row[5]) for row in rows], dtype=np.float64)
+        gap_types = self._categorize_gaps(gap_hours)
+        gaps = []
+        for (metric_type, timestamp, value, next_timestamp, next_value, _, imputation_applied), hours, gap_type in zip(rows, gap_hours, gap_types):
+            gaps.append({
+                'gap_start': timestamp,
+                'gap_end': next_timestamp,
+                'gap_duration_hours': int(hours),
+                'gap_type': str(gap_type),
+                'imputation_applied': imputation_applied,
+                'before_point': self._gap_edge_point(user_id, metric_type, timestamp, value),
+                'after_point': self._gap_edge_point(user_id, metric_type, next_timestamp, next_value)
+            })
+        return gaps
     
-    def _categorize_gap(self, hours: float) -> str:
-        # Categorize gaps into tiers based on duration
-        if hours <= 2:
-            return 'short'
-        elif hours <= 10:
-            return 'medium'
+    def load_stored_gaps(self, user_id: str, metrics: List[str], start_time: datetime, end_time: datetime) -> List[Dict]:
+        # Read gaps precomputed at ingestion time from data_gaps, with their bounding points
+        with self.db_config.connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT g.metric_type, g.gap_start, before_point.value, g.gap_end, after_point.value,
+                       g.gap_duration_hours, g.gap_type, g.imputation_applied
+                FROM data_gaps g
+                JOIN raw_data before_point ON before_point.user_id = g.user_id
+                    AND before_point.metric_type = g.metric_type AND before_point.timestamp = g.gap_start
+                JOIN raw_data after_point ON after_point.user_id = g.user_id
+                    AND after_point.metric_type = g.metric_type AND after_point.timestamp = g.gap_end
+                WHERE g.user_id = %s AND g.metric_type = ANY(%s)
+                AND g.gap_start >= %s AND g.gap_end <= %s
+                ORDER BY g.metric_type, g.gap_start
+            """, (user_id, list(metrics), start_time, end_time))
+            rows = cur.fetchall()
+            cur.close()
+        
+        gaps = []
+        for metric_type, gap_start, before_value, gap_end, after_value, duration_hours, gap_type, imputation_applied in rows:
+            gaps.append({
+                'gap_start': gap_start,
+                'gap_end': gap_end,
+                'gap_duration_hours': duration_hours,
+                'gap_type': gap_type,
+                'imputation_applied': imputation_applied,
+                'before_point': self._gap_edge_point(user_id, metric_type, gap_start, before_value),
+                'after_point': self._gap_edge_point(user_id, metric_type, gap_end, after_value)
+            })
+        return gaps
+    
+    def pending_gaps_since(self, user_id: str, metric: str, start_time: datetime, end_time: datetime, gap_source: str) -> Optional[datetime]:
+        # When the fillable gaps of the range that are still unfilled appeared, or None if there
+        # are none. Stored gaps carry detected_at; detected gaps can only have appeared with
+        # the user's last raw_data write, which user_stats records.
+        if gap_source == "detect":
+            gaps = self.detect_gaps_in_range(user_id, [metric], start_time, end_time)
+            if not any(gap['gap_type'] != 'long' and not gap['imputation_applied'] for gap in gaps):
+                return None
+            query = "SELECT COALESCE((SELECT updated_at FROM user_stats WHERE user_id = %s), NOW())"
+            params = (user_id,)
         else:
-            return 'long'
+            query = """
+                SELECT MAX(detected_at)::timestamptz FROM data_gaps
+                WHERE user_id = %s AND metric_type = %s AND gap_start >= %s AND gap_end <= %s
+                AND gap_type <> 'long' AND NOT imputation_applied
+            """
+            params = (user_id, metric, start_time, end_time)
+        with self.db_config.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(query, params)
+            pending_since = cur.fetchone()[0]
+            cur.close()
+        return pending_since
+    
+    def refresh_stored_gaps(self, cur, series: Dict[tuple, tuple]):
+        # Re-detect data_gaps for newly inserted points; series maps (user_id, metric_type)
+        # to the (first, last) inserted timestamp. The rescan window is widened to the
+        # neighbouring measured points, so gaps split or closed by the new points are replaced.
+        refresh_data_gaps(cur, series)
+    
+    def mark_imputed(self, gaps: List[Dict]):
+        # Flag stored gaps that imputation has filled
+        filled = [
+            (gap['before_point']['user_id'], gap['before_point']['metric_type'], gap['gap_start'], gap['gap_end'])
+            for gap in gaps if gap['gap_type'] != 'long'
+        ]
+        if not filled:
+            return
+        with self.db_config.connection() as conn:
+            cur = conn.cursor()
+            execute_values(cur, """
+                UPDATE data_gaps g SET imputation_applied = TRUE
+                FROM (VALUES %s) AS filled (user_id, metric_type, gap_start, gap_end)
+                WHERE g.user_id = filled.user_id AND g.metric_type = filled.metric_type
+                AND g.gap_start = filled.gap_start AND g.gap_end = filled.gap_end
+            """, filled)
+            conn.commit()
+            cur.close()
+    
+    def _gap_edge_point(self, user_id: str, metric: str, timestamp: datetime, value) -> Dict:
+        # Measured point bounding a gap, in the /data point shape the imputation tiers expect
+        return {
+            'timestamp': timestamp.isoformat(),
+            'user_id': user_id,
+            'metric_type': metric,
+            'value': float(value),
+            'is_imputed': False
+        }
+    
+    def _categorize_gaps(self, hours: np.ndarray) -> np.ndarray:
+        # Categorize gaps into tiers based on duration
+        return np.select(
+            [hours <= self.SHORT_GAP_MAX_HOURS, hours <= self.MEDIUM_GAP_MAX_HOURS],
+            ['short', 'medium'],
+            default='long'
+        )
 
 # Imputation Service - Fills gaps and saves to database
 class ImputationService:
+    # Weights of the two baseline profiles in the pattern-based prediction
+    HOUR_PROFILE_WEIGHT = 0.65      # Same hour of day, all weekdays
+    WEEKDAY_PROFILE_WEIGHT = 0.35   # Same hour on the same weekday
+
     def __init__(self, db_config: DatabaseConfig):
         self.db_config = db_config
     
-    def apply_imputation(self, data_points: List[Dict], gaps: List[Dict], user_id: str, metric: str) -> List[Dict]:
-        # Apply tiered imputation strategy with pattern-based enhancement
-        try:
-            if not gaps:
-                return data_points
-            
-            all_points = data_points.copy()
-            all_imputed_points = []
-            
-            for gap in gaps:
-                try:
-                    if gap['gap_type'] == 'short':
-                        imputed_points = self._impute_tier1_linear(gap)
-                    elif gap['gap_type'] == 'medium':
-                        imputed_points = self._impute_tier2_pattern_based(gap)
-                    else:  # long gaps
-                        imputed_points = []
-                    
-                    all_points.extend(imputed_points)
-                    all_imputed_points.extend(imputed_points)
-                    
-                except Exception as e:
-                    continue
-            
-            # Save imputed points to database
-            if all_imputed_points:
-                self._save_imputed_points_to_database(all_imputed_points)
-            
-            # Sort by timestamp
-            all_points.sort(key=lambda x: x['timestamp'])
-            return all_points
-            
-        except Exception as e:
-            return data_points
+    def impute_gaps(self, gaps: List[Dict]) -> List[Dict]:
+        # Apply tiered imputation strategy with pattern-based enhancement, save the imputed
+        # points and return them. Database errors propagate so background jobs can fail visibly.
+        if not gaps:
+            return []
+        
+        all_imputed_points = []
+        
+        # Baseline profiles for every series with a medium gap, read in one query
+        medium_gaps = [gap for gap in gaps if gap['gap_type'] == 'medium']
+        profiles = self._get_baseline_profiles(medium_gaps)
+        
+        for gap in gaps:
+            try:
+                if gap['gap_type'] == 'short':
+                    imputed_points = self._impute_tier1_linear(gap)
+                elif gap['gap_type'] == 'medium':
+                    series = (gap['before_point']['user_id'], gap['before_point']['metric_type'])
+                    imputed_points = self._impute_tier2_pattern_based(gap, profiles.get(series))
+                else:  # long gaps
+                    imputed_points = []
+                
+                all_imputed_points.extend(imputed_points)
+                
+            except Exception as e:
+                continue
+        
+        # Save imputed points to database
+        if all_imputed_points:
+            self._save_imputed_points_to_database(all_imputed_points)
+        
+        return all_imputed_points
     
     def _impute_tier1_linear(self, gap: Dict) -> List[Dict]:
         # Linear interpolation for gaps
@@ -225,8 +467,9 @@ class ImputationService:
         except Exception as e:
             return []
     
-    def _impute_tier2_pattern_based(self, gap: Dict) -> List[Dict]:
-        # Pattern-based imputation using historical data from same times
+    def _impute_tier2_pattern_based(self, gap: Dict, profile: Optional[tuple]) -> List[Dict]:
+        # Pattern-based imputation from the series' baseline profile; profile is the
+        # (means, counts) pair from _get_baseline_profiles
         try:
             before_point = gap['before_point']
             after_point = gap['after_point']
@@ -234,45 +477,43 @@ class ImputationService:
             before_time = datetime.fromisoformat(before_point['timestamp'].replace('Z', '+00:00'))
             after_time = datetime.fromisoformat(after_point['timestamp'].replace('Z', '+00:00'))
             
-            # Get historical data from same times
-            historical_patterns = self._get_historical_patterns(
-                before_point['user_id'], 
-                before_point['metric_type'], 
-                before_time, 
-                after_time
-            )
-            
-            imputed_points = []
+            times = []
             current_time = before_time + timedelta(hours=1)
-            
             while current_time < after_time:
-                # Try pattern-based prediction first
-                predicted_value = self._predict_from_patterns(current_time, historical_patterns)
-                
-                if predicted_value is not None:
-                    imputation_method = 'pattern_based'
-                else:
-                    # Fallback to linear interpolation
-                    time_ratio = (current_time - before_time).total_seconds() / (after_time - before_time).total_seconds()
-                    predicted_value = before_point['value'] + (after_point['value'] - before_point['value']) * time_ratio
-                    imputation_method = 'linear_fallback'
-                
-                imputed_point = {
+                times.append(current_time)
+                current_time += timedelta(hours=1)
+            if not times:
+                return []
+            
+            # Linear interpolation is the fallback for hours without historical matches
+            ratios = np.array([(t - before_time).total_seconds() for t in times]) / (after_time - before_time).total_seconds()
+            linear_values = before_point['value'] + (after_point['value'] - before_point['value']) * ratios
+            
+            if profile is not None:
+                local_times = [t.astimezone(pytz.timezone(BASELINE_TIMEZONE)) for t in times]
+                predicted_values, has_pattern = self._predict_from_profile(
+                    np.array([t.isoweekday() % 7 for t in local_times]),
+                    np.array([t.hour for t in local_times]),
+                    *profile
+                )
+                values = np.where(has_pattern, predicted_values, linear_values)
+            else:
+                has_pattern = np.zeros(len(times), dtype=bool)
+                values = linear_values
+            
+            imputed_points = []
+            for current_time, value, pattern_based in zip(times, values, has_pattern):
+                imputation_method = 'pattern_based' if pattern_based else 'linear_fallback'
+                imputed_points.append({
                     'timestamp': current_time.isoformat(),
                     'user_id': before_point['user_id'],
                     'metric_type': before_point['metric_type'],
-                    'value': round(predicted_value, 2),
+                    'value': round(float(value), 2),
                     'is_imputed': True,
                     'imputation_method': imputation_method,
                     'gap_duration_hours': gap['gap_duration_hours']
-                }
-                
-                imputed_points.append(imputed_point)
-                if imputation_method == 'pattern_based':
-                    imputation_operations.labels(type='pattern_based').inc()
-                else:
-                    imputation_operations.labels(type='linear_fallback').inc()
-                current_time += timedelta(hours=1)
+                })
+                imputation_operations.labels(type=imputation_method).inc()
             
             return imputed_points
             
@@ -280,94 +521,54 @@ class ImputationService:
             # Fallback to linear interpolation
             return self._impute_tier1_linear(gap)
 
-    def _get_historical_patterns(self, user_id: str, metric_type: str, start_time: datetime, end_time: datetime) -> Dict:
-        # Get historical data from same time periods
+    def _get_baseline_profiles(self, gaps: List[Dict]) -> Dict[tuple, tuple]:
+        # Baseline means and sample counts, shaped (weekday, hour), for each series with a gap
+        series = sorted({(gap['before_point']['user_id'], gap['before_point']['metric_type']) for gap in gaps})
+        if not series:
+            return {}
         try:
-            conn = self.db_config.get_connection()
-            cur = conn.cursor(cursor_factory=RealDictCursor)
-            
-            patterns = {}
-            lookback_days = [1, 2, 7, 14]
-            
-            for days_back in lookback_days:
-                historical_start = start_time - timedelta(days=days_back)
-                historical_end = end_time - timedelta(days=days_back)
-                
-                cur.execute("""
-                    SELECT timestamp, value 
-                    FROM raw_data 
-                    WHERE user_id = %s AND metric_type = %s 
-                    AND timestamp BETWEEN %s AND %s
-                    AND COALESCE(is_imputed, FALSE) = FALSE
-                    ORDER BY timestamp
-                """, (user_id, metric_type, historical_start, historical_end))
-                
-                historical_data = cur.fetchall()
-                
-                if historical_data:
-                    patterns[f'{days_back}d_ago'] = [
-                        {
-                            'timestamp': row['timestamp'],
-                            'value': float(row['value']),
-                            'hour': row['timestamp'].hour
-                        } for row in historical_data
-                    ]
-            
-            cur.close()
-            conn.close()
+            with self.db_config.connection() as conn:
+                cur = conn.cursor()
+                rows = execute_values(cur, """
+                    SELECT b.user_id, b.metric_type, b.day_of_week, b.hour_of_day, b.mean_value, b.sample_count
+                    FROM user_baselines b
+                    JOIN (VALUES %s) AS s (user_id, metric_type)
+                        ON b.user_id = s.user_id AND b.metric_type = s.metric_type
+                """, series, fetch=True)
+                cur.close()
             
-            return patterns
+            profiles = {}
+            for user_id, metric_type, day_of_week, hour_of_day, mean_value, sample_count in rows:
+                if (user_id, metric_type) not in profiles:
+                    profiles[(user_id, metric_type)] = (np.zeros((7, 24)), np.zeros((7, 24)))
+                means, counts = profiles[(user_id, metric_type)]
+                means[day_of_week, hour_of_day] = mean_value
+                counts[day_of_week, hour_of_day] = sample_count
+            return profiles
             
         except Exception as e:
             return {}
 
-    def _predict_from_patterns(self, target_time: datetime, patterns: Dict) -> Optional[float]:
-        # Predict value based on historical patterns
-        try:
-            target_hour = target_time.hour
-            predictions = []
-            weights = []
-            
-            # Weight different historical periods
-            pattern_weights = {
-                '1d_ago': 0.4,    # Yesterday gets highest weight
-                '2d_ago': 0.25,   # Day before yesterday
-                '7d_ago': 0.25,   # Same day last week
-                '14d_ago': 0.1    # Same day 2 weeks ago
-            }
-            
-            for pattern_key, pattern_data in patterns.items():
-                if pattern_key not in pattern_weights:
-                    continue
-                    
-                # Find data points close to target hour
-                hour_matches = [
-                    point for point in pattern_data 
-                    if abs(point['hour'] - target_hour) <= 1
-                ]
-                
-                if hour_matches:
-                    # Use average of close matches
-                    avg_value = sum(point['value'] for point in hour_matches) / len(hour_matches)
-                    predictions.append(avg_value)
-                    weights.append(pattern_weights[pattern_key])
-            
-            if predictions:
-                # Weighted average of predictions
-                weighted_prediction = sum(p * w for p, w in zip(predictions, weights)) / sum(weights)
-                return weighted_prediction
-            
-            return None
-            
-        except Exception as e:
-            return None
+    def _predict_from_profile(self, weekdays: np.ndarray, hours: np.ndarray, means: np.ndarray, counts: np.ndarray) -> tuple:
+        # Blend the hour-of-day mean over all weekdays with the same-weekday mean; a profile
+        # without samples at that slot is left out. Returns (predictions, has_prediction).
+        hour_counts = counts.sum(axis=0)
+        hour_means = np.divide((means * counts).sum(axis=0), hour_counts,
+                               out=np.zeros(24), where=hour_counts > 0)
+        
+        hour_weights = self.HOUR_PROFILE_WEIGHT * (hour_counts[hours] > 0)
+        weekday_weights = self.WEEKDAY_PROFILE_WEIGHT * (counts[weekdays, hours] > 0)
+        weight_totals = hour_weights + weekday_weights
+        weighted_sums = hour_weights * hour_means[hours] + weekday_weights * means[weekdays, hours]
+        has_prediction = weight_totals > 0
+        predictions = np.divide(weighted_sums, weight_totals, out=np.zeros(len(hours)), where=has_prediction)
+        return predictions, has_prediction
     
     def _save_imputed_points_to_database(self, imputed_points: List[Dict]):
         # Save imputed points to database
-        try:
-            conn = self.db_config.get_connection()
+        with self.db_config.connection() as conn:
             cur = conn.cursor()
-            
+        
             records = []
             for point in imputed_points:
                 records.append((
@@ -379,25 +580,482 @@ class ImputationService:
                     point['imputation_method'],
                     point['gap_duration_hours']
                 ))
-            
-            sql = """
-                INSERT INTO raw_data (timestamp, user_id, metric_type, value, is_imputed, imputation_method, gap_duration_hours) 
-                VALUES %s 
-                ON CONFLICT (timestamp, user_id, metric_type) DO UPDATE SET
-                    is_imputed = EXCLUDED.is_imputed,
-                    imputation_method = EXCLUDED.imputation_method,
-                    gap_duration_hours = EXCLUDED.gap_duration_hours;
+        
+            # Imputation runs after the gap was detected, so a measured point may have been
+            # ingested into it since; only earlier imputations are overwritten, never measured
+            # rows. An overwritten row stays imputed, so only new rows change the daily stats.
+            sql = f"""
+                WITH written AS (
+                    INSERT INTO raw_data (timestamp, user_id, metric_type, value, is_imputed, imputation_method, gap_duration_hours) 
+                    VALUES %s 
+                    ON CONFLICT (timestamp, user_id, metric_type) DO UPDATE SET
+                        is_imputed = EXCLUDED.is_imputed,
+                        imputation_method = EXCLUDED.imputation_method,
+                        gap_duration_hours = EXCLUDED.gap_duration_hours
+                    WHERE raw_data.is_imputed
+                    RETURNING user_id, metric_type, timestamp, is_imputed, xmax = 0 AS inserted
+                ), daily_stats AS ({user_daily_stats_upsert_sql("(SELECT * FROM written WHERE inserted) AS new_rows")})
+                SELECT user_id, metric_type, MIN(timestamp), MAX(timestamp)
+                FROM written GROUP BY user_id, metric_type;
             """
-            
-            execute_values(cur, sql, records, template=None, page_size=1000)
+        
+            rows = execute_values(cur, sql, records, template=None, page_size=1000, fetch=True)
+            spans = {}
+            for user_id, metric_type, first_ts, last_ts in rows:
+                span = spans.get((user_id, metric_type), (first_ts, last_ts))
+                spans[(user_id, metric_type)] = (min(span[0], first_ts), max(span[1], last_ts))
+            refresh_user_stats(cur, [user_id for user_id, _ in spans])
+            notify_data_changed(cur, spans)
             conn.commit()
-            
+        
             cur.close()
-            conn.close()
-            
+
+# Job Queue - Postgres-backed background jobs (see worker.py)
+class JobQueue:
+    # A claimed job is leased to its worker for this long; the worker renews the lease while
+    # the job runs (see JobHeartbeat in worker.py), so only jobs whose worker crashed or was
+    # killed outlive it and are claimed again
+    LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "60"))
+
+    def __init__(self, db_config: DatabaseConfig):
+        self.db_config = db_config
+    
+    def enqueue(self, job_type: str, job_key: str, params: Dict[str, Any], requeue_started_before: datetime = None) -> tuple:
+        # Idempotent on job_key: an existing queued, running or finished job is returned as is,
+        # a failed one is queued again, and so is a succeeded one that started before
+        # requeue_started_before (its work has grown since). Returns (job, created).
+        with self.db_config.connection() as conn:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            cur.execute("""
+                INSERT INTO jobs (job_key, job_type, params)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (job_key) DO UPDATE SET
+                    status = 'queued', result = NULL, error = NULL,
+                    created_at = NOW(), started_at = NULL, lease_expires_at = NULL, finished_at = NULL
+                WHERE jobs.status = 'failed'
+                OR (jobs.status = 'succeeded' AND jobs.started_at < %s)
+                RETURNING *
+            """, (job_key, job_type, json.dumps(params), requeue_started_before))
+            job = cur.fetchone()
+            created = job is not None
+            if job is None:
+                cur.execute("SELECT * FROM jobs WHERE job_key = %s", (job_key,))
+                job = cur.fetchone()
+            conn.commit()
+            cur.close()
+        return self._serialize(job), created
+    
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        with self.db_config.connection() as conn:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            cur.execute("SELECT * FROM jobs WHERE job_id = %s", (job_id,))
+            job = cur.fetchone()
+            cur.close()
+        return self._serialize(job) if job else None
+    
+    def find(self, job_key: str) -> Optional[Dict[str, Any]]:
+        # Look up a job by its idempotency key without creating one
+        with self.db_config.connection() as conn:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            cur.execute("SELECT * FROM jobs WHERE job_key = %s", (job_key,))
+            job = cur.fetchone()
+            cur.close()
+        return self._serialize(job) if job else None
+    
+    def claim(self, job_types: List[str]) -> Optional[Dict[str, Any]]:
+        # Take the oldest runnable job; SKIP LOCKED lets many workers poll without blocking
+        with self.db_config.connection() as conn:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            cur.execute("""
+                UPDATE jobs SET status = 'running', started_at = NOW(), attempts = attempts + 1,
+                    lease_expires_at = NOW() + %s * INTERVAL '1 second'
+                WHERE job_id = (
+                    SELECT job_id FROM jobs
+                    WHERE job_type = ANY(%s)
+                    AND (status = 'queued' OR (status = 'running' AND lease_expires_at < NOW()))
+                    ORDER BY created_at
+                    FOR UPDATE SKIP LOCKED
+                    LIMIT 1
+                )
+                RETURNING *
+            """, (self.LEASE_SECONDS, job_types))
+            job = cur.fetchone()
+            conn.commit()
+            cur.close()
+        return self._serialize(job) if job else None
+    
+    def renew_lease(self, job_id: int, attempt: int) -> bool:
+        # Extend the lease of a job this worker is running. False if the job is no longer
+        # ours: its lease expired and another worker claimed it (a later attempt).
+        with self.db_config.connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                UPDATE jobs SET lease_expires_at = NOW() + %s * INTERVAL '1 second'
+                WHERE job_id = %s AND attempts = %s AND status = 'running'
+            """, (self.LEASE_SECONDS, job_id, attempt))
+            renewed = cur.rowcount == 1
+            conn.commit()
+            cur.close()
+        return renewed
+    
+    def finish(self, job_id: int, attempt: int, result: Dict[str, Any] = None, error: str = None) -> bool:
+        # Record the outcome of the given attempt; an attempt whose job was claimed again
+        # changes nothing, so the newer attempt's status stands. Returns whether it was recorded.
+        with self.db_config.connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                UPDATE jobs SET status = %s, result = %s, error = %s, finished_at = NOW(), lease_expires_at = NULL
+                WHERE job_id = %s AND attempts = %s AND status = 'running'
+            """, ("failed" if error else "succeeded", json.dumps(result) if result is not None else None, error, job_id, attempt))
+            recorded = cur.rowcount == 1
+            conn.commit()
+            cur.close()
+        return recorded
+    
+    def logs(self, job_id: int, after_id: int = 0, limit: int = 1000) -> List[Dict[str, Any]]:
+        # Log lines of a job in write order, after the last log_id the caller has seen
+        with self.db_config.connection() as conn:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            cur.execute("""
+                SELECT log_id, logged_at, message FROM job_logs
+                WHERE job_id = %s AND log_id > %s
+                ORDER BY log_id
+                LIMIT %s
+            """, (job_id, after_id, limit))
+            rows = cur.fetchall()
+            cur.close()
+        return [{**row, "logged_at": row["logged_at"].isoformat()} for row in rows]
+    
+    def _serialize(self, job: Dict) -> Dict[str, Any]:
+        job = dict(job)
+        for column in ("created_at", "started_at", "lease_expires_at", "finished_at"):
+            if job.get(column) is not None:
+                job[column] = job[column].isoformat()
+        return job
+
+# Job log writer - collects the log lines of one running job into job_logs. Lines are
+# buffered and written in batches; thread-safe, since ingestion logs from worker threads.
+class JobLogWriter:
+    FLUSH_LINES = 50
+    FLUSH_SECONDS = 0.5
+
+    def __init__(self, db_config: DatabaseConfig, job_id: int):
+        self.db_config = db_config
+        self.job_id = job_id
+        self.buffer = []
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def write(self, msg: str):
+        msg = msg.strip()
+        if not msg:
+            return
+        with self.lock:
+            self.buffer.append(msg)
+            due = len(self.buffer) >= self.FLUSH_LINES or time.monotonic() - self.last_flush >= self.FLUSH_SECONDS
+        if due:
+            self.flush()
+    
+    def flush(self):
+        # Held across the insert so batches land in the order they were written
+        with self.lock:
+            lines, self.buffer = self.buffer, []
+            self.last_flush = time.monotonic()
+            if not lines:
+                return
+            try:
+                with self.db_config.connection() as conn:
+                    cur = conn.cursor()
+                    execute_values(cur, "INSERT INTO job_logs (job_id, message) VALUES %s",
+                                   [(self.job_id, line) for line in lines])
+                    conn.commit()
+                    cur.close()
+            except Exception as e:
+                # Losing log lines must not fail the job itself
+                print(f"[JOB_LOG] ERROR writing {len(lines)} log lines of job {self.job_id}: {e}", flush=True)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+        return False
+
+# Whether a cached response over [entry_start, entry_end] may include data changed in
+# [start, end]; no span means the whole series changed. Aggregate responses hold whole buckets,
+# so both edges of the entry are widened by a bucket: the first bucket starts before
+# entry_start and the last one ends after entry_end.
+def cache_entry_affected(entry_start: datetime, entry_end: datetime, start: datetime, end: datetime) -> bool:
+    if start is None or end is None:
+        return True
+    return entry_start - DATA_CACHE_BUCKET_MARGIN <= end and entry_end > start - DATA_CACHE_BUCKET_MARGIN
+
+def as_utc(ts: datetime) -> datetime:
+    return ts.replace(tzinfo=timezone.utc) if ts.tzinfo is None else ts.astimezone(timezone.utc)
+
+# In-process LRU store for the /data cache
+class LocalDataCacheBackend:
+    # Writes are quick and local, so DataCache makes them under its invalidation lock
+    REMOTE = False
+
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry["expires_at"] <= time.monotonic():
+                del self.entries[key]
+                data_cache_evictions.labels(reason="expired").inc()
+                return None
+            self.entries.move_to_end(key)
+            return entry
+    
+    def set(self, key: str, entry: Dict[str, Any], ttl_seconds: float = None):
+        ttl_seconds = min(self.ttl_seconds, ttl_seconds) if ttl_seconds is not None else self.ttl_seconds
+        with self.lock:
+            self.entries[key] = {**entry, "expires_at": time.monotonic() + ttl_seconds}
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                data_cache_evictions.labels(reason="capacity").inc()
+    
+    def invalidate(self, user_id: str, metric_type: Optional[str], start: Optional[datetime], end: Optional[datetime]) -> int:
+        with self.lock:
+            stale = [
+                key for key, entry in self.entries.items()
+                if entry["user_id"] == user_id and metric_type in (None, entry["metric_type"])
+                and cache_entry_affected(entry["start"], entry["end"], start, end)
+            ]
+            for key in stale:
+                del self.entries[key]
+        return len(stale)
+    
+    def clear(self) -> int:
+        with self.lock:
+            count = len(self.entries)
+            self.entries.clear()
+        return count
+
+# Redis store for the /data cache, shared by all API processes; Redis expires entries itself
+# (and evicts under its own maxmemory policy). A hash per series indexes the cached spans.
+class RedisDataCacheBackend:
+    KEY_PREFIX = "data_cache:"
+    # Writes are network round trips, so DataCache makes them outside its lock and deletes
+    # an entry an invalidation raced with
+    REMOTE = True
+    
+    def __init__(self, url: str, ttl_seconds: int):
+        self.client = redis.Redis.from_url(url)
+        self.ttl_seconds = ttl_seconds
+    
+    def _index_key(self, user_id: str, metric_type: str) -> str:
+        return f"{self.KEY_PREFIX}index:{user_id}:{metric_type}"
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        cached = self.client.hgetall(self.KEY_PREFIX + key)
+        if not cached:
+            return None
+        return {"body": cached[b"body"], "media_type": cached[b"media_type"].decode()}
+    
+    def set(self, key: str, entry: Dict[str, Any], ttl_seconds: float = None):
+        ttl_seconds = min(self.ttl_seconds, ttl_seconds) if ttl_seconds is not None else self.ttl_seconds
+        index_key = self._index_key(entry["user_id"], entry["metric_type"])
+        pipe = self.client.pipeline()
+        pipe.hset(self.KEY_PREFIX + key, mapping={"body": entry["body"], "media_type": entry["media_type"]})
+        pipe.expire(self.KEY_PREFIX + key, max(1, int(ttl_seconds)))
+        pipe.hset(index_key, key, f"{entry['start'].timestamp()} {entry['end'].timestamp()}")
+        pipe.expire(index_key, self.ttl_seconds)
+        pipe.execute()
+    
+    def delete(self, key: str, user_id: str, metric_type: str):
+        pipe = self.client.pipeline()
+        pipe.delete(self.KEY_PREFIX + key)
+        pipe.hdel(self._index_key(user_id, metric_type), key)
+        pipe.execute()
+    
+    def invalidate(self, user_id: str, metric_type: Optional[str], start: Optional[datetime], end: Optional[datetime]) -> int:
+        stale = 0
+        for metric in ([metric_type] if metric_type else METRICS):
+            index_key = self._index_key(user_id, metric)
+            keys = []
+            for key, span in self.client.hgetall(index_key).items():
+                entry_start, entry_end = (datetime.fromtimestamp(float(ts), timezone.utc) for ts in span.split())
+                if cache_entry_affected(entry_start, entry_end, start, end):
+                    keys.append(key)
+            if keys:
+                self.client.delete(*[self.KEY_PREFIX + key.decode() for key in keys])
+                self.client.hdel(index_key, *keys)
+                stale += len(keys)
+        return stale
+    
+    def clear(self) -> int:
+        keys = list(self.client.scan_iter(match=self.KEY_PREFIX + "*"))
+        if keys:
+            self.client.delete(*keys)
+        return len(keys)
+
+# /data response cache. Entries are whole response bodies keyed on the normalized query, and
+# are dropped when a writer reports a change to an overlapping span of the same series.
+class DataCache:
+    def __init__(self, backend):
+        self.backend = backend
+        # Bumped by every invalidation; a response read before an invalidation is not stored
+        self.generation = 0
+        self.lock = threading.Lock()
+    
+    @staticmethod
+    def key(params: Dict[str, Any]) -> str:
+        return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            entry = self.backend.get(key)
+        except Exception as e:
+            # A cache outage degrades to uncached reads
+            print(f"[DATA_CACHE] ERROR reading cache: {e}", flush=True)
+            entry = None
+        data_cache_requests.labels(result="hit" if entry else "miss").inc()
+        return entry
+    
+    def set(self, key: str, generation: int, user_id: str, metric_type: str, start: datetime, end: datetime,
+            body: bytes, media_type: str, ttl_seconds: float = None):
+        # ttl_seconds shortens the default lifetime of this entry. An invalidation either bumps
+        # the generation before the write (the response is not stored) or drops the entry after it.
+        entry = {"user_id": user_id, "metric_type": metric_type, "start": as_utc(start),
+                 "end": as_utc(end), "body": body, "media_type": media_type}
+        try:
+            if not self.backend.REMOTE:
+                with self.lock:
+                    if generation == self.generation:
+                        self.backend.set(key, entry, ttl_seconds)
+                return
+            with self.lock:
+                if generation != self.generation:
+                    return
+            self.backend.set(key, entry, ttl_seconds)
+            with self.lock:
+                raced = generation != self.generation
+            if raced:
+                self.backend.delete(key, user_id, metric_type)
+        except Exception as e:
+            print(f"[DATA_CACHE] ERROR writing cache: {e}", flush=True)
+    
+    def invalidate(self, user_id: str, metric_type: str = None, start: datetime = None, end: datetime = None):
+        with self.lock:
+            self.generation += 1
+        dropped = self.backend.invalidate(user_id, metric_type, start and as_utc(start), end and as_utc(end))
+        data_cache_evictions.labels(reason="invalidated").inc(dropped)
+    
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+        data_cache_evictions.labels(reason="invalidated").inc(self.backend.clear())
+
+# Next scheduled policy refresh of each continuous aggregate. A policy refresh rewrites buckets
+# without any NOTIFY, so /data responses read from an aggregate are cached only until then.
+# Lookups are kept until the refresh they found is due.
+class AggregateRefreshSchedule:
+    # How soon to look again while the next refresh is unknown or already due (running)
+    RECHECK_SECONDS = 30
+    
+    def __init__(self, db_config: DatabaseConfig):
+        self.db_config = db_config
+        self.next_refresh = {}  # view -> (next refresh or None, when to look it up again)
+        self.lock = threading.Lock()
+    
+    def seconds_until_refresh(self, view: str) -> Optional[float]:
+        # None while the view's next refresh is unknown or due
+        now = datetime.now(timezone.utc)
+        with self.lock:
+            next_start, recheck_at = self.next_refresh.get(view, (None, now))
+        if now >= recheck_at:
+            next_start = self._lookup(view)
+            recheck_at = next_start if next_start and next_start > now else now + timedelta(seconds=self.RECHECK_SECONDS)
+            with self.lock:
+                self.next_refresh[view] = (next_start, recheck_at)
+        if next_start is None or next_start <= now:
+            return None
+        return (next_start - now).total_seconds()
+    
+    def _lookup(self, view: str) -> Optional[datetime]:
+        try:
+            with self.db_config.connection() as conn:
+                cur = conn.cursor()
+                cur.execute("""
+                    SELECT COALESCE(js.next_start, j.next_start)
+                    FROM timescaledb_information.continuous_aggregates ca
+                    JOIN timescaledb_information.jobs j
+                        ON j.hypertable_schema = ca.materialization_hypertable_schema
+                       AND j.hypertable_name = ca.materialization_hypertable_name
+                       AND j.proc_name = 'policy_refresh_continuous_aggregate'
+                    LEFT JOIN timescaledb_information.job_stats js ON js.job_id = j.job_id
+                    WHERE ca.view_name = %s
+                """, (view,))
+                row = cur.fetchone()
+                cur.close()
+            return row[0] if row else None
         except Exception as e:
-            if 'conn' in locals():
-                conn.rollback()
+            print(f"[DATA_CACHE] ERROR reading the refresh schedule of {view}: {e}", flush=True)
+            return None
+
+# Applies DATA_CHANGED_CHANNEL notifications to the /data cache from a background thread with
+# its own connection. Notifications sent while disconnected are lost, so the cache is cleared
+# whenever the connection is (re)established.
+class DataCacheListener:
+    RECONNECT_SECONDS = 5
+    POLL_SECONDS = 5
+    
+    def __init__(self, db_config: DatabaseConfig, cache: DataCache):
+        self.db_config = db_config
+        self.cache = cache
+        self.stop_event = threading.Event()
+        self.thread = None
+    
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="data-cache-listener", daemon=True)
+        self.thread.start()
+    
+    def stop(self):
+        self.stop_event.set()
+    
+    def _run(self):
+        while not self.stop_event.is_set():
+            conn = None
+            try:
+                conn = self.db_config.connect()
+                conn.autocommit = True
+                cur = conn.cursor()
+                cur.execute(f"LISTEN {DATA_CHANGED_CHANNEL}")
+                self.cache.clear()
+                while not self.stop_event.is_set():
+                    if select.select([conn], [], [], self.POLL_SECONDS)[0]:
+                        conn.poll()
+                        while conn.notifies:
+                            self._apply(conn.notifies.pop(0).payload)
+            except Exception as e:
+                print(f"[DATA_CACHE] ERROR listening for changes: {e}", flush=True)
+                self.stop_event.wait(self.RECONNECT_SECONDS)
+            finally:
+                if conn is not None:
+                    conn.close()
+    
+    def _apply(self, payload: str):
+        if not payload:
+            self.cache.clear()
+            return
+        change = json.loads(payload)
+        self.cache.invalidate(
+            change["user_id"],
+            change.get("metric_type"),
+            datetime.fromisoformat(change["start"]) if change.get("start") else None,
+            datetime.fromisoformat(change["end"]) if change.get("end") else None
+        )
 
 # Date validation according to business rules
 class DateValidator:
@@ -426,37 +1084,21 @@ class DateValidator:
 
 # Synthetic data generation with intentional gaps for testing
 class SyntheticDataGenerator:
-    def __init__(self, db_config: DatabaseConfig):
+    # Intentional gap model: each step starts a gap with GAP_PROBABILITY, otherwise emits one
+    # hourly point; gap lengths are drawn per tier as (cumulative probability, min hours, max hours)
+    GAP_PROBABILITY = 0.2
+    GAP_LENGTH_TIERS = [(0.6, 2, 3), (0.9, 4, 8), (1.0, 12, 24)]
+
+    def __init__(self, db_config: DatabaseConfig, gap_detector: GapDetectionService):
         self.db_config = db_config
+        self.gap_detector = gap_detector
     
     def generate_for_range(self, start_dt: datetime, end_dt: datetime, user_id: str = DEFAULT_USER_ID) -> Dict[str, Any]:
-        import random
-        
         records = []
-        
         for i, metric in enumerate(METRICS):
-            random.seed(SYNTHETIC_DATA_SEED + i)
-            current = start_dt.replace(minute=0, second=0, microsecond=0)
-            
-            while current <= end_dt:
-                # Create intentional gaps for testing imputation
-                if random.random() < 0.2:  # 20% chance to create a gap
-                    gap_type_roll = random.random()
-                    if gap_type_roll < 0.6:  # 60% short gaps (2-3 hours)
-                        gap_hours = random.randint(2, 3)
-                    elif gap_type_roll < 0.9:  # 30% medium gaps (4-8 hours)  
-                        gap_hours = random.randint(4, 8)
-                    else:  # 10% long gaps (12-24 hours)
-                        gap_hours = random.randint(12, 24)
-                    
-                    current += timedelta(hours=gap_hours)
-                    continue
-                
-                # Generate normal data point
-                ts = current.isoformat()
-                val = random.uniform(0, 100)
-                records.append((ts, user_id, metric, val))
-                current += timedelta(hours=1)
+            timestamps, values = self.generate_series(start_dt, end_dt, SYNTHETIC_DATA_SEED + i)
+            ts_strings = np.datetime_as_string(timestamps, unit='s', timezone='UTC')
+            records.extend(zip(ts_strings.tolist(), repeat(user_id), repeat(metric), values.tolist()))
         
         # Save to database
         saved_count = self._save_to_database(records)
@@ -468,11 +1110,32 @@ class SyntheticDataGenerator:
             "end_time": end_dt.isoformat()
         }
     
+    # Hourly timestamps (datetime64[s], UTC) and values of one series with intentional gaps.
+    # Vectorized renewal process: every step is a point (advance 1 hour) or a gap (advance
+    # its length); steps are drawn up front and the cumulative offsets give each point's hour.
+    def generate_series(self, start_dt: datetime, end_dt: datetime, seed: int):
+        first = start_dt.replace(minute=0, second=0, microsecond=0)
+        hours = max(0, int((end_dt - first) // timedelta(hours=1)) + 1)
+        rng = np.random.default_rng(seed)
+        # Every step advances at least one hour, so `hours` steps always cover the range
+        is_gap = rng.random(hours) < self.GAP_PROBABILITY
+        tier_roll = rng.random(hours)
+        gap_hours = np.select(
+            [tier_roll < cumulative for cumulative, _, _ in self.GAP_LENGTH_TIERS],
+            [rng.integers(low, high + 1, hours) for _, low, high in self.GAP_LENGTH_TIERS]
+        )
+        values = rng.uniform(0, 100, hours)
+
+        advance = np.where(is_gap, gap_hours, 1)
+        offsets = np.cumsum(advance) - advance
+        keep = ~is_gap & (offsets < hours)
+        base = np.datetime64(first.astimezone(timezone.utc).replace(tzinfo=None), 's')
+        return base + offsets[keep] * np.timedelta64(3600, 's'), values[keep]
+
     def _save_to_database(self, records: List[tuple]) -> int:
-        try:
-            conn = self.db_config.get_connection()
+        with self.db_config.connection() as conn:
             cur = conn.cursor()
-            
+        
             # Check if imputation columns exist
             cur.execute("""
                 SELECT column_name 
@@ -480,53 +1143,95 @@ class SyntheticDataGenerator:
                 WHERE table_name = 'raw_data' AND column_name = 'is_imputed'
             """)
             has_imputation_columns = cur.fetchone() is not None
+        
+            columns = "timestamp, user_id, metric_type, value"
+            use_copy = len(records) >= COPY_MIN_ROWS
+            if use_copy:
+                # Bulk path: COPY into a staging table, then one INSERT ... SELECT; the
+                # imputation columns take their defaults
+                cur.execute(
+                    "CREATE TEMP TABLE raw_data_staging "
+                    "(timestamp TIMESTAMPTZ, user_id TEXT, metric_type TEXT, value DOUBLE PRECISION) ON COMMIT DROP"
+                )
+                buf = io.StringIO()
+                csv.writer(buf).writerows(records)
+                buf.seek(0)
+                cur.copy_expert(f"COPY raw_data_staging ({columns}) FROM STDIN WITH (FORMAT csv)", buf)
+                source = f"SELECT {columns} FROM raw_data_staging"
+            else:
+                source = "VALUES %s"
+                if has_imputation_columns:
+                    columns += ", is_imputed, imputation_method, gap_duration_hours"
+                    # Convert tuples to include imputation defaults
+                    records = [record + (False, None, None) for record in records]
             
+            # Count inserted rows across all pages, not just the last one, and note the
+            # time span each series received so its stored gaps can be refreshed.
+            # Baselines and daily stats are merged from exactly the inserted rows.
+            baselines = ""
             if has_imputation_columns:
-                sql = """
-                    INSERT INTO raw_data (timestamp, user_id, metric_type, value, is_imputed, imputation_method, gap_duration_hours) 
-                    VALUES %s 
-                    ON CONFLICT (timestamp, user_id, metric_type) DO NOTHING;
-                """
-                
-                # Convert tuples to include imputation defaults
-                enhanced_records = []
-                for record in records:
-                    enhanced_records.append(record + (False, None, None))
-                
-                execute_values(cur, sql, enhanced_records, template=None, page_size=1000)
+                baselines = f", baselines AS ({baseline_upsert_sql('inserted')})"
+            sql = f"""
+                WITH inserted AS (
+                    INSERT INTO raw_data ({columns}) 
+                    {source} 
+                    ON CONFLICT (timestamp, user_id, metric_type) DO NOTHING
+                    RETURNING user_id, metric_type, timestamp, value, {"is_imputed" if has_imputation_columns else "FALSE AS is_imputed"}
+                ){baselines}, daily_stats AS ({user_daily_stats_upsert_sql('inserted')})
+                SELECT user_id, metric_type, COUNT(*), MIN(timestamp), MAX(timestamp)
+                FROM inserted GROUP BY user_id, metric_type;
+            """
+            
+            if use_copy:
+                cur.execute(sql)
+                pages = cur.fetchall()
             else:
-                sql = """
-                    INSERT INTO raw_data (timestamp, user_id, metric_type, value) 
-                    VALUES %s 
-                    ON CONFLICT (timestamp, user_id, metric_type) DO NOTHING;
-                """
-                
-                execute_values(cur, sql, records, template=None, page_size=1000)
+                pages = execute_values(cur, sql, records, template=None, page_size=1000, fetch=True)
+            saved_count = 0
+            inserted_spans = {}
+            for user_id, metric_type, count, first_ts, last_ts in pages:
+                saved_count += count
+                span = inserted_spans.get((user_id, metric_type), (first_ts, last_ts))
+                inserted_spans[(user_id, metric_type)] = (min(span[0], first_ts), max(span[1], last_ts))
             
+            if has_imputation_columns:
+                self.gap_detector.refresh_stored_gaps(cur, inserted_spans)
+            refresh_user_stats(cur, [user_id for user_id, _ in inserted_spans])
+            notify_data_changed(cur, inserted_spans)
             conn.commit()
-            saved_count = cur.rowcount
-            
+        
             cur.close()
-            conn.close()
-            
-            return saved_count
-            
-        except Exception as e:
-            raise
+        
+        return saved_count
 
 # Initialize core application components
 db_config = DatabaseConfig()
-data_generator = SyntheticDataGenerator(db_config)
 gap_detector = GapDetectionService(db_config)
+data_generator = SyntheticDataGenerator(db_config, gap_detector)
 imputation_service = ImputationService(db_config)
+job_queue = JobQueue(db_config)
+
+# /data response cache, kept current by a listener started with the server
+if DATA_CACHE_REDIS_URL and redis is None:
+    print("[DATA_CACHE] DATA_CACHE_REDIS_URL is set but the redis package is not installed; using the in-process cache", flush=True)
+if DATA_CACHE_REDIS_URL and redis is not None:
+    data_cache = DataCache(RedisDataCacheBackend(DATA_CACHE_REDIS_URL, DATA_CACHE_TTL_SECONDS))
+elif DATA_CACHE_MAX_ENTRIES > 0:
+    data_cache = DataCache(LocalDataCacheBackend(DATA_CACHE_MAX_ENTRIES, DATA_CACHE_TTL_SECONDS))
+else:
+    data_cache = None
+data_cache_listener = DataCacheListener(db_config, data_cache) if data_cache else None
+aggregate_refresh_schedule = AggregateRefreshSchedule(db_config)
 
 # Import ingestion module if available
 try:
     from ingestion.ingest import ingest_for_range, validate_date_constraints, LA_TIMEZONE
+    from ingestion.ingest import LOG_SINK as INGEST_LOG_SINK
     IMPORT_SUCCESS = True
 except ImportError as e:
     LA_TIMEZONE = pytz.timezone('America/Los_Angeles')
     IMPORT_SUCCESS = False
+    INGEST_LOG_SINK = None
     
     # Use fallback implementations
     validate_date_constraints = DateValidator.validate_date_constraints
@@ -566,7 +1271,36 @@ async def prometheus_middleware(request, call_next):
     
     return response
 
+# Endpoints doing blocking psycopg2 I/O are plain `def`, so FastAPI runs them in its thread
+# pool and the event loop keeps serving other requests. The pool gets one thread per
+# database connection: further requests wait on the event loop instead of in a thread
+# that times out after DB_POOL_TIMEOUT.
+@app.on_event("startup")
+async def size_request_threadpool():
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter.total_tokens = int(os.getenv("API_THREADPOOL_SIZE", str(db_config.pool_max)))
+
+# Each server process follows data changes for its own /data cache
+@app.on_event("startup")
+def start_data_cache_listener():
+    if data_cache_listener is not None:
+        data_cache_listener.start()
+
+# Release pooled connections when the server stops
+@app.on_event("shutdown")
+def close_database_pool():
+    if data_cache_listener is not None:
+        data_cache_listener.stop()
+    db_config.close()
+
 # Pydantic models
+class ImputationJobRequest(BaseModel):
+    user_id: str
+    metric: str
+    start_date: str
+    end_date: str
+    gap_source: str = "stored"
+
 class GenerateDataRequest(BaseModel):
     start_date: str
     end_date: str
@@ -576,12 +1310,11 @@ class GenerateDataRequest(BaseModel):
 @app.get("/healthz")
 def healthz():
     try:
-        conn = db_config.get_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT 1;")
-        cur.fetchone()
-        cur.close()
-        conn.close()
+        with db_config.connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT 1;")
+            cur.fetchone()
+            cur.close()
         return {
             "status": "ok", 
             "db": "ok",
@@ -595,12 +1328,11 @@ def healthz():
 @app.get("/metrics")
 def get_metrics():
     try:
-        conn = db_config.get_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT DISTINCT metric_type FROM raw_data ORDER BY metric_type")
-        db_metrics = [row[0] for row in cur.fetchall()]
-        cur.close()
-        conn.close()
+        with db_config.connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT DISTINCT metric_type FROM raw_data ORDER BY metric_type")
+            db_metrics = [row[0] for row in cur.fetchall()]
+            cur.close()
         
         return db_metrics if db_metrics else METRICS
     except Exception as e:
@@ -610,41 +1342,273 @@ def get_metrics():
 def get_users():
     # Get all users who have data in the system with statistics
     try:
-        conn = db_config.get_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        
-        cur.execute("""
-        SELECT 
-            user_id,
-            COUNT(*) as total_records,
-            MIN(timestamp) as first_record,
-            MAX(timestamp) as last_record,
-            COUNT(DISTINCT metric_type) as metrics_count,
-            COUNT(DISTINCT DATE(timestamp)) as days_with_data
-        FROM raw_data 
-        GROUP BY user_id 
-        ORDER BY user_id
-        """)
-        
-        users_data = []
-        for row in cur.fetchall():
-            users_data.append({
-                "user_id": row["user_id"],
-                "total_records": row["total_records"],
-                "first_record": row["first_record"].isoformat() if row["first_record"] else None,
-                "last_record": row["last_record"].isoformat() if row["last_record"] else None,
-                "metrics_count": row["metrics_count"],
-                "days_with_data": row["days_with_data"]
-            })
+        with db_config.connection() as conn:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
         
-        cur.close()
-        conn.close()
+            # user_stats is maintained by every writer of raw_data (see refresh_user_stats)
+            cur.execute("""
+            SELECT user_id, total_records, imputed_records, first_record, last_record,
+                   metrics_count, days_with_data
+            FROM user_stats
+            WHERE total_records > 0
+            ORDER BY user_id
+            """)
+        
+            users_data = []
+            for row in cur.fetchall():
+                users_data.append({
+                    "user_id": row["user_id"],
+                    "total_records": row["total_records"],
+                    "real_records": row["total_records"] - row["imputed_records"],
+                    "imputed_records": row["imputed_records"],
+                    "first_record": row["first_record"].isoformat() if row["first_record"] else None,
+                    "last_record": row["last_record"].isoformat() if row["last_record"] else None,
+                    "metrics_count": row["metrics_count"],
+                    "days_with_data": row["days_with_data"]
+                })
+        
+            cur.close()
         
         return {"users": users_data}
         
     except Exception as e:
         return {"users": [{"user_id": DEFAULT_USER_ID, "total_records": 0}]}
 
+# Pick the data source for a /data request
+def resolve_resolution(resolution: str, date_range_days: int, apply_imputation: bool, max_points: int = None) -> str:
+    if resolution != "auto":
+        return resolution
+    # Imputation works on individual hourly points, so it always reads raw data
+    if apply_imputation:
+        return "raw"
+    if max_points:
+        # Coarsest aggregate that still has at least max_points buckets, so the
+        # downsampler has enough detail without reading every raw point
+        for candidate, bucket_hours in (("1w", 24 * 7), ("1d", 24), ("1h", 1)):
+            if date_range_days * 24 / bucket_hours >= max_points:
+                return candidate
+        return "raw"
+    if date_range_days <= RAW_DATA_MAX_DAYS:
+        return "raw"
+    if date_range_days <= DAILY_AGGREGATE_MAX_DAYS:
+        return "1d"
+    return "1w"
+
+# Build the page and count queries for a resolution; all take (user_id, metric, start, end).
+# The page query is returned without ORDER BY/LIMIT so callers can add a keyset condition.
+def build_data_queries(resolution: str, has_imputation_columns: bool, include_imputed: bool):
+    real_only_filter = ""
+    if has_imputation_columns and not include_imputed:
+        real_only_filter = " AND COALESCE(is_imputed, FALSE) = FALSE"
+    
+    if resolution in AGGREGATE_VIEWS:
+        view, bucket_width = AGGREGATE_VIEWS[resolution]
+        if include_imputed:
+            value_columns = "avg_value as value, min_value, max_value, count_points, real_points = 0 as is_imputed"
+            bucket_filter = ""
+        else:
+            # Measurement-only statistics; buckets made up entirely of imputed points are skipped
+            value_columns = ("real_value_sum / real_points as value, real_min_value as min_value, "
+                             "real_max_value as max_value, real_points as count_points, FALSE as is_imputed")
+            bucket_filter = " AND real_points > 0"
+        # The bucket containing start_date is included so partial buckets are not dropped
+        where = f"""
+            WHERE user_id = %s AND metric_type = %s
+            AND bucket BETWEEN time_bucket(INTERVAL '{bucket_width}', %s::timestamptz) AND %s{bucket_filter}
+        """
+        query = f"""
+            SELECT bucket as timestamp, user_id, metric_type, {value_columns},
+                   NULL as imputation_method,
+                   NULL as gap_duration_hours
+            FROM {view}{where}"""
+        count_query = f"SELECT COUNT(*) as count FROM {view}{where}"
+        return query, count_query, f"aggregate_{resolution}", "bucket"
+    
+    if has_imputation_columns:
+        # Full query with imputation columns
+        query = """
+            SELECT timestamp, user_id, metric_type, value,
+                   COALESCE(is_imputed, FALSE) as is_imputed,
+                   imputation_method, gap_duration_hours
+            FROM raw_data 
+            WHERE user_id = %s AND metric_type = %s 
+            AND timestamp BETWEEN %s AND %s
+        """
+    else:
+        # Fallback query without imputation columns
+        query = """
+            SELECT timestamp, user_id, metric_type, value,
+                   FALSE as is_imputed,
+                   NULL as imputation_method, 
+                   NULL as gap_duration_hours
+            FROM raw_data 
+            WHERE user_id = %s AND metric_type = %s 
+            AND timestamp BETWEEN %s AND %s
+        """
+    count_query = """
+        SELECT COUNT(*) as count FROM raw_data 
+        WHERE user_id = %s AND metric_type = %s 
+        AND timestamp BETWEEN %s AND %s
+    """
+    # BEHAVIOR: Exclude imputed points to show only real measurements (creates visual gaps)
+    query += real_only_filter
+    count_query += real_only_filter
+    return query, count_query, "raw_hourly", "timestamp"
+
+# Idempotency key for imputing one series over one range; timestamps are normalized to UTC
+# Each generation request is its own job: generation is not idempotent (synthetic values
+# are re-drawn), so a repeated request must not return the earlier job
+def generate_job_key(user_id: str) -> str:
+    return f"generate_data:{user_id}:{uuid.uuid4()}"
+
+def imputation_job_key(user_id: str, metric: str, start_ts: datetime, end_ts: datetime) -> str:
+    start_utc = start_ts.astimezone(timezone.utc).isoformat()
+    end_utc = end_ts.astimezone(timezone.utc).isoformat()
+    return f"imputation:{user_id}:{metric}:{start_utc}:{end_utc}"
+
+# Opaque keyset cursor: the last timestamp returned plus the resolution it was read at
+def encode_data_cursor(last_timestamp: datetime, resolution: str) -> str:
+    payload = json.dumps({"after": last_timestamp.isoformat(), "resolution": resolution})
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+def decode_data_cursor(cursor: str, resolution: str) -> datetime:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        after = datetime.fromisoformat(payload["after"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if payload.get("resolution") != resolution:
+        raise HTTPException(status_code=400, detail="Cursor was issued for a different resolution")
+    return after
+
+# Pick the /data response format from the format parameter, then the Accept header
+def negotiate_data_format(format: Optional[str], accept: Optional[str]) -> str:
+    if format is None:
+        format = "json"
+        for media_type, name in ((DATA_FORMATS["arrow"], "arrow"), (DATA_FORMATS["columnar"], "columnar")):
+            if accept and media_type in accept:
+                format = name
+                break
+    if format not in DATA_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(DATA_FORMATS)}")
+    if format == "arrow" and not ARROW_AVAILABLE:
+        raise HTTPException(status_code=406, detail="Arrow responses require pyarrow on the server")
+    return format
+
+# Pack booleans into a base64 bitmap, least significant bit first (Arrow validity layout)
+def pack_bitmap(flags: List[bool]) -> str:
+    bitmap = bytearray((len(flags) + 7) // 8)
+    for i, flag in enumerate(flags):
+        if flag:
+            bitmap[i >> 3] |= 1 << (i & 7)
+    return base64.b64encode(bytes(bitmap)).decode()
+
+# Epoch milliseconds for a /data point (DB row datetime or formatted ISO string)
+def point_epoch_ms(point: Dict) -> int:
+    ts = point["timestamp"]
+    if isinstance(ts, str):
+        ts = datetime.fromisoformat(ts.replace('Z', '+00:00'))
+    return int(ts.timestamp() * 1000)
+
+# Largest-Triangle-Three-Buckets: keeps the first and last point and, from each bucket
+# in between, the point forming the largest triangle with the previous pick and the
+# average of the next bucket
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    n = len(x)
+    if n <= n_out:
+        return np.arange(n)
+    every = (n - 2) / (n_out - 2)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    a = 0
+    for i in range(n_out - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        areas = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(areas))
+        selected[i + 1] = a
+    selected[-1] = n - 1
+    return selected
+
+# Min/max per time bucket: n_out // 2 equal-width buckets, each contributing its lowest
+# and highest point in time order, so spikes survive downsampling
+def minmax_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    n = len(x)
+    if n <= n_out:
+        return np.arange(n)
+    n_buckets = max(1, n_out // 2)
+    span = x[-1] - x[0] + 1
+    bucket = ((x - x[0]) * n_buckets // span).astype(np.int64)
+    # Sort by bucket then value: the first row of each bucket is its min, the last its max
+    order = np.lexsort((y, bucket))
+    sorted_bucket = bucket[order]
+    firsts = np.flatnonzero(np.r_[True, sorted_bucket[1:] != sorted_bucket[:-1]])
+    lasts = np.r_[firsts[1:], n] - 1
+    return np.unique(np.concatenate([order[firsts], order[lasts]]))
+
+# Reduce time-ordered /data points to at most max_points
+def downsample_points(points: List[Dict], max_points: int, method: str) -> List[Dict]:
+    if len(points) <= max_points:
+        return points
+    x = np.array([point_epoch_ms(point) for point in points], dtype=np.float64)
+    y = np.array([float(point["value"]) for point in points], dtype=np.float64)
+    if method == "lttb":
+        keep = lttb_indices(x, y, max_points)
+    else:
+        keep = minmax_indices(x, y, max_points)
+    return [points[i] for i in keep]
+
+# Turn /data points (DB rows or formatted dicts) into parallel column arrays
+def build_data_columns(points: List[Dict], resolution: str) -> Dict[str, Any]:
+    timestamps = [point_epoch_ms(point) for point in points]
+
+    # Imputation methods are dictionary encoded; -1 marks points without a method
+    methods = [point.get("imputation_method") for point in points]
+    method_names = sorted({m for m in methods if m is not None})
+    method_codes = {name: code for code, name in enumerate(method_names)}
+
+    columns = {
+        "timestamp_ms": timestamps,
+        "value": [float(point["value"]) for point in points],
+        "is_imputed": [bool(point.get("is_imputed", False)) for point in points],
+        "imputation_method": {
+            "dictionary": method_names,
+            "codes": [method_codes[m] if m is not None else -1 for m in methods]
+        }
+    }
+    if resolution != "raw":
+        columns["min_value"] = [float(point["min_value"]) for point in points]
+        columns["max_value"] = [float(point["max_value"]) for point in points]
+        columns["count_points"] = [int(point["count_points"]) for point in points]
+    return columns
+
+# Serialize columns as an Arrow IPC stream; response metadata travels in the schema metadata
+def build_arrow_stream(columns: Dict[str, Any], metadata: Dict[str, Any]) -> bytes:
+    methods = columns["imputation_method"]
+    arrays = {
+        "timestamp": pa.array(columns["timestamp_ms"], type=pa.timestamp("ms", tz="UTC")),
+        "value": pa.array(columns["value"], type=pa.float64()),
+        "is_imputed": pa.array(columns["is_imputed"], type=pa.bool_()),
+        "imputation_method": pa.DictionaryArray.from_arrays(
+            pa.array([code if code >= 0 else None for code in methods["codes"]], type=pa.int32()),
+            pa.array(methods["dictionary"], type=pa.string())
+        ),
+    }
+    for name in ("min_value", "max_value"):
+        if name in columns:
+            arrays[name] = pa.array(columns[name], type=pa.float64())
+    if "count_points" in columns:
+        arrays["count_points"] = pa.array(columns["count_points"], type=pa.int64())
+
+    table = pa.table(arrays).replace_schema_metadata({"response": json.dumps(metadata)})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
 # Main data endpoint with gap detection and imputation
 @app.get("/data")
 def get_data(
@@ -656,15 +1620,36 @@ def get_data(
     per_page: int = DEFAULT_PAGE_SIZE,
     # NOTE: Parameter names are historical - actual behavior documented below
     include_imputed: bool = True,    # BEHAVIOR: When True, includes existing imputed data points in results
-    apply_imputation: bool = False   # BEHAVIOR: When True, detects gaps and generates new imputed points
+    apply_imputation: bool = False,  # BEHAVIOR: When True, reports gaps and the imputation job for them
+    resolution: str = "auto",        # BEHAVIOR: raw, 1h, 1d or 1w; auto picks by date range
+    cursor: str = None,              # BEHAVIOR: next_cursor from the previous page; replaces page
+    include_total: Optional[bool] = None,  # BEHAVIOR: Run COUNT(*); defaults to first/offset pages only
+    format: str = None,              # BEHAVIOR: json, columnar or arrow; falls back to the Accept header
+    max_points: int = None,          # BEHAVIOR: Downsample the whole range to at most this many points
+    downsample: str = "lttb",        # BEHAVIOR: lttb or minmax; only used with max_points
+    gap_source: str = "stored",      # BEHAVIOR: stored reads data_gaps, detect rescans raw_data
+    request: Request = None
 ):
     # Get health data with optional gap detection and imputation.
     # 
     # BEHAVIOR EXPLANATION:
     # - include_imputed=True: Show existing imputed data points (fills gaps with stored estimates)
     # - include_imputed=False: Show only real measurements (creates visual gaps in chart)
-    # - apply_imputation=True: Generate new imputed points for detected gaps (active imputation)
+    # - apply_imputation=True: Report gaps and the background imputation job of the range, if
+    #   one was queued with POST /imputation/jobs; the request never writes
     # - apply_imputation=False: No new imputation (passive display)
+    # - gaps cover the full date range. gap_source=stored reads the data_gaps index kept up
+    #   to date at ingestion time, gap_source=detect rescans raw_data
+    # - resolution=auto: raw points up to RAW_DATA_MAX_DAYS, daily aggregates up to
+    #   DAILY_AGGREGATE_MAX_DAYS, weekly aggregates beyond that
+    # - resolution=1h/1d/1w: avg/min/max/count per bucket from the continuous aggregates;
+    #   imputation only runs on raw data
+    # - cursor: keyset pagination on timestamp, constant cost per page; page/OFFSET is kept for
+    #   compatibility. total is only counted on request, or by default when no cursor is given.
+    # - format=columnar: parallel arrays (epoch ms timestamps, values, is_imputed bitmap);
+    #   format=arrow: the same columns as an Arrow IPC stream
+    # - max_points: return the whole range reduced to at most max_points (LTTB or per-bucket
+    #   min/max) instead of a page; resolution=auto picks the coarsest source with enough detail
     try:
         # Validate required parameters
         if not all([start_date, end_date, user_id, metric]):
@@ -683,84 +1668,111 @@ def get_data(
         if end_ts <= start_ts:
             raise HTTPException(status_code=400, detail="end_date must be after start_date")
 
+        response_format = negotiate_data_format(format, request.headers.get("accept") if request else None)
+        
+        if resolution != "auto" and resolution not in RESOLUTIONS:
+            raise HTTPException(status_code=400, detail=f"resolution must be one of auto, {', '.join(RESOLUTIONS)}")
+
+        if gap_source not in GAP_SOURCES:
+            raise HTTPException(status_code=400, detail=f"gap_source must be one of {', '.join(GAP_SOURCES)}")
+
+        if max_points is not None:
+            if max_points < MIN_DOWNSAMPLE_POINTS:
+                raise HTTPException(status_code=400, detail=f"max_points must be at least {MIN_DOWNSAMPLE_POINTS}")
+            if downsample not in DOWNSAMPLE_METHODS:
+                raise HTTPException(status_code=400, detail=f"downsample must be one of {', '.join(DOWNSAMPLE_METHODS)}")
+            if cursor:
+                raise HTTPException(status_code=400, detail="cursor cannot be combined with max_points")
+
         # Query database
         offset = (page - 1) * per_page
         date_range_days = (end_ts - start_ts).days
+        resolution = resolve_resolution(resolution, date_range_days, apply_imputation, max_points)
+        cursor_after = decode_data_cursor(cursor, resolution) if cursor else None
+        if include_total is None:
+            include_total = cursor is None
 
-        conn = db_config.get_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
+        # Served from the cache unless apply_imputation asks for the current gaps and job status
+        cache_key = None
+        if data_cache is not None and not apply_imputation:
+            cache_key = DataCache.key({
+                "user_id": user_id, "metric": metric, "start": as_utc(start_ts).isoformat(),
+                "end": as_utc(end_ts).isoformat(), "resolution": resolution, "page": page,
+                "per_page": per_page, "cursor": cursor, "include_total": include_total,
+                "include_imputed": include_imputed, "format": response_format, "max_points": max_points,
+                "downsample": downsample if max_points is not None else None
+            })
+            cache_generation = data_cache.generation
+            cached = data_cache.get(cache_key)
+            if cached is not None:
+                return Response(content=cached["body"], media_type=cached["media_type"])
+
+        with db_config.connection() as conn:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
         
-        # Check if imputation columns exist
-        cur.execute("""
-            SELECT column_name 
-            FROM information_schema.columns 
-            WHERE table_name = 'raw_data' AND column_name = 'is_imputed'
-        """)
-        has_imputation_columns = cur.fetchone() is not None
+            # Check if imputation columns exist
+            cur.execute("""
+                SELECT column_name 
+                FROM information_schema.columns 
+                WHERE table_name = 'raw_data' AND column_name = 'is_imputed'
+            """)
+            has_imputation_columns = cur.fetchone() is not None
         
-        if has_imputation_columns:
-            # Full query with imputation columns
-            query = """
-                SELECT timestamp, user_id, metric_type, value,
-                       COALESCE(is_imputed, FALSE) as is_imputed,
-                       imputation_method, gap_duration_hours
-                FROM raw_data 
-                WHERE user_id = %s AND metric_type = %s 
-                AND timestamp BETWEEN %s AND %s
-            """
-            count_query = """
-                SELECT COUNT(*) as count FROM raw_data 
-                WHERE user_id = %s AND metric_type = %s 
-                AND timestamp BETWEEN %s AND %s
-            """
-            
-            # BEHAVIOR: Exclude imputed points to show only real measurements (creates visual gaps)
-            if not include_imputed:
-                query += " AND COALESCE(is_imputed, FALSE) = FALSE"
-                count_query += " AND COALESCE(is_imputed, FALSE) = FALSE"
-        else:
-            # Fallback query without imputation columns
-            query = """
-                SELECT timestamp, user_id, metric_type, value,
-                       FALSE as is_imputed,
-                       NULL as imputation_method, 
-                       NULL as gap_duration_hours
-                FROM raw_data 
-                WHERE user_id = %s AND metric_type = %s 
-                AND timestamp BETWEEN %s AND %s
-            """
-            count_query = """
-                SELECT COUNT(*) as count FROM raw_data 
-                WHERE user_id = %s AND metric_type = %s 
-                AND timestamp BETWEEN %s AND %s
-            """
+            query, count_query, data_source, time_column = build_data_queries(resolution, has_imputation_columns, include_imputed)
+            params = [user_id, metric, start_ts, end_ts]
         
-        query += " ORDER BY timestamp LIMIT %s OFFSET %s"
+            # Downsampling reads the whole range; otherwise keyset pagination seeks past
+            # the cursor instead of scanning OFFSET rows
+            if max_points is not None:
+                query += f" ORDER BY {time_column}"
+            elif cursor_after is not None:
+                query += f" AND {time_column} > %s ORDER BY {time_column} LIMIT %s"
+                params += [cursor_after, per_page + 1]
+            else:
+                query += f" ORDER BY {time_column} LIMIT %s OFFSET %s"
+                params += [per_page + 1, offset]
         
-        # Execute main query
-        cur.execute(query, (user_id, metric, start_ts, end_ts, per_page, offset))
-        rows = cur.fetchall()
+            # Execute main query; the extra row tells whether another page exists
+            cur.execute(query, params)
+            rows = cur.fetchall()
+            if max_points is None:
+                has_more = len(rows) > per_page
+                rows = rows[:per_page]
+            else:
+                has_more = False
         
-        # Get total count
-        cur.execute(count_query, (user_id, metric, start_ts, end_ts))
-        total_count = cur.fetchone()['count']
+            # Get total count
+            total_count = None
+            if include_total and max_points is not None:
+                total_count = len(rows)
+            elif include_total:
+                cur.execute(count_query, (user_id, metric, start_ts, end_ts))
+                total_count = cur.fetchone()['count']
         
-        cur.close()
-        conn.close()
+            cur.close()
+        
+        next_cursor = encode_data_cursor(rows[-1]["timestamp"], resolution) if has_more else None
 
-        # Format results
-        data = []
-        for row in rows:
-            data_point = {
-                "timestamp": row["timestamp"].isoformat() if hasattr(row["timestamp"], 'isoformat') else str(row["timestamp"]),
-                "user_id": row["user_id"],
-                "metric_type": row["metric_type"],
-                "value": float(row["value"]),
-                "is_imputed": bool(row.get("is_imputed", False)),
-                "imputation_method": row.get("imputation_method"),
-                "gap_duration_hours": row.get("gap_duration_hours")
-            }
-            data.append(data_point)
+        # Format results; columnar responses read the rows directly
+        if response_format != "json":
+            data = rows
+        else:
+            data = []
+            for row in rows:
+                data_point = {
+                    "timestamp": row["timestamp"].isoformat() if hasattr(row["timestamp"], 'isoformat') else str(row["timestamp"]),
+                    "user_id": row["user_id"],
+                    "metric_type": row["metric_type"],
+                    "value": float(row["value"]),
+                    "is_imputed": bool(row.get("is_imputed", False)),
+                    "imputation_method": row.get("imputation_method"),
+                    "gap_duration_hours": row.get("gap_duration_hours")
+                }
+                if resolution != "raw":
+                    data_point["min_value"] = float(row["min_value"])
+                    data_point["max_value"] = float(row["max_value"])
+                    data_point["count_points"] = row["count_points"]
+                data.append(data_point)
         
         # Initialize summary
         gaps_detected = []
@@ -771,24 +1783,21 @@ def get_data(
             "imputation_percentage": 0
         }
         
-        # BEHAVIOR: Apply gap detection and generate new imputed points
-        if apply_imputation and len(data) > 1 and has_imputation_columns:
+        # BEHAVIOR: Report gaps over the full range and, while some are not filled yet, the
+        # imputation job queued for the range (POST /imputation/jobs); nothing is written here
+        imputation_job = None
+        imputation_applied = False
+        if apply_imputation and resolution == "raw" and has_imputation_columns:
             try:
-                # Only consider real data points for gap detection
-                real_data_points = [d for d in data if not d.get("is_imputed", False)]
-                gaps_detected = gap_detector.detect_gaps(real_data_points, user_id, metric)
-                
-                if gaps_detected:
-                    # Apply imputation to real data points only
-                    imputed_data = imputation_service.apply_imputation(real_data_points, gaps_detected, user_id, metric)
-                    
-                    # Use the imputed data (includes both real and newly created imputed points)
-                    data = imputed_data
-                    
-                    # Update summary
-                    data_summary["total_points"] = len(data)
-                    data_summary["imputed_points"] = len([d for d in data if d.get("is_imputed", False)])
-                    data_summary["real_points"] = data_summary["total_points"] - data_summary["imputed_points"]
+                if gap_source == "stored":
+                    gaps_detected = gap_detector.load_stored_gaps(user_id, [metric], start_ts, end_ts)
+                else:
+                    gaps_detected = gap_detector.detect_gaps_in_range(user_id, [metric], start_ts, end_ts)
+                fillable_gaps = [gap for gap in gaps_detected if gap["gap_type"] != "long"]
+                pending_gaps = [gap for gap in fillable_gaps if not gap["imputation_applied"]]
+                if pending_gaps:
+                    imputation_job = job_queue.find(imputation_job_key(user_id, metric, start_ts, end_ts))
+                imputation_applied = bool(fillable_gaps) and not pending_gaps
             except Exception as e:
                 # Continue without imputation
                 pass
@@ -798,13 +1807,24 @@ def get_data(
                 (data_summary["imputed_points"] / data_summary["total_points"]) * 100, 1
             )
         
-        return {
+        # Downsample last so the summary covers every point in range
+        downsampled_from = None
+        if max_points is not None:
+            downsampled_from = len(data)
+            data = downsample_points(data, max_points, downsample)
+        
+        response = {
             "data": data,
             "page": page,
             "per_page": per_page,
             "total": total_count,
             "returned": len(data),
-            "data_source": "raw_hourly",
+            "has_more": has_more,
+            "next_cursor": next_cursor,
+            "data_source": data_source,
+            "resolution": resolution,
+            "downsample": downsample if max_points is not None else None,
+            "downsampled_from": downsampled_from,
             "date_range_days": date_range_days,
             "has_imputation_support": has_imputation_columns,
             "gaps_detected": [
@@ -816,9 +1836,34 @@ def get_data(
                 } for gap in gaps_detected
             ],
             "data_summary": data_summary,
-            "imputation_applied": apply_imputation and has_imputation_columns and len(gaps_detected) > 0
+            "imputation_applied": imputation_applied,
+            "imputation_job": {"job_id": imputation_job["job_id"], "status": imputation_job["status"]} if imputation_job else None
         }
         
+        if response_format == "json":
+            result = JSONResponse(content=jsonable_encoder(response))
+        else:
+            # Columnar formats: parallel arrays instead of one object per point
+            points = response.pop("data")
+            columns = build_data_columns(points, resolution)
+            if response_format == "columnar":
+                response["length"] = len(points)
+                response["columns"] = {**columns, "is_imputed": pack_bitmap(columns["is_imputed"])}
+                result = JSONResponse(content=response, media_type=DATA_FORMATS["columnar"])
+            else:
+                result = Response(content=build_arrow_stream(columns, response), media_type=DATA_FORMATS["arrow"])
+        
+        if cache_key is not None:
+            # Aggregate responses expire at the view's next policy refresh, or are not kept at
+            # all while that refresh is due or unknown
+            ttl_seconds = None
+            if resolution in AGGREGATE_VIEWS:
+                ttl_seconds = aggregate_refresh_schedule.seconds_until_refresh(AGGREGATE_VIEWS[resolution][0])
+            if resolution == "raw" or ttl_seconds is not None:
+                data_cache.set(cache_key, cache_generation, user_id, metric, start_ts, end_ts,
+                               result.body, result.media_type, ttl_seconds)
+        return result
+        
     except HTTPException:
         raise
     except Exception as e:
@@ -826,93 +1871,403 @@ def get_data(
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
-# Generate synthetic test data
-@app.post("/generate-data")
-async def generate_data(request: GenerateDataRequest):
-    log_capture = LogCapture()
-    
+# Stream export rows from a server-side cursor so memory stays flat for any range
+def stream_export_rows(query: str, params: list, export_format: str):
+    with db_config.connection() as conn:
+        # A named cursor keeps the result set on the server; rows arrive EXPORT_BATCH_SIZE at a time
+        cur = conn.cursor(name=f"export_{uuid.uuid4().hex}")
+        cur.itersize = EXPORT_BATCH_SIZE
+        cur.execute(query, params)
+
+        if export_format == "csv":
+            yield ",".join(EXPORT_COLUMNS) + "\n"
+
+        exported = 0
+        while True:
+            rows = cur.fetchmany(EXPORT_BATCH_SIZE)
+            if not rows:
+                break
+
+            buffer = io.StringIO()
+            if export_format == "csv":
+                writer = csv.writer(buffer, lineterminator="\n")
+                for ts, row_user, row_metric, value, is_imputed, method in rows:
+                    writer.writerow([ts.isoformat(), row_user, row_metric, value, is_imputed, method or ""])
+            else:
+                for ts, row_user, row_metric, value, is_imputed, method in rows:
+                    buffer.write(json.dumps({
+                        "timestamp": ts.isoformat(),
+                        "user_id": row_user,
+                        "metric_type": row_metric,
+                        "value": value,
+                        "is_imputed": is_imputed,
+                        "imputation_method": method
+                    }))
+                    buffer.write("\n")
+
+            exported += len(rows)
+            yield buffer.getvalue()
+
+        cur.close()
+        data_points_processed.inc(exported)
+
+# Stream full history for several users and metrics as NDJSON or CSV
+@app.get("/data/export")
+def export_data(
+    user_id: List[str] = Query(...),   # Repeat the parameter or pass a comma-separated list
+    metric: List[str] = Query(None),   # Defaults to all METRICS
+    start_date: str = None,
+    end_date: str = None,
+    include_imputed: bool = True,
+    format: str = "ndjson"
+):
+    # Validation happens before streaming starts so errors still return proper status codes
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(EXPORT_FORMATS)}")
+
+    user_ids = [u.strip() for value in user_id for u in value.split(",") if u.strip()]
+    metrics = [m.strip() for value in (metric or METRICS) for m in value.split(",") if m.strip()]
+    if not user_ids:
+        raise HTTPException(status_code=400, detail="At least one user_id is required")
+    unknown = [m for m in metrics if m not in METRICS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown metric '{unknown[0]}'")
+
+    query = """
+        SELECT timestamp, user_id, metric_type, value,
+               COALESCE(is_imputed, FALSE) as is_imputed, imputation_method
+        FROM raw_data
+        WHERE user_id = ANY(%s) AND metric_type = ANY(%s)
+    """
+    params = [user_ids, metrics]
     try:
-        log_capture.write(f"Received request for user {request.user_id}")
-        log_capture.write(f"Import success: {IMPORT_SUCCESS}")
-        
-        # Parse dates
-        start_dt = datetime.fromisoformat(request.start_date.replace('Z', '+00:00'))
-        end_dt = datetime.fromisoformat(request.end_date.replace('Z', '+00:00'))
+        if start_date:
+            query += " AND timestamp >= %s"
+            params.append(datetime.fromisoformat(start_date.replace('Z', '+00:00')))
+        if end_date:
+            query += " AND timestamp <= %s"
+            params.append(datetime.fromisoformat(end_date.replace('Z', '+00:00')))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start_date and end_date must be ISO 8601 format")
+    if not include_imputed:
+        query += " AND COALESCE(is_imputed, FALSE) = FALSE"
+    query += " ORDER BY user_id, metric_type, timestamp"
+
+    return StreamingResponse(
+        stream_export_rows(query, params, format),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="export.{format}"'}
+    )
+
+# Gaps precomputed at ingestion time, served from the data_gaps index
+@app.get("/gaps")
+def get_gaps(
+    user_id: str,
+    metric: str = None,        # Defaults to all METRICS
+    start_date: str = None,
+    end_date: str = None,
+    gap_type: str = None,      # short, medium or long
+    limit: int = DEFAULT_PAGE_SIZE
+):
+    if metric is not None and metric not in METRICS:
+        raise HTTPException(status_code=400, detail=f"Unknown metric '{metric}'")
+    if gap_type is not None and gap_type not in GAP_TYPES:
+        raise HTTPException(status_code=400, detail=f"gap_type must be one of {', '.join(GAP_TYPES)}")
+
+    query = """
+        SELECT metric_type, gap_start, gap_end, gap_duration_hours, gap_type, imputation_applied, detected_at
+        FROM data_gaps
+        WHERE user_id = %s AND metric_type = ANY(%s)
+    """
+    params = [user_id, [metric] if metric else METRICS]
+    try:
+        if start_date:
+            query += " AND gap_end >= %s"
+            params.append(datetime.fromisoformat(start_date.replace('Z', '+00:00')))
+        if end_date:
+            query += " AND gap_start <= %s"
+            params.append(datetime.fromisoformat(end_date.replace('Z', '+00:00')))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start_date and end_date must be ISO 8601 format")
+    if gap_type:
+        query += " AND gap_type = %s"
+        params.append(gap_type)
+    query += " ORDER BY metric_type, gap_start LIMIT %s"
+    params.append(limit)
+
+    try:
+        with db_config.connection() as conn:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            cur.execute(query, params)
+            rows = cur.fetchall()
+            cur.close()
         
-        # Convert to timezone-aware if needed
-        if start_dt.tzinfo is None:
-            start_dt = start_dt.replace(tzinfo=timezone.utc)
-        if end_dt.tzinfo is None:
-            end_dt = end_dt.replace(tzinfo=timezone.utc)
+        gaps = [
+            {
+                "metric_type": row["metric_type"],
+                "gap_start": row["gap_start"].isoformat(),
+                "gap_end": row["gap_end"].isoformat(),
+                "gap_duration_hours": row["gap_duration_hours"],
+                "gap_type": row["gap_type"],
+                "imputation_applied": row["imputation_applied"],
+                "detected_at": row["detected_at"].isoformat() if row["detected_at"] else None
+            } for row in rows
+        ]
+        return {"user_id": user_id, "gaps": gaps, "returned": len(gaps)}
         
-        start_dt = start_dt.astimezone(LA_TIMEZONE)
-        end_dt = end_dt.astimezone(LA_TIMEZONE)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Queue background imputation for one series over a date range; run by worker.py
+@app.post("/imputation/jobs")
+def create_imputation_job(request: ImputationJobRequest):
+    if request.metric not in METRICS:
+        raise HTTPException(status_code=400, detail=f"Unknown metric '{request.metric}'")
+    if request.gap_source not in GAP_SOURCES:
+        raise HTTPException(status_code=400, detail=f"gap_source must be one of {', '.join(GAP_SOURCES)}")
+    try:
+        start_ts = datetime.fromisoformat(request.start_date.replace('Z', '+00:00'))
+        end_ts = datetime.fromisoformat(request.end_date.replace('Z', '+00:00'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start_date and end_date must be ISO 8601 format")
+    if start_ts.tzinfo is None or end_ts.tzinfo is None:
+        raise HTTPException(status_code=400, detail="start_date and end_date must include a timezone")
+    if end_ts <= start_ts:
+        raise HTTPException(status_code=400, detail="end_date must be after start_date")
+
+    try:
+        # A finished job for the same range runs again when gaps appeared after it started,
+        # e.g. from later ingestion
+        pending_since = gap_detector.pending_gaps_since(request.user_id, request.metric, start_ts, end_ts, request.gap_source)
+        job, created = job_queue.enqueue(
+            "imputation",
+            imputation_job_key(request.user_id, request.metric, start_ts, end_ts),
+            {"user_id": request.user_id, "metric": request.metric, "start_date": start_ts.isoformat(),
+             "end_date": end_ts.isoformat(), "gap_source": request.gap_source},
+            requeue_started_before=pending_since
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    # 202 for a newly queued job, 200 when an existing job for the same key is returned
+    return JSONResponse(content={**job, "created": created}, status_code=202 if created else 200)
+
+# Poll a background job
+@app.get("/imputation/jobs/{job_id}")
+def get_imputation_job(job_id: int):
+    try:
+        job = job_queue.get(job_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+# Weekday/hour-of-day baseline profile of one series, maintained at ingestion time
+@app.get("/baselines")
+def get_baselines(user_id: str, metric: str):
+    if metric not in METRICS:
+        raise HTTPException(status_code=400, detail=f"Unknown metric '{metric}'")
+    try:
+        with db_config.connection() as conn:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            cur.execute("""
+                SELECT day_of_week, hour_of_day, sample_count, mean_value, variance, updated_at
+                FROM user_baselines
+                WHERE user_id = %s AND metric_type = %s
+                ORDER BY day_of_week, hour_of_day
+            """, (user_id, metric))
+            rows = cur.fetchall()
+            cur.close()
         
-        # Validate constraints
-        error_msg = validate_date_constraints(start_dt, end_dt)
-        if error_msg:
-            raise HTTPException(status_code=400, detail=error_msg)
+        profile = [
+            {
+                "day_of_week": row["day_of_week"],
+                "hour_of_day": row["hour_of_day"],
+                "sample_count": row["sample_count"],
+                "mean": row["mean_value"],
+                "variance": row["variance"],
+                "updated_at": row["updated_at"].isoformat() if row["updated_at"] else None
+            } for row in rows
+        ]
+        return {"user_id": user_id, "metric": metric, "timezone": BASELINE_TIMEZONE, "profile": profile}
         
-        # Generate data
-        old_stdout = sys.stdout
-        sys.stdout = log_capture
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Refresh state of the continuous aggregates behind /data?resolution=1h|1d|1w
+@app.get("/aggregates/status")
+def get_aggregates_status():
+    try:
+        with db_config.connection() as conn:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            cur.execute("""
+            SELECT
+                ca.view_name,
+                ca.materialized_only,
+                j.schedule_interval,
+                js.last_run_status,
+                js.last_successful_finish,
+                js.next_start,
+                EXTRACT(EPOCH FROM NOW() - js.last_successful_finish) as staleness_seconds
+            FROM timescaledb_information.continuous_aggregates ca
+            LEFT JOIN timescaledb_information.jobs j
+                ON j.hypertable_schema = ca.materialization_hypertable_schema
+               AND j.hypertable_name = ca.materialization_hypertable_name
+               AND j.proc_name = 'policy_refresh_continuous_aggregate'
+            LEFT JOIN timescaledb_information.job_stats js ON js.job_id = j.job_id
+            WHERE ca.view_name = ANY(%s)
+            ORDER BY ca.view_name
+            """, ([view for view, _ in AGGREGATE_VIEWS.values()],))
+            rows = cur.fetchall()
+            cur.close()
         
-        try:
-            result = ingest_for_range(start_dt, end_dt, request.user_id)
-            data_points_processed.inc(result["total_points"])
-        finally:
-            sys.stdout = old_stdout
+        views = {}
+        for row in rows:
+            views[row["view_name"]] = {
+                "real_time": not row["materialized_only"],
+                "schedule_interval_seconds": row["schedule_interval"].total_seconds() if row["schedule_interval"] else None,
+                "last_run_status": row["last_run_status"],
+                "last_refreshed": row["last_successful_finish"].isoformat() if row["last_successful_finish"] else None,
+                "next_refresh": row["next_start"].isoformat() if row["next_start"] else None,
+                # None until the first refresh has completed
+                "staleness_seconds": float(row["staleness_seconds"]) if row["staleness_seconds"] is not None else None
+            }
         
-        return {
-            "message": "Data generated successfully",
-            "total_points": result["total_points"],
-            "saved_points": result["saved_points"],
-            "start_date": result["start_time"],
-            "end_date": result["end_time"],
-            "import_success": IMPORT_SUCCESS,
-            "logs": log_capture.get_logs()
-        }
+        return {"aggregates": views}
         
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Queue synthetic/Fitbit data generation for a user and range; run by worker.py. Returns at
+# once with the job; poll GET /generate-data/jobs/{job_id} or stream its logs.
+@app.post("/generate-data")
+def generate_data(request: GenerateDataRequest):
+    try:
+        start_dt = datetime.fromisoformat(request.start_date.replace('Z', '+00:00'))
+        end_dt = datetime.fromisoformat(request.end_date.replace('Z', '+00:00'))
     except ValueError as e:
-        raise HTTPException(status_code=400, detail={"error": str(e), "logs": log_capture.get_logs()})
+        raise HTTPException(status_code=400, detail={"error": str(e), "logs": []})
+    
+    # Convert to timezone-aware if needed
+    if start_dt.tzinfo is None:
+        start_dt = start_dt.replace(tzinfo=timezone.utc)
+    if end_dt.tzinfo is None:
+        end_dt = end_dt.replace(tzinfo=timezone.utc)
+    
+    start_dt = start_dt.astimezone(LA_TIMEZONE)
+    end_dt = end_dt.astimezone(LA_TIMEZONE)
+    
+    # Validate constraints before queueing, so bad ranges still fail synchronously
+    error_msg = validate_date_constraints(start_dt, end_dt)
+    if error_msg:
+        raise HTTPException(status_code=400, detail=error_msg)
+    
+    try:
+        job, created = job_queue.enqueue(
+            "generate_data",
+            generate_job_key(request.user_id),
+            {"user_id": request.user_id, "start_date": start_dt.isoformat(), "end_date": end_dt.isoformat()}
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return JSONResponse(content={
+        **job,
+        "created": created,
+        "status_url": f"/generate-data/jobs/{job['job_id']}",
+        "logs_url": f"/generate-data/jobs/{job['job_id']}/logs"
+    }, status_code=202)
+
+def get_generate_job(job_id: int) -> Dict[str, Any]:
+    try:
+        job = job_queue.get(job_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if job is None or job["job_type"] != "generate_data":
+        raise HTTPException(status_code=404, detail=f"Generation job {job_id} not found")
+    return job
+
+# Poll a generation job; result carries total_points/saved_points once it has succeeded
+@app.get("/generate-data/jobs/{job_id}")
+def get_generate_data_job(job_id: int):
+    job = get_generate_job(job_id)
+    try:
+        logs = job_queue.logs(job_id, limit=JOB_LOG_PAGE_SIZE)
     except Exception as e:
-        raise HTTPException(status_code=500, detail={
-            "error": f"Error generating data: {e}",
-            "logs": log_capture.get_logs()
-        })
+        raise HTTPException(status_code=500, detail=str(e))
+    return {**job, "logs": [line["message"] for line in logs]}
+
+# Stream a generation job's log lines as server-sent events. Each line is an event whose id
+# is its log_id (reconnecting clients resume from Last-Event-ID); a final `done` event
+# carries the finished job.
+@app.get("/generate-data/jobs/{job_id}/logs")
+async def stream_generate_data_logs(job_id: int, request: Request, after: int = 0):
+    await run_in_threadpool(get_generate_job, job_id)
+    last_id = int(request.headers.get("last-event-id") or after)
+    
+    async def events():
+        nonlocal last_id
+        idle_seconds = 0.0
+        while True:
+            lines = await run_in_threadpool(job_queue.logs, job_id, last_id, JOB_LOG_PAGE_SIZE)
+            if not lines:
+                job = await run_in_threadpool(job_queue.get, job_id)
+                finished = job["status"] in ("succeeded", "failed")
+                # Lines flushed between the two reads are picked up before `done`
+                if finished:
+                    lines = await run_in_threadpool(job_queue.logs, job_id, last_id, JOB_LOG_PAGE_SIZE)
+            for line in lines:
+                last_id = line["log_id"]
+                data = "\n".join(f"data: {part}" for part in line["message"].split("\n"))
+                yield f"id: {last_id}\n{data}\n\n"
+            if lines:
+                idle_seconds = 0.0
+                continue
+            if finished:
+                yield f"event: done\ndata: {json.dumps(job)}\n\n"
+                return
+            if await request.is_disconnected():
+                return
+            await asyncio.sleep(JOB_LOG_POLL_SECONDS)
+            idle_seconds += JOB_LOG_POLL_SECONDS
+            if idle_seconds >= JOB_LOG_KEEPALIVE_SECONDS:
+                # Comment line: keeps proxies from closing an idle stream
+                yield ": keepalive\n\n"
+                idle_seconds = 0.0
+    
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 # Enroll user endpoint
 @app.post("/enroll-user")
-async def enroll_user(enrollment: UserEnrollment):
+def enroll_user(enrollment: UserEnrollment):
     # Enroll a new user with their enrollment date
     try:
-        conn = db_config.get_connection()
-        cur = conn.cursor()
+        with db_config.connection() as conn:
+            cur = conn.cursor()
         
-        # Check if user already exists
-        cur.execute("SELECT user_id FROM users WHERE user_id = %s", (enrollment.user_id,))
-        if cur.fetchone():
-            raise HTTPException(status_code=400, detail=f"User {enrollment.user_id} is already enrolled")
+            # Check if user already exists
+            cur.execute("SELECT user_id FROM users WHERE user_id = %s", (enrollment.user_id,))
+            if cur.fetchone():
+                raise HTTPException(status_code=400, detail=f"User {enrollment.user_id} is already enrolled")
         
-        # Handle datetime properly - store as UTC in database
-        enrollment_dt = enrollment.enrollment_date
+            # Handle datetime properly - store as UTC in database
+            enrollment_dt = enrollment.enrollment_date
         
-        # If timezone-naive, treat as UTC
-        if enrollment_dt.tzinfo is None:
-            enrollment_dt = enrollment_dt.replace(tzinfo=timezone.utc)
+            # If timezone-naive, treat as UTC
+            if enrollment_dt.tzinfo is None:
+                enrollment_dt = enrollment_dt.replace(tzinfo=timezone.utc)
         
-        # Convert to UTC for storage
-        enrollment_dt_utc = enrollment_dt.astimezone(timezone.utc)
+            # Convert to UTC for storage
+            enrollment_dt_utc = enrollment_dt.astimezone(timezone.utc)
         
-        # Insert new user with UTC timestamp
-        cur.execute(
-            "INSERT INTO users (user_id, enrollment_date, created_at) VALUES (%s, %s, %s)",
-            (enrollment.user_id, enrollment_dt_utc, datetime.now(timezone.utc))
-        )
+            # Insert new user with UTC timestamp
+            cur.execute(
+                "INSERT INTO users (user_id, enrollment_date, created_at) VALUES (%s, %s, %s)",
+                (enrollment.user_id, enrollment_dt_utc, datetime.now(timezone.utc))
+            )
         
-        conn.commit()
-        cur.close()
-        conn.close()
+            conn.commit()
+            cur.close()
         
         return {
             "message": f"User {enrollment.user_id} enrolled successfully",
@@ -927,42 +2282,42 @@ async def enroll_user(enrollment: UserEnrollment):
 
 # Get enrolled users
 @app.get("/enrolled-users")
-async def get_enrolled_users():
+def get_enrolled_users():
     # Get list of all enrolled users with their stats
     try:
-        conn = db_config.get_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        
-        cur.execute("""
-        SELECT 
-            u.user_id,
-            u.enrollment_date,
-            COALESCE(COUNT(r.timestamp), 0) as total_records,
-            COALESCE(COUNT(DISTINCT r.metric_type), 0) as metrics_count,
-            COALESCE(COUNT(DISTINCT DATE(r.timestamp)), 0) as days_with_data
-        FROM users u
-        LEFT JOIN raw_data r ON u.user_id = r.user_id
-        GROUP BY u.user_id, u.enrollment_date
-        ORDER BY u.enrollment_date DESC
-        """)
-        
-        enrolled_users = []
-        for row in cur.fetchall():
-            # Ensure enrollment_date is timezone-aware and return as ISO string
-            enrollment_date = row["enrollment_date"]
-            if enrollment_date.tzinfo is None:
-                enrollment_date = enrollment_date.replace(tzinfo=timezone.utc)
+        with db_config.connection() as conn:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+        
+            cur.execute("""
+            SELECT 
+                u.user_id,
+                u.enrollment_date,
+                COALESCE(s.total_records, 0) as total_records,
+                COALESCE(s.imputed_records, 0) as imputed_records,
+                COALESCE(s.metrics_count, 0) as metrics_count,
+                COALESCE(s.days_with_data, 0) as days_with_data
+            FROM users u
+            LEFT JOIN user_stats s ON u.user_id = s.user_id
+            ORDER BY u.enrollment_date DESC
+            """)
+        
+            enrolled_users = []
+            for row in cur.fetchall():
+                # Ensure enrollment_date is timezone-aware and return as ISO string
+                enrollment_date = row["enrollment_date"]
+                if enrollment_date.tzinfo is None:
+                    enrollment_date = enrollment_date.replace(tzinfo=timezone.utc)
             
-            enrolled_users.append({
-                "user_id": row["user_id"],
-                "enrollment_date": enrollment_date.isoformat(),
-                "total_records": row["total_records"],
-                "metrics_count": row["metrics_count"],
-                "days_with_data": row["days_with_data"]
-            })
+                enrolled_users.append({
+                    "user_id": row["user_id"],
+                    "enrollment_date": enrollment_date.isoformat(),
+                    "total_records": row["total_records"],
+                    "imputed_records": row["imputed_records"],
+                    "metrics_count": row["metrics_count"],
+                    "days_with_data": row["days_with_data"]
+                })
         
-        cur.close()
-        conn.close()
+            cur.close()
         
         return {"users": enrolled_users}
         
@@ -970,27 +2325,35 @@ async def get_enrolled_users():
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/users/{user_id}")
-async def delete_user(user_id: str):
+def delete_user(user_id: str):
     # Delete a user and all their data
     try:
-        conn = db_config.get_connection()
-        cur = conn.cursor()
+        with db_config.connection() as conn:
+            cur = conn.cursor()
         
-        # Check if user exists
-        cur.execute("SELECT user_id FROM users WHERE user_id = %s", (user_id,))
-        if not cur.fetchone():
-            raise HTTPException(status_code=404, detail=f"User {user_id} not found")
+            # Check if user exists
+            cur.execute("SELECT user_id FROM users WHERE user_id = %s", (user_id,))
+            if not cur.fetchone():
+                raise HTTPException(status_code=404, detail=f"User {user_id} not found")
         
-        # Delete user's data first
-        cur.execute("DELETE FROM raw_data WHERE user_id = %s", (user_id,))
-        deleted_records = cur.rowcount
+            # Delete user's data first
+            cur.execute("DELETE FROM raw_data WHERE user_id = %s", (user_id,))
+            deleted_records = cur.rowcount
+            cur.execute("DELETE FROM data_gaps WHERE user_id = %s", (user_id,))
+            cur.execute("DELETE FROM user_baselines WHERE user_id = %s", (user_id,))
+            cur.execute("DELETE FROM user_daily_stats WHERE user_id = %s", (user_id,))
+            cur.execute("DELETE FROM user_stats WHERE user_id = %s", (user_id,))
+            # A re-enrolled user's backfill must start from the new enrollment date and refetch
+            # every chunk
+            cur.execute("DELETE FROM ingestion_watermarks WHERE user_id = %s", (user_id,))
+            cur.execute("DELETE FROM fetch_checkpoints WHERE user_id = %s", (user_id,))
         
-        # Delete user
-        cur.execute("DELETE FROM users WHERE user_id = %s", (user_id,))
+            # Delete user
+            cur.execute("DELETE FROM users WHERE user_id = %s", (user_id,))
+            notify_data_changed(cur, {(user_id, None): (None, None)})
         
-        conn.commit()
-        cur.close()
-        conn.close()
+            conn.commit()
+            cur.close()
         
         return {
             "message": f"User {user_id} deleted successfully",
@@ -1004,11 +2367,37 @@ async def delete_user(user_id: str):
 
 # Prometheus metrics endpoint
 @app.get("/prom-metrics")
-def metrics():
+async def metrics():
     """Expose Prometheus metrics"""
-    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+    return Response(generate_latest(prometheus_registry()), media_type=CONTENT_TYPE_LATEST)
+
+# Registry to export: this process's own metrics, or in multi-process mode a fresh registry
+# that merges the samples every server process wrote to PROMETHEUS_MULTIPROC_DIR
+def prometheus_registry() -> CollectorRegistry:
+    if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
 
 # Run development server
 if __name__ == "__main__":
+    import argparse
+    import tempfile
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=5000)
\ No newline at end of file
+    
+    parser = argparse.ArgumentParser(description="Run the API server")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "1")),
+                        help="server processes (default: WEB_CONCURRENCY or 1); production uses gunicorn.conf.py")
+    parser.add_argument("--port", type=int, default=5000)
+    args = parser.parse_args()
+    
+    if args.workers > 1:
+        # Hand over to the uvicorn CLI: its spawned workers would otherwise re-run this file
+        # as __mp_main__ and register every metric twice. They inherit the metrics directory.
+        os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", tempfile.mkdtemp(prefix="prometheus_"))
+        os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+        os.execvp(sys.executable, [sys.executable, "-m", "uvicorn", "app:app", "--host", "0.0.0.0",
+                                   "--port", str(args.port), "--workers", str(args.workers)])
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=args.port)
\ No newline at end of file
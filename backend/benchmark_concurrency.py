@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# Latency of the API under many concurrent dashboard clients. Each client repeatedly loads
+# what the dashboard requests on a refresh (/enrolled-users, /users and a week of /data)
+# and the run reports p50/p99 per endpoint. Meanwhile a probe polls /prom-metrics, which
+# does no database work, so its latency shows how responsive the event loop stays while the
+# database is busy. Run it against a build before and after a
+# change to compare, e.g.:
+#   uvicorn app:app --port 5001 &
+#   python benchmark_concurrency.py --url http://localhost:5001 --clients 200 --rounds 5
+import sys
+import time
+import argparse
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+DEFAULT_URL = "http://localhost:5001"
+DEFAULT_CLIENTS = 200
+DEFAULT_ROUNDS = 5
+REQUEST_TIMEOUT_SECONDS = 60
+PROBE_PATH = "/prom-metrics"
+PROBE_INTERVAL_SECONDS = 0.1
+
+def dashboard_paths(user_id: str, metric: str) -> list:
+    end = datetime.now(timezone.utc)
+    data_query = urllib.parse.urlencode({
+        "user_id": user_id, "metric": metric,
+        "start_date": (end - timedelta(days=7)).isoformat(), "end_date": end.isoformat()
+    })
+    return [
+        ("/enrolled-users", "/enrolled-users"),
+        ("/users", "/users"),
+        ("/data", f"/data?{data_query}"),
+    ]
+
+def timed_get(url: str) -> tuple:
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=REQUEST_TIMEOUT_SECONDS) as response:
+            response.read()
+            ok = response.status == 200
+    except (urllib.error.URLError, OSError):
+        ok = False
+    return time.perf_counter() - started, ok
+
+# One dashboard client: `rounds` refreshes, each requesting every dashboard path in turn.
+# All clients start together so the server sees `clients` requests in flight.
+def run_client(base_url: str, paths: list, rounds: int, start_barrier: threading.Barrier) -> list:
+    start_barrier.wait()
+    samples = []
+    for _ in range(rounds):
+        for name, path in paths:
+            elapsed, ok = timed_get(base_url + path)
+            samples.append((name, elapsed, ok))
+    return samples
+
+# Poll PROBE_PATH until the clients are done
+def run_probe(base_url: str, stop: threading.Event) -> list:
+    samples = []
+    while not stop.is_set():
+        elapsed, ok = timed_get(base_url + PROBE_PATH)
+        samples.append((f"{PROBE_PATH} probe", elapsed, ok))
+        stop.wait(PROBE_INTERVAL_SECONDS)
+    return samples
+
+def summarize(samples: list, wall_seconds: float):
+    print(f"\n{'endpoint':<22}{'requests':>10}{'errors':>8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    names = sorted({name for name, _, _ in samples}) + ["all"]
+    for name in names:
+        rows = [(elapsed, ok) for n, elapsed, ok in samples if n == name or (name == "all" and not n.endswith("probe"))]
+        latencies = np.array([elapsed for elapsed, _ in rows]) * 1000
+        errors = sum(1 for _, ok in rows if not ok)
+        p50, p99 = np.percentile(latencies, [50, 99])
+        print(f"{name:<22}{len(rows):>10}{errors:>8}{p50:>10.1f}{p99:>10.1f}{latencies.max():>10.1f}")
+    client_requests = sum(1 for name, _, _ in samples if not name.endswith("probe"))
+    print(f"\n{client_requests} client requests in {wall_seconds:.2f}s ({client_requests / wall_seconds:,.0f} req/s)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure API latency under concurrent dashboard clients")
+    parser.add_argument("--url", default=DEFAULT_URL, help=f"API base URL (default: {DEFAULT_URL})")
+    parser.add_argument("--clients", type=int, default=DEFAULT_CLIENTS, help="concurrent clients")
+    parser.add_argument("--rounds", type=int, default=DEFAULT_ROUNDS, help="dashboard refreshes per client")
+    parser.add_argument("--user", default="user_1", help="user whose data the clients load")
+    parser.add_argument("--metric", default="intraday_heart_rate", help="metric the clients load")
+    args = parser.parse_args()
+
+    base_url = args.url.rstrip("/")
+    paths = dashboard_paths(args.user, args.metric)
+    # Warm up connections and caches so the first requests do not skew the percentiles
+    for _, path in paths:
+        elapsed, ok = timed_get(base_url + path)
+        if not ok:
+            print(f"Warm-up request to {path} failed; is the API running at {base_url}?")
+            sys.exit(1)
+
+    start_barrier = threading.Barrier(args.clients)
+    stop_probe = threading.Event()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients + 1) as executor:
+        probe = executor.submit(run_probe, base_url, stop_probe)
+        futures = [executor.submit(run_client, base_url, paths, args.rounds, start_barrier) for _ in range(args.clients)]
+        samples = [sample for future in futures for sample in future.result()]
+        stop_probe.set()
+        samples.extend(probe.result())
+    summarize(samples, time.perf_counter() - started)
+
+if __name__ == "__main__":
+    main()
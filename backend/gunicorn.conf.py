@@ -0,0 +1,29 @@
+# Gunicorn settings for serving app.py with several uvicorn worker processes:
+#   WEB_CONCURRENCY=4 gunicorn -c gunicorn.conf.py app:app
+# Workers share nothing: each opens its own connection pool (DB_POOL_MAX connections per
+# worker) and writes its metrics to PROMETHEUS_MULTIPROC_DIR, which /prom-metrics merges.
+import os
+import glob
+
+# Set before prometheus_client is first imported: workers are forked from this process and
+# the library picks single- or multi-process mode when it is imported
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus")
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn_worker.UvicornWorker"
+# A worker whose event loop stops responding for this long is restarted
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+
+def on_starting(server):
+    # Metric files left by a previous run would be added to this run's counters
+    directory = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, "*.db")):
+        os.remove(path)
+
+def child_exit(server, worker):
+    # Drop the live gauges of a worker that exited so they are not summed any more
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,61 @@
+# Invalidation of the /data response cache (see cache_entry_affected and DataCache)
+from datetime import datetime, timedelta, timezone
+
+from app import DataCache, LocalDataCacheBackend, cache_entry_affected
+
+DAY = datetime(2031, 3, 4, tzinfo=timezone.utc)
+
+def cached_entry(cache: DataCache, key: str, start: datetime, end: datetime):
+    cache.set(key, cache.generation, "user_1", "intraday_heart_rate", start, end, b"{}", "application/json")
+
+def test_change_before_entry_in_its_first_bucket_invalidates():
+    # A daily or weekly response starting at 10:00 holds the whole bucket of that day, so a
+    # change at 08:00 alters a value it serves
+    change = DAY + timedelta(hours=8)
+    assert cache_entry_affected(DAY + timedelta(hours=10), DAY + timedelta(days=2), change, change)
+
+    cache = DataCache(LocalDataCacheBackend(max_entries=10, ttl_seconds=300))
+    cached_entry(cache, "daily", DAY + timedelta(hours=10), DAY + timedelta(days=2))
+    cache.invalidate("user_1", "intraday_heart_rate", change, change)
+    assert cache.get("daily") is None
+
+def test_change_after_entry_in_its_last_bucket_invalidates():
+    change = DAY + timedelta(days=2, hours=6)
+    assert cache_entry_affected(DAY, DAY + timedelta(days=2), change, change)
+
+def test_change_more_than_a_bucket_away_keeps_entry():
+    cache = DataCache(LocalDataCacheBackend(max_entries=10, ttl_seconds=300))
+    cached_entry(cache, "daily", DAY, DAY + timedelta(days=2))
+    cache.invalidate("user_1", "intraday_heart_rate", DAY - timedelta(days=9), DAY - timedelta(days=8))
+    cache.invalidate("user_1", "intraday_heart_rate", DAY + timedelta(days=10), DAY + timedelta(days=11))
+    cache.invalidate("user_2", None, None, None)
+    assert cache.get("daily") is not None
+
+def test_whole_series_change_invalidates():
+    assert cache_entry_affected(DAY, DAY + timedelta(days=1), None, None)
+
+class RacingRemoteBackend(LocalDataCacheBackend):
+    # A remote store whose write lands just after a change notification was applied
+    REMOTE = True
+
+    def __init__(self):
+        super().__init__(max_entries=10, ttl_seconds=300)
+        self.cache = None
+
+    def set(self, key, entry, ttl_seconds=None):
+        self.cache.invalidate("user_1", "intraday_heart_rate", DAY, DAY)
+        super().set(key, entry, ttl_seconds)
+
+    def delete(self, key, user_id, metric_type):
+        self.entries.pop(key, None)
+
+def test_response_read_before_a_change_is_not_kept():
+    backend = RacingRemoteBackend()
+    cache = backend.cache = DataCache(backend)
+    cached_entry(cache, "raw", DAY, DAY + timedelta(days=1))
+    assert cache.get("raw") is None
+
+    stale_generation = cache.generation
+    cache.invalidate("user_1", "intraday_heart_rate", DAY, DAY)
+    cache.set("raw", stale_generation, "user_1", "intraday_heart_rate", DAY, DAY + timedelta(days=1), b"{}", "application/json")
+    assert cache.get("raw") is None
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+# Background job worker: claims jobs from the Postgres `jobs` table and runs them outside
+# the request path. Usage:
+#   python worker.py [--processes N]                 serve the job queue
+#   python worker.py --bulk [--concurrency N] ...    impute every enrolled user and metric
+import os
+import sys
+import time
+import signal
+import argparse
+import threading
+import traceback
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+
+if __name__ == "__main__":
+    # Every worker and bulk process writes its metrics to this directory and the metrics
+    # server merges them. Set before prometheus_client is first imported: the library picks
+    # single- or multi-process mode when it is imported, and child processes inherit it.
+    os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", tempfile.mkdtemp(prefix="prometheus_worker_"))
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+from prometheus_client import Counter, Gauge, start_http_server, multiprocess
+
+from app import (db_config, job_queue, gap_detector, imputation_service, METRICS, GAP_SOURCES, JobLogWriter,
+                 ingest_for_range, INGEST_LOG_SINK, IMPORT_SUCCESS, data_points_processed, prometheus_registry)
+
+# Seconds an idle worker waits before polling the queue again
+POLL_INTERVAL_SECONDS = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+DEFAULT_WORKER_PROCESSES = int(os.getenv("JOB_WORKER_PROCESSES", "2"))
+
+# Bulk imputation settings; each bulk process handles one series at a time, so it needs
+# a single pooled connection and the run holds at most --concurrency connections
+DEFAULT_BULK_CONCURRENCY = int(os.getenv("BULK_IMPUTATION_CONCURRENCY", str(os.cpu_count() or 2)))
+BULK_POOL_MAX_PER_PROCESS = 1
+# Worker metrics (the job and bulk processes' counters merged, see main) are served here in
+# every mode
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "9200"))
+
+# Bulk imputation throughput; the rates are set by the bulk parent process only
+bulk_series_processed = Counter('bulk_imputation_series_total', 'Series processed by bulk imputation', ['status'])
+bulk_points_imputed = Counter('bulk_imputation_points_total', 'Points written by bulk imputation')
+bulk_series_rate = Gauge('bulk_imputation_series_per_second', 'Series per second in the current bulk imputation run', multiprocess_mode='livesum')
+bulk_points_rate = Gauge('bulk_imputation_points_per_second', 'Imputed points per second in the current bulk imputation run', multiprocess_mode='livesum')
+
+def log(msg: str):
+    print(f"[WORKER {os.getpid()}] {msg}", flush=True)
+
+# Detect (or load) the gaps of one series over a range, impute them and flag them as filled
+def run_imputation_job(params: dict, job_log: JobLogWriter = None) -> dict:
+    start_ts = datetime.fromisoformat(params["start_date"])
+    end_ts = datetime.fromisoformat(params["end_date"])
+    metrics = [params["metric"]]
+    if params.get("gap_source", "stored") == "stored":
+        gaps = gap_detector.load_stored_gaps(params["user_id"], metrics, start_ts, end_ts)
+    else:
+        gaps = gap_detector.detect_gaps_in_range(params["user_id"], metrics, start_ts, end_ts)
+
+    imputed_points = imputation_service.impute_gaps(gaps)
+    gap_detector.mark_imputed(gaps)
+    return {
+        "gaps_found": len(gaps),
+        "gaps_imputed": len([gap for gap in gaps if gap["gap_type"] != "long"]),
+        "imputed_points": len(imputed_points)
+    }
+
+# Generate or fetch data for one user over a range (POST /generate-data); ingestion log
+# lines go to the job's log instead of the process stdout
+def run_generate_job(params: dict, job_log: JobLogWriter = None) -> dict:
+    start_dt = datetime.fromisoformat(params["start_date"])
+    end_dt = datetime.fromisoformat(params["end_date"])
+    if job_log is not None:
+        job_log.write(f"Generating data for user {params['user_id']} (import success: {IMPORT_SUCCESS})")
+    token = INGEST_LOG_SINK.set(job_log.write) if INGEST_LOG_SINK is not None and job_log is not None else None
+    try:
+        result = ingest_for_range(start_dt, end_dt, params["user_id"])
+    finally:
+        if token is not None:
+            INGEST_LOG_SINK.reset(token)
+    data_points_processed.inc(result["total_points"])
+    return {
+        "total_points": result["total_points"],
+        "saved_points": result["saved_points"],
+        "start_date": result["start_time"],
+        "end_date": result["end_time"],
+        "import_success": IMPORT_SUCCESS
+    }
+
+# Renews the lease of a running job from a background thread while its handler works, so a
+# job that runs for longer than JOB_LEASE_SECONDS is never claimed by a second worker
+class JobHeartbeat:
+    def __init__(self, job: dict):
+        self.job_id = job["job_id"]
+        self.attempt = job["attempts"]
+        self.interval = max(job_queue.LEASE_SECONDS / 3, 1)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name=f"job-{self.job_id}-heartbeat", daemon=True)
+    
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                if not job_queue.renew_lease(self.job_id, self.attempt):
+                    log(f"job {self.job_id} lost its lease and was claimed again")
+                    return
+            except Exception as e:
+                # Retried on the next beat; the lease outlasts a few failed renewals
+                log(f"ERROR renewing lease of job {self.job_id}: {e}")
+    
+    def __enter__(self):
+        self.thread.start()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.stopped.set()
+        self.thread.join()
+        return False
+
+JOB_HANDLERS = {
+    "imputation": run_imputation_job,
+    "generate_data": run_generate_job,
+}
+
+# Claim and run jobs until stop_event is set
+def run_worker(stop_event):
+    # Workers are stopped by the parent through stop_event, not by Ctrl+C in every process
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    log("started")
+    while not stop_event.is_set():
+        try:
+            job = job_queue.claim(list(JOB_HANDLERS))
+        except Exception as e:
+            log(f"ERROR claiming job: {e}")
+            stop_event.wait(POLL_INTERVAL_SECONDS)
+            continue
+
+        if job is None:
+            stop_event.wait(POLL_INTERVAL_SECONDS)
+            continue
+
+        log(f"running job {job['job_id']} ({job['job_type']}, attempt {job['attempts']})")
+        started = time.time()
+        try:
+            # Log lines are flushed before the job is marked finished, so readers that see
+            # the final status have every line
+            with JobHeartbeat(job), JobLogWriter(db_config, job["job_id"]) as job_log:
+                try:
+                    result = JOB_HANDLERS[job["job_type"]](job["params"], job_log)
+                except Exception as e:
+                    job_log.write(f"Error: {e}")
+                    raise
+            if job_queue.finish(job["job_id"], job["attempts"], result=result):
+                log(f"job {job['job_id']} succeeded in {time.time() - started:.2f}s: {result}")
+            else:
+                log(f"job {job['job_id']} was claimed again while running; result of attempt {job['attempts']} dropped")
+        except Exception as e:
+            traceback.print_exc()
+            try:
+                job_queue.finish(job["job_id"], job["attempts"], error=str(e))
+            except Exception as finish_error:
+                # Left as running; another worker reclaims it once its lease expires
+                log(f"ERROR recording failure of job {job['job_id']}: {finish_error}")
+            log(f"job {job['job_id']} failed: {e}")
+    log("stopped")
+
+# Impute one series in a bulk process; failures are reported, not raised, so one bad
+# series does not stop the run
+def impute_series(params: dict) -> dict:
+    try:
+        return {**run_imputation_job(params), "error": None}
+    except Exception as e:
+        return {"gaps_found": 0, "gaps_imputed": 0, "imputed_points": 0, "error": str(e)}
+
+# Impute every enrolled user x METRICS series over a range with a process pool
+def run_bulk_imputation(concurrency: int, start_ts: datetime, end_ts: datetime, gap_source: str) -> dict:
+    with db_config.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT user_id FROM users ORDER BY user_id")
+        user_ids = [row[0] for row in cur.fetchall()]
+        cur.close()
+
+    series = [
+        {"user_id": user_id, "metric": metric, "start_date": start_ts.isoformat(),
+         "end_date": end_ts.isoformat(), "gap_source": gap_source}
+        for user_id in user_ids for metric in METRICS
+    ]
+    log(f"bulk imputation of {len(series)} series ({len(user_ids)} users) with {concurrency} processes")
+
+    # Spawned processes import app afresh and size their connection pool from these variables
+    os.environ["DB_POOL_MIN"] = "1"
+    os.environ["DB_POOL_MAX"] = str(BULK_POOL_MAX_PER_PROCESS)
+
+    totals = {"series": 0, "failed": 0, "gaps_found": 0, "imputed_points": 0}
+    started = time.time()
+    with ProcessPoolExecutor(max_workers=concurrency, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = {executor.submit(impute_series, params): params for params in series}
+        for future in as_completed(futures):
+            params = futures[future]
+            result = future.result()
+            totals["series"] += 1
+            totals["gaps_found"] += result["gaps_found"]
+            totals["imputed_points"] += result["imputed_points"]
+            if result["error"]:
+                totals["failed"] += 1
+                bulk_series_processed.labels(status="failed").inc()
+                log(f"{params['user_id']}/{params['metric']} failed: {result['error']}")
+            else:
+                bulk_series_processed.labels(status="succeeded").inc()
+            bulk_points_imputed.inc(result["imputed_points"])
+
+            elapsed = max(time.time() - started, 1e-9)
+            bulk_series_rate.set(totals["series"] / elapsed)
+            bulk_points_rate.set(totals["imputed_points"] / elapsed)
+            if totals["series"] % 100 == 0:
+                log(f"{totals['series']}/{len(series)} series, {totals['imputed_points']} points")
+
+    elapsed = time.time() - started
+    totals["seconds"] = round(elapsed, 2)
+    totals["series_per_second"] = round(totals["series"] / elapsed, 2) if elapsed else None
+    totals["points_per_second"] = round(totals["imputed_points"] / elapsed, 2) if elapsed else None
+    log(f"bulk imputation finished: {totals}")
+    return totals
+
+def parse_bulk_date(value: str) -> datetime:
+    ts = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run background job workers")
+    parser.add_argument("--processes", type=int, default=DEFAULT_WORKER_PROCESSES,
+                        help="number of worker processes (default: JOB_WORKER_PROCESSES or 2)")
+    parser.add_argument("--bulk", action="store_true",
+                        help="impute all enrolled users and metrics once, then exit")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_BULK_CONCURRENCY,
+                        help="bulk mode: number of imputation processes (default: BULK_IMPUTATION_CONCURRENCY or CPU count)")
+    parser.add_argument("--start-date", default="1970-01-01T00:00:00+00:00",
+                        help="bulk mode: start of the range to impute (default: all history)")
+    parser.add_argument("--end-date", default=None,
+                        help="bulk mode: end of the range to impute (default: now)")
+    parser.add_argument("--gap-source", choices=GAP_SOURCES, default="stored",
+                        help="bulk mode: read gaps from data_gaps or detect them from raw_data")
+    args = parser.parse_args()
+
+    # One registry that merges every process's samples, kept up for the whole run
+    start_http_server(WORKER_METRICS_PORT, registry=prometheus_registry())
+
+    if args.bulk:
+        end_ts = parse_bulk_date(args.end_date) if args.end_date else datetime.now(timezone.utc)
+        run_bulk_imputation(max(1, args.concurrency), parse_bulk_date(args.start_date), end_ts, args.gap_source)
+        sys.exit(0)
+
+    stop_event = multiprocessing.Event()
+    workers = [multiprocessing.Process(target=run_worker, args=(stop_event,)) for _ in range(max(1, args.processes))]
+    for worker in workers:
+        worker.start()
+
+    def shutdown(signum, frame):
+        log(f"received signal {signum}, finishing current jobs")
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    for worker in workers:
+        worker.join()
+        # Drop the live gauges of the stopped process so they are not summed any more
+        multiprocess.mark_process_dead(worker.pid)
+    sys.exit(0)
+
+if __name__ == "__main__":
+    main()
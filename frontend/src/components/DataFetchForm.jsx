@@ -6,6 +6,42 @@ import { useUserContext } from '../hooks/useUserContext'
 import { validateDateRange } from '../utils/dateValidation'
 import Alert from './Alert'
 
+const API_BASE_URL = 'http://localhost:5001'
+
+// Imputation runs as a background job; poll until it finishes before reading the data
+const JOB_POLL_INTERVAL_MS = 1000
+const JOB_POLL_TIMEOUT_MS = 60000
+
+const runImputationJob = async ({ userId, metric, startISO, endISO }) => {
+  const response = await fetch(`${API_BASE_URL}/imputation/jobs`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ user_id: userId, metric, start_date: startISO, end_date: endISO })
+  })
+  if (!response.ok) {
+    const errorText = await response.text()
+    throw new Error(`Imputation job error: ${response.status} - ${errorText}`)
+  }
+
+  let job = await response.json()
+  const deadline = Date.now() + JOB_POLL_TIMEOUT_MS
+  while (job.status === 'queued' || job.status === 'running') {
+    if (Date.now() > deadline) {
+      throw new Error('Imputation is still running, please try again shortly')
+    }
+    await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL_MS))
+    const pollResponse = await fetch(`${API_BASE_URL}/imputation/jobs/${job.job_id}`)
+    if (!pollResponse.ok) {
+      throw new Error(`Imputation job error: ${pollResponse.status}`)
+    }
+    job = await pollResponse.json()
+  }
+  if (job.status === 'failed') {
+    throw new Error(`Imputation failed: ${job.error}`)
+  }
+  return job
+}
+
 const DataFetchForm = ({ timezone, onDataFetched }) => {
   // Form data state
   const [formData, setFormData] = useState({
@@ -117,6 +153,16 @@ const DataFetchForm = ({ timezone, onDataFetched }) => {
       const startISO = new Date(formData.startDate).toISOString()
       const endISO = new Date(formData.endDate).toISOString()
       
+      // Fill gaps in the background first, then read the stored imputed points
+      if (showImputedData) {
+        await runImputationJob({
+          userId: formData.userId,
+          metric: formData.metric,
+          startISO,
+          endISO
+        })
+      }
+      
       // Build API request parameters - only showImputedData affects backend
       const params = new URLSearchParams({
         start_date: startISO,
@@ -124,11 +170,12 @@ const DataFetchForm = ({ timezone, onDataFetched }) => {
         user_id: formData.userId,
         metric: formData.metric,
         include_imputed: showImputedData.toString(),
-        apply_imputation: showImputedData.toString(),
+        apply_imputation: showImputedData.toString(), // Reports gaps; they are already filled above
+        resolution: 'raw', // Gap rendering needs individual hourly points
         per_page: '10000'
       })
       
-      const response = await fetch(`http://localhost:5001/data?${params.toString()}`)
+      const response = await fetch(`${API_BASE_URL}/data?${params.toString()}`)
       
       if (!response.ok) {
         const errorText = await response.text()
@@ -2,6 +2,17 @@ import { useState, useCallback } from 'react'
 import { API_URL, DEFAULT_USER_ID } from '../utils/constants'
 import { validateDateRange } from '../utils/dateValidation'
 
+// Stream a job's log lines (server-sent events) until its final `done` event, which
+// resolves with the finished job; EventSource reconnects on its own after network errors
+const followJobLogs = (url, onLine) => new Promise((resolve) => {
+  const source = new EventSource(url)
+  source.onmessage = (event) => onLine(event.data)
+  source.addEventListener("done", (event) => {
+    source.close()
+    resolve(JSON.parse(event.data))
+  })
+})
+
 export const useDataGeneration = () => {
   // State management for data generation process
   const [loading, setLoading] = useState(false)
@@ -67,22 +78,27 @@ export const useDataGeneration = () => {
         throw new Error(errorMessage)
       }
 
-      // Set success message with generation statistics
-      setSuccess(`Successfully generated ${data.total_points} data points (${data.saved_points} new records saved)`)
-      
-      // Store backend logs if available
-      if (data.logs && data.logs.length > 0) {
-        setLogs(data.logs)
-        console.log("Backend logs:", data.logs)
+      // Generation runs as a background job: follow its log stream until it finishes
+      console.log("Queued generation job:", data.job_id)
+      const job = await followJobLogs(`${API_URL}${data.logs_url}`, (line) => {
+        setLogs(previous => [...previous, line])
+      })
+
+      if (job.status !== "succeeded") {
+        throw new Error(job.error || "Data generation failed")
       }
+
+      const result = job.result
+      // Set success message with generation statistics
+      setSuccess(`Successfully generated ${result.total_points} data points (${result.saved_points} new records saved)`)
       
       console.log("Data generation successful:", {
-        totalPoints: data.total_points,
-        savedPoints: data.saved_points,
-        importSuccess: data.import_success
+        totalPoints: result.total_points,
+        savedPoints: result.saved_points,
+        importSuccess: result.import_success
       })
       
-      return data
+      return result
     } catch (e) {
       console.error("Generate error:", e)
       setError(e.message)
@@ -46,8 +46,8 @@ export const useHealthData = () => {
         end_date: new Date(endDate).toISOString(),
         user_id: userId,
         metric: backendMetric,
-        page: '1',
-        per_page: '1000'
+        // The server downsamples the whole range to a chart-sized series
+        max_points: '1000'
       })
 
       const url = `${API_BASE_URL}/data?${params}`
@@ -67,7 +67,8 @@ export const useHealthData = () => {
         dataSource: result.data_source,
         dateRangeDays: result.date_range_days,
         totalPoints: result.total,
-        returnedPoints: result.returned
+        returnedPoints: result.returned,
+        downsampledFrom: result.downsampled_from
       })
 
       const fetchedData = result.data || []
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# Compare save_data() load paths: multi-row INSERT (execute_values) vs COPY into a staging table.
+# Usage: python benchmark_load.py [ROWS ...]   (default: 10000 100000 1000000)
+# Writes hourly rows for throwaway users named bench_load_<n> and deletes them afterwards.
+import os
+import sys
+import time
+import datetime
+from datetime import timedelta
+
+import psycopg2
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from ingest import DB_PARAMS, METRICS, LA_TIMEZONE, save_data, log
+
+BENCH_USER_PREFIX = "bench_load_"
+# Each benchmark user gets SERIES_DAYS of hourly data per metric, like a two-month backfill
+SERIES_DAYS = 60
+DEFAULT_SIZES = [10000, 100000, 1000000]
+METHODS = ["values", "copy"]
+
+# Build `rows` hourly records spread over as many users as needed
+def build_records(rows: int):
+    start = datetime.datetime(2024, 1, 1, tzinfo=LA_TIMEZONE)
+    series_len = SERIES_DAYS * 24
+    records = []
+    series = 0
+    while len(records) < rows:
+        user_id = f"{BENCH_USER_PREFIX}{series // len(METRICS)}"
+        metric = METRICS[series % len(METRICS)]
+        for hour in range(min(series_len, rows - len(records))):
+            ts = (start + timedelta(hours=hour)).isoformat()
+            records.append((ts, user_id, metric, float((hour * 37 + series) % 100)))
+        series += 1
+    return records
+
+# Remove everything the benchmark wrote
+def cleanup():
+    conn = psycopg2.connect(**DB_PARAMS)
+    cur = conn.cursor()
+    for table in ["raw_data", "data_gaps", "user_baselines", "ingestion_watermarks", "fetch_checkpoints",
+                  "user_daily_stats", "user_stats"]:
+        cur.execute(f"DELETE FROM {table} WHERE user_id LIKE %s", (BENCH_USER_PREFIX + "%",))
+    conn.commit()
+    cur.close(); conn.close()
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+    results = []
+    try:
+        for rows in sizes:
+            records = build_records(rows)
+            for method in METHODS:
+                cleanup()
+                started = time.perf_counter()
+                saved = save_data(records, method=method)
+                elapsed = time.perf_counter() - started
+                results.append((rows, method, saved, elapsed))
+                log(f"[BENCH] {rows} rows via {method}: {elapsed:.2f}s, {rows / elapsed:,.0f} rows/sec")
+    finally:
+        cleanup()
+
+    print(f"\n{'rows':>10}  {'method':<8}{'saved':>10}{'seconds':>10}{'rows/sec':>12}{'speedup':>9}")
+    for rows, method, saved, elapsed in results:
+        baseline = next(e for r, m, _, e in results if r == rows and m == "values")
+        print(f"{rows:>10}  {method:<8}{saved:>10}{elapsed:>10.2f}{rows / elapsed:>12,.0f}{baseline / elapsed:>8.1f}x")
+
+if __name__ == "__main__":
+    main()
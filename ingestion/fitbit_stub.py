@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# Local stand-in for the wearipedia Fitbit device, used to exercise the real-mode fetch path
+# (chunking, concurrency, retries, rate-limit backoff, checkpoints) without a token.
+# Select it with FITBIT_DEVICE=stub; tune it with the FITBIT_STUB_* variables below.
+import os
+import time
+import random
+import datetime
+import threading
+
+# Every Nth call answers 429 with a Retry-After header (0 disables)
+STUB_RATE_LIMIT_EVERY = int(os.getenv("FITBIT_STUB_RATE_LIMIT_EVERY", "0"))
+STUB_RETRY_AFTER_SECONDS = os.getenv("FITBIT_STUB_RETRY_AFTER", "1")
+# Probability that a call fails with a transient connection error
+STUB_FAILURE_RATE = float(os.getenv("FITBIT_STUB_FAILURE_RATE", "0"))
+# Seconds each call takes, to make concurrency visible
+STUB_LATENCY_SECONDS = float(os.getenv("FITBIT_STUB_LATENCY", "0"))
+# Minutes between intraday points
+STUB_INTERVAL_MINUTES = int(os.getenv("FITBIT_STUB_INTERVAL_MINUTES", "60"))
+
+# Minimal requests.Response look-alike carrying what the fetch path inspects
+class StubResponse:
+    def __init__(self, status_code: int, headers: dict = None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+class StubHTTPError(Exception):
+    def __init__(self, message: str, response: StubResponse):
+        super().__init__(message)
+        self.response = response
+
+class StubFitbitDevice:
+    def __init__(self, seed: int = 0):
+        self.seed = seed
+        self.calls = []
+        self.lock = threading.Lock()
+        self.random = random.Random(seed)
+
+    def authenticate(self, token: str):
+        return True
+
+    # Same shape as wearipedia's intraday responses: one entry per day
+    def get_data(self, metric: str, params: dict):
+        with self.lock:
+            self.calls.append((metric, params["start_date"], params["end_date"]))
+            call_number = len(self.calls)
+            fail = self.random.random() < STUB_FAILURE_RATE
+        if STUB_LATENCY_SECONDS:
+            time.sleep(STUB_LATENCY_SECONDS)
+        if STUB_RATE_LIMIT_EVERY and call_number % STUB_RATE_LIMIT_EVERY == 0:
+            raise StubHTTPError("429 Too Many Requests",
+                                StubResponse(429, {"Retry-After": STUB_RETRY_AFTER_SECONDS, "Fitbit-Rate-Limit-Remaining": "0"}))
+        if fail:
+            raise ConnectionError("stub transient failure")
+
+        day = datetime.date.fromisoformat(params["start_date"])
+        end = datetime.date.fromisoformat(params["end_date"])
+        entries = []
+        while day <= end:
+            rng = random.Random(f"{self.seed}:{metric}:{day.isoformat()}")
+            dataset = [
+                {"time": f"{minute // 60:02d}:{minute % 60:02d}:00", "value": round(rng.uniform(50, 100), 1)}
+                for minute in range(0, 24 * 60, STUB_INTERVAL_MINUTES)
+            ]
+            entries.append({
+                "heart_rate_day": [{"activities-heart": [{"dateTime": day.isoformat()}]}],
+                "activities-heart-intraday": {"dataset": dataset},
+            })
+            day += datetime.timedelta(days=1)
+        return entries
@@ -1,14 +1,33 @@
 #!/usr/bin/env python3
 import os
+import io
+import csv
+import json
 import datetime
 import random
 from datetime import timedelta, timezone
+from itertools import repeat
+import numpy as np
 import psycopg2
 from psycopg2.extras import execute_values
 import wearipedia
 from dotenv import load_dotenv
 import pytz
+import time
+import threading
 import traceback
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait
+try:
+    from ingestion.shared_sql import (
+        baseline_upsert_sql, user_daily_stats_upsert_sql, refresh_data_gaps,
+        refresh_user_stats, notify_data_changed, notify_all_data_changed,
+    )
+except ImportError:
+    from shared_sql import (
+        baseline_upsert_sql, user_daily_stats_upsert_sql, refresh_data_gaps,
+        refresh_user_stats, notify_data_changed, notify_all_data_changed,
+    )
 
 # Load environment variables from .env
 load_dotenv()
@@ -53,13 +72,17 @@ except Exception as e:
 
 # Determine synthetic vs. real mode based on presence of a Fitbit token.
 # Note: real Fitbit API path untested without valid token
+# FITBIT_DEVICE=stub runs the real-mode fetch path against the local stub in fitbit_stub.py
 try:
     FITBIT_TOKEN = os.getenv("FITBIT_ACCESS_TOKEN", "")
-    SYNTHETIC = FITBIT_TOKEN == ""  # no token → synthetic
+    FITBIT_DEVICE = os.getenv("FITBIT_DEVICE", "fitbit/fitbit_charge_6")
+    SYNTHETIC = FITBIT_TOKEN == "" and FITBIT_DEVICE != "stub"  # no token → synthetic
     print(f"[INIT] FITBIT_TOKEN present: {bool(FITBIT_TOKEN)}")
+    print(f"[INIT] FITBIT_DEVICE: {FITBIT_DEVICE}")
     print(f"[INIT] SYNTHETIC mode: {SYNTHETIC}")
 except Exception as e:
     print(f"[INIT] ERROR setting FITBIT_TOKEN/SYNTHETIC: {e}")
+    FITBIT_DEVICE = "fitbit/fitbit_charge_6"
     SYNTHETIC = True
 
 try:
@@ -84,9 +107,69 @@ except Exception as e:
     print(f"[INIT] ERROR setting METRICS: {e}")
     raise
 
+# Concurrency limits for main(): users ingested in parallel, Fitbit API calls per user per
+# hour (Fitbit allows 150), and the wall-clock budget of one cron run
+try:
+    INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "4"))
+    FITBIT_REQUESTS_PER_HOUR = int(os.getenv("FITBIT_REQUESTS_PER_HOUR", "150"))
+    INGEST_TIME_BUDGET_SECONDS = int(os.getenv("INGEST_TIME_BUDGET_SECONDS", "3000"))
+    print(f"[INIT] INGEST_WORKERS: {INGEST_WORKERS}, FITBIT_REQUESTS_PER_HOUR: {FITBIT_REQUESTS_PER_HOUR}, "
+          f"INGEST_TIME_BUDGET_SECONDS: {INGEST_TIME_BUDGET_SECONDS}")
+except Exception as e:
+    print(f"[INIT] ERROR loading ingestion limits: {e}")
+    INGEST_WORKERS, FITBIT_REQUESTS_PER_HOUR, INGEST_TIME_BUDGET_SECONDS = 4, 150, 3000
+
+# Real-mode fetch: each metric's range is split into day chunks (aligned to a fixed
+# FETCH_CHUNK_DAYS grid so reruns produce the same chunks) fetched FITBIT_FETCH_WORKERS at a
+# time; failed calls are retried FETCH_MAX_RETRIES times with exponential backoff
+try:
+    FITBIT_FETCH_WORKERS = int(os.getenv("FITBIT_FETCH_WORKERS", "4"))
+    FETCH_CHUNK_DAYS = int(os.getenv("FETCH_CHUNK_DAYS", "7"))
+    FETCH_MAX_RETRIES = int(os.getenv("FETCH_MAX_RETRIES", "5"))
+    FETCH_BACKOFF_BASE_SECONDS = float(os.getenv("FETCH_BACKOFF_BASE_SECONDS", "1"))
+    FETCH_BACKOFF_MAX_SECONDS = float(os.getenv("FETCH_BACKOFF_MAX_SECONDS", "120"))
+    print(f"[INIT] FITBIT_FETCH_WORKERS: {FITBIT_FETCH_WORKERS}, FETCH_CHUNK_DAYS: {FETCH_CHUNK_DAYS}, "
+          f"FETCH_MAX_RETRIES: {FETCH_MAX_RETRIES}")
+except Exception as e:
+    print(f"[INIT] ERROR loading fetch settings: {e}")
+    FITBIT_FETCH_WORKERS, FETCH_CHUNK_DAYS, FETCH_MAX_RETRIES = 4, 7, 5
+    FETCH_BACKOFF_BASE_SECONDS, FETCH_BACKOFF_MAX_SECONDS = 1.0, 120.0
+
+# High-frequency synthetic mode: when SYNTHETIC_RESOLUTION is set (1s, 1m, 5m or 1h) synthetic
+# data follows per-metric ranges and circadian shapes at that resolution instead of one
+# uniform(0, 100) point per hour; series are generated SYNTHETIC_CHUNK_ROWS points at a time
+RESOLUTION_SECONDS = {"1s": 1, "1m": 60, "5m": 300, "1h": 3600}
+try:
+    SYNTHETIC_RESOLUTION = os.getenv("SYNTHETIC_RESOLUTION", "")
+    if SYNTHETIC_RESOLUTION and SYNTHETIC_RESOLUTION not in RESOLUTION_SECONDS:
+        raise ValueError(f"SYNTHETIC_RESOLUTION must be one of {list(RESOLUTION_SECONDS)}")
+    SYNTHETIC_CHUNK_ROWS = int(os.getenv("SYNTHETIC_CHUNK_ROWS", "200000"))
+    print(f"[INIT] SYNTHETIC_RESOLUTION: {SYNTHETIC_RESOLUTION or 'hourly uniform'}, SYNTHETIC_CHUNK_ROWS: {SYNTHETIC_CHUNK_ROWS}")
+except Exception as e:
+    print(f"[INIT] ERROR loading synthetic resolution: {e}")
+    SYNTHETIC_RESOLUTION, SYNTHETIC_CHUNK_ROWS = "", 200000
+
+# Realistic shape of each metric: value = mean + amplitude * cos(2*pi*(hour - peak_hour)/24)
+# + normal noise, clipped to [low, high]; hour is LA local time
+METRIC_PROFILES = {
+    "intraday_heart_rate":          {"mean": 70.0, "amplitude": 12.0, "peak_hour": 15, "noise": 6.0, "low": 40, "high": 190},
+    "intraday_breath_rate":         {"mean": 15.0, "amplitude": 2.0, "peak_hour": 15, "noise": 1.2, "low": 8, "high": 30},
+    "intraday_active_zone_minutes": {"mean": 0.4, "amplitude": 0.5, "peak_hour": 17, "noise": 0.6, "low": 0, "high": 3},
+    "intraday_activity":            {"mean": 40.0, "amplitude": 45.0, "peak_hour": 13, "noise": 30.0, "low": 0, "high": 250},
+    "intraday_hrv":                 {"mean": 45.0, "amplitude": 10.0, "peak_hour": 3, "noise": 8.0, "low": 10, "high": 150},
+    "intraday_spo2":                {"mean": 96.5, "amplitude": 0.8, "peak_hour": 4, "noise": 0.8, "low": 88, "high": 100},
+}
+
+# Optional per-job callback that also receives every log line (set by the backend's
+# generate_data jobs); context-local, so concurrent jobs in one process stay separate
+LOG_SINK = contextvars.ContextVar("ingest_log_sink", default=None)
+
 def log(msg: str):
     try:
-        print(f"[LOG] {msg}")
+        print(f"[LOG] [{threading.current_thread().name}] {msg}", flush=True)
+        sink = LOG_SINK.get()
+        if sink is not None:
+            sink(msg)
     except Exception as e:
         print(f"[LOG ERROR] {e}")
 
@@ -146,7 +229,8 @@ def validate_date_constraints(start_dt: datetime.datetime, end_dt: datetime.date
         log(f"ERROR in validate_date_constraints(): {e}")
         traceback.print_exc()
         return f"Validation error: {str(e)}"
-# Read and parse the last ingestion timestamp, falling back to 24h ago if file missing.
+# Read and parse the legacy last_run timestamp, falling back to 24h ago if file missing.
+# Only used as the starting point for series that have no row in ingestion_watermarks yet.
 def get_last_timestamp() -> datetime.datetime:
     try:
         log(f"get_last_timestamp() reading from {LAST_RUN_FILE}")
@@ -176,51 +260,131 @@ def get_last_timestamp() -> datetime.datetime:
         traceback.print_exc()
         raise
 
-# Write the provided timestamp back to last_run file.
-def update_last_run(ts: datetime.datetime):
+# Longest window a delta load fetches for one series (same limit as validate_date_constraints)
+MAX_DELTA_DAYS = 60
+
+# Per-series delta-load progress. A fetched window advances the watermark only when it starts
+# at or before the current watermark, so backfilling an old range never moves it backwards
+# and never jumps it over data that was not fetched; GREATEST keeps parallel ingesters safe.
+WATERMARK_UPSERT_SQL = """
+INSERT INTO ingestion_watermarks (user_id, metric_type, last_timestamp)
+SELECT w.user_id, w.metric_type, w.fetched_to
+FROM (VALUES %s) AS w (user_id, metric_type, fetched_from, fetched_to)
+LEFT JOIN ingestion_watermarks iw USING (user_id, metric_type)
+WHERE iw.last_timestamp IS NULL OR w.fetched_from <= iw.last_timestamp
+ON CONFLICT (user_id, metric_type) DO UPDATE
+SET last_timestamp = GREATEST(ingestion_watermarks.last_timestamp, EXCLUDED.last_timestamp),
+    updated_at = NOW()
+"""
+
+# Read the watermark of every (user, metric) series of the given users.
+def get_watermarks(user_ids):
     try:
-        log(f"update_last_run() called with {ts}")
-        if ts.tzinfo != LA_TIMEZONE:
-            ts = ts.astimezone(LA_TIMEZONE)
-            log(f"Converted to LA timezone: {ts}")
-        with open(LAST_RUN_FILE, "w") as f:
-            f.write(ts.isoformat())
-            log(f"Wrote timestamp to {LAST_RUN_FILE}: {ts.isoformat()}")
+        conn = psycopg2.connect(**DB_PARAMS)
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT user_id, metric_type, last_timestamp FROM ingestion_watermarks WHERE user_id = ANY(%s)",
+            (list(user_ids),)
+        )
+        watermarks = {(user_id, metric_type): ts.astimezone(LA_TIMEZONE) for user_id, metric_type, ts in cur.fetchall()}
+        cur.close(); conn.close()
+        log(f"Loaded {len(watermarks)} watermarks for {len(user_ids)} users")
+        return watermarks
     except Exception as e:
-        log(f"ERROR in update_last_run(): {e}")
+        log(f"ERROR in get_watermarks(): {e}")
         traceback.print_exc()
         raise
 
-# Generate synthetic hourly data for a metric between start and end.
+# Token bucket limiting the Fitbit API calls made for one user.
+class RateLimiter:
+    def __init__(self, requests_per_hour: int, burst: int = None):
+        self.rate = requests_per_hour / 3600.0
+        self.capacity = burst if burst is not None else len(METRICS)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    # Block until a call is allowed; raise TimeoutError if that would pass the deadline
+    def acquire(self, deadline: float = None):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                blocked = self.blocked_until - now
+                if blocked <= 0 and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_seconds = max(blocked, (1 - self.tokens) / self.rate if self.tokens < 1 else 0)
+            if deadline is not None and time.monotonic() + wait_seconds > deadline:
+                raise TimeoutError("Fitbit rate limit wait exceeds the ingestion time budget")
+            time.sleep(wait_seconds)
+
+    # Stop every caller sharing this limiter for `seconds` (the API answered 429)
+    def pause(self, seconds: float):
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+# Generate synthetic hourly timestamps (datetime64[s], UTC) and values for one series.
+# The hourly grid starts at start's hour in LA time; values are deterministic for a given seed.
+def synthetic_series(start: datetime.datetime, end: datetime.datetime, seed: int):
+    try:
+        first = start.astimezone(LA_TIMEZONE).replace(minute=0, second=0, microsecond=0)
+        hours = max(0, int((end - first) // timedelta(hours=1)) + 1)
+        rng = np.random.default_rng(seed)
+        base = np.datetime64(first.astimezone(timezone.utc).replace(tzinfo=None), 's')
+        timestamps = base + np.arange(hours, dtype=np.int64) * np.timedelta64(3600, 's')
+        values = rng.uniform(0, 100, hours)
+        return timestamps, values
+    except Exception as e:
+        log(f"ERROR in synthetic_series(): {e}")
+        traceback.print_exc()
+        raise
+
+# Stream realistic synthetic data for one series as (timestamps datetime64[s], values) chunks of
+# at most chunk_rows points, so arbitrarily long high-frequency ranges never sit in memory at once.
+def synthetic_chunks(start: datetime.datetime, end: datetime.datetime, metric: str, seed: int,
+                     resolution_seconds: int, chunk_rows: int = None):
+    try:
+        chunk_rows = chunk_rows or SYNTHETIC_CHUNK_ROWS
+        profile = METRIC_PROFILES[metric]
+        first = int(start.timestamp()) // resolution_seconds * resolution_seconds
+        total = max(0, (int(end.timestamp()) - first) // resolution_seconds + 1)
+        rng = np.random.default_rng(seed)
+        for offset in range(0, total, chunk_rows):
+            count = min(chunk_rows, total - offset)
+            epoch = first + (offset + np.arange(count, dtype=np.int64)) * resolution_seconds
+            # LA UTC offset looked up once per distinct UTC hour, so DST changes inside a chunk are exact
+            utc_hours, index = np.unique(epoch // 3600, return_inverse=True)
+            offsets = np.array([
+                datetime.datetime.fromtimestamp(int(hour) * 3600, LA_TIMEZONE).utcoffset().total_seconds()
+                for hour in utc_hours
+            ])
+            hours = ((epoch + offsets[index]) % 86400) / 3600.0
+            timestamps = epoch.astype('datetime64[s]')
+            values = (profile["mean"]
+                      + profile["amplitude"] * np.cos(2 * np.pi * (hours - profile["peak_hour"]) / 24)
+                      + rng.normal(0, profile["noise"], count))
+            yield timestamps, np.clip(values, profile["low"], profile["high"]).round(2)
+    except Exception as e:
+        log(f"ERROR in synthetic_chunks(): {e}")
+        traceback.print_exc()
+        raise
+
+# Generate hourly uniform synthetic data for a metric between start and end as raw_data records.
+# High-frequency data (SYNTHETIC_RESOLUTION) is never built as records: see stream_synthetic_data.
 def synthetic_data(start: datetime.datetime, end: datetime.datetime, metric: str, seed: int = None, user_id: str = None):
     try:
         log(f"synthetic_data() called with start={start}, end={end}, metric={metric}, seed={seed}, user_id={user_id}")
         if seed is None:
             seed = SEED
-            log(f"Using default seed: {seed}")
         if user_id is None:
             user_id = USER_ID
-            log(f"Using default user_id: {user_id}")
-        else:
-            log(f"Using provided user_id: {user_id}")
-        if start.tzinfo != LA_TIMEZONE:
-            start = start.astimezone(LA_TIMEZONE)
-            log(f"Converted start to LA timezone: {start}")
-        if end.tzinfo != LA_TIMEZONE:
-            end = end.astimezone(LA_TIMEZONE)
-            log(f"Converted end to LA timezone: {end}")
-        rows = []
-        current = start.replace(minute=0, second=0, microsecond=0)
-        log(f"Starting generation from: {current}")
-        count = 0
-        while current <= end:
-            ts = current.isoformat()
-            val = random.uniform(0, 100)
-            rows.append((ts, user_id, metric, val))
-            current += timedelta(hours=1)
-            count += 1
-            if count % 24 == 0:
-                log(f"Generated {count} points for {metric}, current time: {current}")
+        timestamps, values = synthetic_series(start, end, seed)
+        # ISO strings with a Z suffix, ready for execute_values or the COPY loader
+        ts_strings = np.datetime_as_string(timestamps, unit='s', timezone='UTC')
+        rows = list(zip(ts_strings.tolist(), repeat(user_id), repeat(metric), values.tolist()))
         log(f"Generated {len(rows)} synthetic data points for {metric}")
         return rows
     except Exception as e:
@@ -228,8 +392,170 @@ def synthetic_data(start: datetime.datetime, end: datetime.datetime, metric: str
         traceback.print_exc()
         raise
 
+# Authenticated Fitbit device: wearipedia's, or the local stub when FITBIT_DEVICE=stub.
+def get_fitbit_device():
+    try:
+        if FITBIT_DEVICE == "stub":
+            try:
+                from ingestion.fitbit_stub import StubFitbitDevice
+            except ImportError:
+                from fitbit_stub import StubFitbitDevice
+            device = StubFitbitDevice(SEED)
+        else:
+            device = wearipedia.get_device(FITBIT_DEVICE)
+        device.authenticate(FITBIT_TOKEN)
+        log(f"[REAL] Authenticated with {FITBIT_DEVICE}")
+        return device
+    except Exception as e:
+        log(f"ERROR in get_fitbit_device(): {e}")
+        traceback.print_exc()
+        raise
+
+# Seconds the API asked us to wait if `error` is a rate-limit (429) response, else None.
+# Honours Retry-After and Fitbit's Fitbit-Rate-Limit-Reset (seconds until the hourly reset).
+def rate_limit_delay(error):
+    response = getattr(error, "response", None)
+    if getattr(response, "status_code", None) != 429:
+        return None
+    headers = getattr(response, "headers", None) or {}
+    for header in ("Retry-After", "Fitbit-Rate-Limit-Reset"):
+        try:
+            return float(headers[header])
+        except (KeyError, TypeError, ValueError):
+            continue
+    return FETCH_BACKOFF_MAX_SECONDS
+
+# Split [first, last] (dates) into chunks aligned to a fixed FETCH_CHUNK_DAYS grid.
+def day_chunks(first: datetime.date, last: datetime.date):
+    chunks = []
+    day = first
+    while day <= last:
+        grid_end = datetime.date.fromordinal((day.toordinal() // FETCH_CHUNK_DAYS + 1) * FETCH_CHUNK_DAYS - 1)
+        chunk_end = min(grid_end, last)
+        chunks.append((day, chunk_end))
+        day = chunk_end + timedelta(days=1)
+    return chunks
+
+# Day chunks already fetched and saved for a user: {(metric, chunk_start, chunk_end)}.
+def get_fetch_checkpoints(user_id: str):
+    try:
+        conn = psycopg2.connect(**DB_PARAMS)
+        cur = conn.cursor()
+        cur.execute("SELECT metric_type, chunk_start, chunk_end FROM fetch_checkpoints WHERE user_id = %s", (user_id,))
+        done = set(cur.fetchall())
+        cur.close(); conn.close()
+        return done
+    except Exception as e:
+        log(f"ERROR in get_fetch_checkpoints(): {e}")
+        traceback.print_exc()
+        raise
+
+# Flatten wearipedia intraday day-entries into raw_data records.
+def parse_fitbit_entries(raw, user_id: str, metric: str):
+    rows = []
+    for entry in raw:
+        day_meta = entry.get("heart_rate_day", [{}])[0]
+        ah = day_meta.get("activities-heart", [])
+        if ah and "dateTime" in ah[0]: day_str = ah[0]["dateTime"]
+        else: day_str = day_meta.get("dateTime")
+        intraday = entry.get("activities-heart-intraday", {}).get("dataset", [])
+        for pt in intraday:
+            ts = f"{day_str}T{pt['time']}"
+            rows.append((ts, user_id, metric, pt['value']))
+    return rows
+
+# Fetch one metric's day chunk, retrying failures with exponential backoff (plus jitter).
+# A 429 pauses every fetch of this user for as long as the API asked.
+def fetch_fitbit_chunk(device, metric: str, chunk_start: datetime.date, chunk_end: datetime.date, user_id: str,
+                       rate_limiter: RateLimiter, deadline: float = None):
+    date_params = {"seed": SEED, "start_date": chunk_start.isoformat(), "end_date": chunk_end.isoformat()}
+    for attempt in range(FETCH_MAX_RETRIES + 1):
+        if deadline is not None and time.monotonic() >= deadline:
+            raise TimeoutError("Ingestion time budget exhausted")
+        rate_limiter.acquire(deadline)
+        try:
+            raw = device.get_data(metric, date_params)
+            rows = parse_fitbit_entries(raw, user_id, metric)
+            log(f"[FETCH] {metric} {chunk_start} → {chunk_end}: {len(raw)} days, {len(rows)} points")
+            return rows
+        except Exception as e:
+            if attempt == FETCH_MAX_RETRIES:
+                raise
+            backoff = min(FETCH_BACKOFF_MAX_SECONDS, FETCH_BACKOFF_BASE_SECONDS * 2 ** attempt) * random.uniform(0.5, 1.0)
+            retry_after = rate_limit_delay(e)
+            if retry_after is not None:
+                log(f"[FETCH] {metric} {chunk_start}: rate limited, pausing {max(retry_after, backoff):.1f}s")
+                rate_limiter.pause(max(retry_after, backoff))
+            else:
+                log(f"[FETCH] {metric} {chunk_start}: attempt {attempt + 1} failed ({e}), retrying in {backoff:.1f}s")
+                if deadline is not None and time.monotonic() + backoff > deadline:
+                    raise TimeoutError("Fitbit retry backoff exceeds the ingestion time budget")
+                time.sleep(backoff)
+
+# Fetch every metric's day chunks concurrently. Chunks recorded in fetch_checkpoints are skipped,
+# so an interrupted backfill resumes where it stopped. A metric's window is only reported in
+# `windows` once all its chunks succeeded; past chunks that succeeded go to `checkpoints`.
+def fetch_fitbit_chunks(device, start_time: datetime.datetime, end_time: datetime.datetime, user_id: str,
+                        rate_limiter: RateLimiter, deadline: float = None, metric_starts: dict = None,
+                        windows: dict = None, checkpoints: list = None):
+    try:
+        done = get_fetch_checkpoints(user_id)
+        end_date = end_time.astimezone(LA_TIMEZONE).date()
+        tasks = []
+        for metric in METRICS:
+            metric_start = (metric_starts or {}).get(metric, start_time)
+            for chunk_start, chunk_end in day_chunks(metric_start.astimezone(LA_TIMEZONE).date(), end_date):
+                if (metric, chunk_start, chunk_end) not in done:
+                    tasks.append((metric, chunk_start, chunk_end))
+        log(f"[FETCH] {user_id}: {len(tasks)} chunks to fetch ({len(done)} checkpointed) with {FITBIT_FETCH_WORKERS} workers")
+
+        rows = []
+        failed_metrics = set()
+        with ThreadPoolExecutor(max_workers=max(1, FITBIT_FETCH_WORKERS), thread_name_prefix=f"fetch-{user_id}") as executor:
+            # Each task runs in a copy of the caller's context so its log lines reach LOG_SINK
+            futures = {
+                executor.submit(contextvars.copy_context().run,
+                                fetch_fitbit_chunk, device, metric, chunk_start, chunk_end, user_id, rate_limiter, deadline):
+                    (metric, chunk_start, chunk_end)
+                for metric, chunk_start, chunk_end in tasks
+            }
+            for future, (metric, chunk_start, chunk_end) in futures.items():
+                try:
+                    rows.extend(future.result())
+                except TimeoutError:
+                    # Past the time budget every queued chunk would time out as well: drop them
+                    # and let ingest_user skip the user, which resumes from its checkpoints
+                    cancelled = sum(pending.cancel() for pending in futures)
+                    log(f"[FETCH] {user_id}: time budget exhausted, {cancelled} queued chunks cancelled")
+                    raise
+                except Exception as e:
+                    log(f"[FETCH] ERROR {metric} {chunk_start} → {chunk_end} gave up: {e}")
+                    failed_metrics.add(metric)
+                    continue
+                # Today's chunk keeps growing, so only whole past days are checkpointed
+                if checkpoints is not None and chunk_end < end_date:
+                    checkpoints.append((user_id, metric, chunk_start, chunk_end))
+
+        for metric in METRICS:
+            if metric not in failed_metrics and windows is not None:
+                windows[(user_id, metric)] = ((metric_starts or {}).get(metric, start_time), end_time)
+        if failed_metrics:
+            log(f"[FETCH] {user_id}: incomplete metrics {sorted(failed_metrics)}, resumed from checkpoints next run")
+        return rows
+    except TimeoutError:
+        raise
+    except Exception as e:
+        log(f"ERROR in fetch_fitbit_chunks(): {e}")
+        traceback.print_exc()
+        raise
+
 # Fetch data: synthetic or real Fitbit API.
-def fetch_fitbit_data(start_time: datetime.datetime, end_time: datetime.datetime, user_id: str = None):
+# metric_starts optionally gives each metric its own start; every metric fetched successfully
+# is recorded in windows as {(user_id, metric): (start, end)} so save_data can advance watermarks,
+# and in real mode every completed past day chunk is appended to checkpoints.
+def fetch_fitbit_data(start_time: datetime.datetime, end_time: datetime.datetime, user_id: str = None,
+                      rate_limiter: RateLimiter = None, deadline: float = None,
+                      metric_starts: dict = None, windows: dict = None, checkpoints: list = None):
     try:
         log(f"fetch_fitbit_data() called with start={start_time}, end={end_time}, user_id={user_id}")
         log(f"SYNTHETIC mode: {SYNTHETIC}")
@@ -240,10 +566,12 @@ def fetch_fitbit_data(start_time: datetime.datetime, end_time: datetime.datetime
             for i, metric in enumerate(METRICS):
                 try:
                     log(f"[DRYRUN] Processing metric {i+1}/{len(METRICS)}: {metric}")
-                    random.seed(SEED + i)
-                    part = synthetic_data(start_time, end_time, metric, SEED + i, user_id)
+                    metric_start = (metric_starts or {}).get(metric, start_time)
+                    part = synthetic_data(metric_start, end_time, metric, SEED + i, user_id)
                     log(f"[DRYRUN] Generated {len(part)} points for {metric}")
                     rows.extend(part)
+                    if windows is not None:
+                        windows[(user_id, metric)] = (metric_start, end_time)
                     log(f"[DRYRUN] Total rows so far: {len(rows)}")
                 except Exception as e:
                     log(f"[DRYRUN] ERROR generating data for {metric}: {e}")
@@ -253,106 +581,342 @@ def fetch_fitbit_data(start_time: datetime.datetime, end_time: datetime.datetime
         else:
             log("[REAL] Using real Fitbit API")
             try:
-                device = wearipedia.get_device("fitbit/fitbit_charge_6")
-                device.authenticate(FITBIT_TOKEN)
-                log("[REAL] Authenticated with Fitbit")
-                date_params = {"seed": SEED, "start_date": start_time.date().isoformat(), "end_date": end_time.date().isoformat()}
-                log(f"[REAL] Date params: {date_params}")
-                for metric in METRICS:
-                    try:
-                        log(f"[FETCH] {metric}: {date_params['start_date']} → {date_params['end_date']}")
-                        raw = device.get_data(metric, date_params)
-                        log(f"[FETCH] Got {len(raw)} day-entries for {metric}")
-                        for entry in raw:
-                            day_meta = entry.get("heart_rate_day", [{}])[0]
-                            ah = day_meta.get("activities-heart", [])
-                            if ah and "dateTime" in ah[0]: day_str = ah[0]["dateTime"]
-                            else: day_str = day_meta.get("dateTime")
-                            intraday = entry.get("activities-heart-intraday", {}).get("dataset", [])
-                            for pt in intraday:
-                                ts = f"{day_str}T{pt['time']}"
-                                rows.append((ts, user_id, metric, pt['value']))
-                        log(f"[FETCH] Processed {metric}, total rows: {len(rows)}")
-                    except Exception as e:
-                        log(f"[FETCH] ERROR processing {metric}: {e}")
-                        traceback.print_exc()
+                device = get_fitbit_device()
+                if rate_limiter is None:
+                    rate_limiter = RateLimiter(FITBIT_REQUESTS_PER_HOUR)
+                rows = fetch_fitbit_chunks(device, start_time, end_time, user_id, rate_limiter, deadline,
+                                           metric_starts, windows, checkpoints)
+            except TimeoutError:
+                raise
             except Exception as e:
                 log(f"[REAL] ERROR with Fitbit API: {e}")
                 traceback.print_exc()
                 raise
         log(f"fetch_fitbit_data() returning {len(rows)} rows")
         return rows
+    except TimeoutError:
+        raise
     except Exception as e:
         log(f"ERROR in fetch_fitbit_data(): {e}")
         traceback.print_exc()
         raise
 
+# Refresh data_gaps for each series; spans maps (user_id, metric_type) -> (first, last) timestamp.
+# Runs on the caller's cursor so gaps are committed together with the points that changed them.
+def update_data_gaps(cur, spans):
+    try:
+        log(f"update_data_gaps() called for {len(spans)} series")
+        for (user_id, metric_type), count in refresh_data_gaps(cur, spans).items():
+            first_ts, last_ts = spans[(user_id, metric_type)]
+            log(f"[update_data_gaps] {user_id}/{metric_type}: {first_ts} → {last_ts}, {count} new gaps")
+    except Exception as e:
+        log(f"ERROR in update_data_gaps(): {e}")
+        traceback.print_exc()
+        raise
+
+# Batches of at least this many records are bulk-loaded with COPY through a staging table;
+# smaller batches (a typical hourly delta) use a multi-row INSERT
+COPY_MIN_ROWS = int(os.getenv("COPY_MIN_ROWS", "5000"))
+# Records serialized per COPY call, bounding the CSV buffer held in memory
+COPY_CHUNK_ROWS = 100000
+
+# Insert raw_data rows from `source` (a VALUES list or a SELECT), merge them into
+# user_baselines and user_daily_stats and return (user_id, metric_type, count, first, last)
+# per inserted series.
+def inserted_series_sql(source: str) -> str:
+    # Baselines and daily stats are merged from exactly the rows this batch inserted
+    baseline_sql = baseline_upsert_sql("inserted")
+    daily_stats_sql = user_daily_stats_upsert_sql("inserted")
+    return (
+        "WITH inserted AS ("
+        "  INSERT INTO raw_data (timestamp, user_id, metric_type, value) "
+        f"  {source} "
+        "  ON CONFLICT (timestamp, user_id, metric_type) DO NOTHING "
+        "  RETURNING user_id, metric_type, timestamp, value, is_imputed"
+        f"), baselines AS ({baseline_sql}), "
+        f"daily_stats AS ({daily_stats_sql}) "
+        "SELECT user_id, metric_type, COUNT(*), MIN(timestamp), MAX(timestamp) "
+        "FROM inserted GROUP BY user_id, metric_type;"
+    )
+
+# Multi-row INSERT path; one result row per series per page of 1000 records.
+def insert_records_values(cur, records):
+    try:
+        return execute_values(cur, inserted_series_sql("VALUES %s"), records, page_size=1000, fetch=True)
+    except Exception as e:
+        log(f"ERROR in insert_records_values(): {e}")
+        traceback.print_exc()
+        raise
+
+# Serialize one series chunk as COPY CSV without building per-row tuples first. The user and
+# metric fields are the same on every row, so csv.writer quotes them once (user ids are free
+# text and may hold commas, quotes or newlines).
+def series_csv(timestamps, user_id: str, metric: str, values) -> io.StringIO:
+    ts_strings = np.datetime_as_string(timestamps, unit='s', timezone='UTC').tolist()
+    prefix = io.StringIO()
+    csv.writer(prefix, lineterminator="").writerow(["", user_id, metric, ""])
+    prefix = prefix.getvalue()
+    return io.StringIO("".join(f"{ts}{prefix}{value!r}\n" for ts, value in zip(ts_strings, values.tolist())))
+
+# Bulk path: COPY CSV buffers into a temporary staging table, then move them into raw_data
+# with a single INSERT ... SELECT ... ON CONFLICT DO NOTHING.
+def insert_csv_copy(cur, buffers):
+    try:
+        cur.execute(
+            "CREATE TEMP TABLE raw_data_staging "
+            "(timestamp TIMESTAMPTZ, user_id TEXT, metric_type TEXT, value DOUBLE PRECISION) ON COMMIT DROP"
+        )
+        for buf in buffers:
+            buf.seek(0)
+            cur.copy_expert("COPY raw_data_staging (timestamp, user_id, metric_type, value) FROM STDIN WITH (FORMAT csv)", buf)
+        cur.execute(inserted_series_sql("SELECT timestamp, user_id, metric_type, value FROM raw_data_staging"))
+        return cur.fetchall()
+    except Exception as e:
+        log(f"ERROR in insert_csv_copy(): {e}")
+        traceback.print_exc()
+        raise
+
+# COPY a list of records, serialized COPY_CHUNK_ROWS at a time.
+def insert_records_copy(cur, records):
+    def buffers():
+        for offset in range(0, len(records), COPY_CHUNK_ROWS):
+            buf = io.StringIO()
+            csv.writer(buf).writerows(records[offset:offset + COPY_CHUNK_ROWS])
+            yield buf
+    return insert_csv_copy(cur, buffers())
+
+# Stream one series into raw_data chunk by chunk, one transaction per chunk, updating
+# baselines and data_gaps like save_data. window, the (start, end) the chunks cover, advances
+# the series watermark once every chunk is saved. Used by high-frequency synthetic ingestion
+# and the load test.
+def save_series_chunks(chunks, user_id: str, metric: str, window: tuple = None):
+    try:
+        conn = psycopg2.connect(**DB_PARAMS)
+        cur = conn.cursor()
+        inserted_count = 0
+        for timestamps, values in chunks:
+            rows = insert_csv_copy(cur, [series_csv(timestamps, user_id, metric, values)])
+            spans = {(row[0], row[1]): (row[3], row[4]) for row in rows}
+            update_data_gaps(cur, spans)
+            refresh_user_stats(cur, [user_id for user_id, _ in spans])
+            notify_data_changed(cur, spans)
+            conn.commit()
+            inserted_count += sum(row[2] for row in rows)
+        if window:
+            execute_values(cur, WATERMARK_UPSERT_SQL, [(user_id, metric, window[0], window[1])])
+            conn.commit()
+        cur.close(); conn.close()
+        return inserted_count
+    except Exception as e:
+        log(f"ERROR in save_series_chunks({user_id}, {metric}): {e}")
+        traceback.print_exc()
+        raise
+
+# High-frequency synthetic ingestion: each metric's realistic series at SYNTHETIC_RESOLUTION is
+# generated and COPY-loaded chunk by chunk, so a long range is never held as records. Metrics
+# saved completely are recorded in windows (their watermarks have advanced).
+# Returns (generated, inserted) point counts.
+def stream_synthetic_data(metric_starts: dict, end_time: datetime.datetime, user_id: str, windows: dict = None):
+    try:
+        log(f"[DRYRUN] Streaming {SYNTHETIC_RESOLUTION} synthetic data for {len(METRICS)} metrics of {user_id}")
+        generated, inserted = 0, 0
+        for i, metric in enumerate(METRICS):
+            sizes = []
+            def counted(chunks):
+                for timestamps, values in chunks:
+                    sizes.append(len(timestamps))
+                    yield timestamps, values
+            try:
+                metric_start = metric_starts[metric]
+                chunks = synthetic_chunks(metric_start, end_time, metric, SEED + i, RESOLUTION_SECONDS[SYNTHETIC_RESOLUTION])
+                inserted += save_series_chunks(counted(chunks), user_id, metric, (metric_start, end_time))
+                if windows is not None:
+                    windows[(user_id, metric)] = (metric_start, end_time)
+            except Exception as e:
+                log(f"[DRYRUN] ERROR streaming data for {metric}: {e}")
+                traceback.print_exc()
+            generated += sum(sizes)
+            log(f"[DRYRUN] {metric}: generated {sum(sizes)} points in {len(sizes)} chunks")
+        return generated, inserted
+    except Exception as e:
+        log(f"ERROR in stream_synthetic_data(): {e}")
+        traceback.print_exc()
+        raise
+
 # Save records to database with deduplication.
-def save_data(records):
+# Hourly/daily/weekly rollups are continuous aggregates refreshed by TimescaleDB itself;
+# user_baselines and data_gaps are updated here from the rows that were actually inserted,
+# and the watermarks of the fetched windows advance in the same transaction.
+# method forces "values" or "copy"; by default COPY is used from COPY_MIN_ROWS records up.
+# checkpoints lists fetched (user_id, metric, chunk_start, chunk_end) day chunks to record.
+def save_data(records, windows: dict = None, method: str = None, checkpoints: list = None):
     try:
         log(f"save_data() called with {len(records) if records else 0} records")
-        if not records:
+        if not records and not windows and not checkpoints:
             log("[save_data] No records to save")
             return 0
         log("[save_data] Connecting to database...")
         log(f"[save_data] DB params: {dict((k, v if k != 'password' else '***') for k, v in DB_PARAMS.items())}")
         conn = psycopg2.connect(**DB_PARAMS)
         cur = conn.cursor()
-        sql = (
-            "INSERT INTO raw_data (timestamp, user_id, metric_type, value) "
-            "VALUES %s "
-            "ON CONFLICT (timestamp, user_id, metric_type) DO NOTHING;"
-        )
-        execute_values(cur, sql, records, page_size=1000)
+        if method is None:
+            method = "copy" if records and len(records) >= COPY_MIN_ROWS else "values"
+        log(f"[save_data] Insert method: {method}")
+        if not records:
+            pages = []
+        elif method == "copy":
+            pages = insert_records_copy(cur, records)
+        else:
+            pages = insert_records_values(cur, records)
+        inserted_count = 0
+        spans = {}
+        for user_id, metric_type, count, first_ts, last_ts in pages:
+            inserted_count += count
+            span = spans.get((user_id, metric_type), (first_ts, last_ts))
+            spans[(user_id, metric_type)] = (min(span[0], first_ts), max(span[1], last_ts))
+        update_data_gaps(cur, spans)
+        refresh_user_stats(cur, [user_id for user_id, _ in spans])
+        notify_data_changed(cur, spans)
+        if windows:
+            execute_values(cur, WATERMARK_UPSERT_SQL, [
+                (user_id, metric_type, fetched_from, fetched_to)
+                for (user_id, metric_type), (fetched_from, fetched_to) in windows.items()
+            ])
+        if checkpoints:
+            execute_values(cur,
+                "INSERT INTO fetch_checkpoints (user_id, metric_type, chunk_start, chunk_end) VALUES %s "
+                "ON CONFLICT DO NOTHING", checkpoints)
         conn.commit()
-        inserted_count = cur.rowcount
         cur.close(); conn.close()
-        log(f"[save_data] Inserted {inserted_count} rows")
+        log(f"[save_data] Inserted {inserted_count} rows, advanced {len(windows or {})} watermarks")
         return inserted_count
     except Exception as e:
         log(f"ERROR in save_data(): {e}")
         traceback.print_exc()
         raise
 
-def create_daily_aggregates():
-    """Create daily aggregates from raw hourly data"""
+# Rebuild data_gaps from scratch for every series in raw_data (backfill / manual maintenance).
+def scan_all_gaps():
     try:
-        log("create_daily_aggregates() called")
+        log("scan_all_gaps() called")
         conn = psycopg2.connect(**DB_PARAMS)
         cur = conn.cursor()
-        
-        # Create daily aggregates from all raw data
-        sql = """
-        INSERT INTO data_1d (date_day, user_id, metric_type, avg_value, min_value, max_value, count_points)
-        SELECT 
-            DATE(timestamp) as date_day,
-            user_id,
-            metric_type,
-            AVG(value) as avg_value,
-            MIN(value) as min_value,
-            MAX(value) as max_value,
-            COUNT(*) as count_points
-        FROM raw_data 
-        GROUP BY DATE(timestamp), user_id, metric_type
-        ON CONFLICT (date_day, user_id, metric_type) DO UPDATE SET
-            avg_value = EXCLUDED.avg_value,
-            min_value = EXCLUDED.min_value,
-            max_value = EXCLUDED.max_value,
-            count_points = EXCLUDED.count_points
-        """
-        
-        cur.execute(sql)
+        cur.execute(
+            "SELECT user_id, metric_type, MIN(timestamp), MAX(timestamp) FROM raw_data "
+            "WHERE COALESCE(is_imputed, FALSE) = FALSE GROUP BY user_id, metric_type"
+        )
+        spans = {(user_id, metric_type): (first_ts, last_ts) for user_id, metric_type, first_ts, last_ts in cur.fetchall()}
+        update_data_gaps(cur, spans)
         conn.commit()
-        affected = cur.rowcount
-        
+        cur.close(); conn.close()
+        log(f"Scanned gaps for {len(spans)} series")
+        return len(spans)
+    except Exception as e:
+        log(f"ERROR in scan_all_gaps(): {e}")
+        traceback.print_exc()
+        raise
+
+# Rebuild user_baselines from all measured points in raw_data (backfill / manual maintenance).
+def rebuild_baselines():
+    try:
+        log("rebuild_baselines() called")
+        conn = psycopg2.connect(**DB_PARAMS)
+        cur = conn.cursor()
+        cur.execute("DELETE FROM user_baselines")
+        cur.execute(baseline_upsert_sql("raw_data"))
+        rebuilt = cur.rowcount
+        conn.commit()
+        cur.close(); conn.close()
+        log(f"Rebuilt {rebuilt} baseline rows")
+        return rebuilt
+    except Exception as e:
+        log(f"ERROR in rebuild_baselines(): {e}")
+        traceback.print_exc()
+        raise
+
+# Rebuild user_daily_stats and user_stats from all of raw_data (backfill / manual maintenance).
+def rebuild_user_stats():
+    try:
+        log("rebuild_user_stats() called")
+        conn = psycopg2.connect(**DB_PARAMS)
+        cur = conn.cursor()
+        cur.execute("DELETE FROM user_daily_stats")
+        cur.execute("DELETE FROM user_stats")
+        cur.execute(user_daily_stats_upsert_sql("raw_data"))
+        cur.execute("SELECT DISTINCT user_id FROM user_daily_stats")
+        user_ids = [row[0] for row in cur.fetchall()]
+        refresh_user_stats(cur, user_ids)
+        conn.commit()
+        cur.close(); conn.close()
+        log(f"Rebuilt stats of {len(user_ids)} users")
+        return len(user_ids)
+    except Exception as e:
+        log(f"ERROR in rebuild_user_stats(): {e}")
+        traceback.print_exc()
+        raise
+
+# Continuous aggregates kept up to date by refresh policies in init.sql
+CONTINUOUS_AGGREGATES = ["data_1h", "data_1d", "data_1w"]
+
+# Force a full refresh of every continuous aggregate (manual maintenance only).
+def refresh_continuous_aggregates():
+    try:
+        log("refresh_continuous_aggregates() called")
+        conn = psycopg2.connect(**DB_PARAMS)
+        # refresh_continuous_aggregate cannot run inside a transaction block
+        conn.autocommit = True
+        cur = conn.cursor()
+        for view in CONTINUOUS_AGGREGATES:
+            log(f"Refreshing {view}")
+            cur.execute("CALL refresh_continuous_aggregate(%s, NULL, NULL)", (view,))
+        # Rebuilt buckets can change any cached aggregate response
+        notify_all_data_changed(cur)
         cur.close()
         conn.close()
-        
-        log(f"Created/updated {affected} daily aggregate records")
-        return affected
-        
+        log(f"Refreshed {len(CONTINUOUS_AGGREGATES)} continuous aggregates")
+        return len(CONTINUOUS_AGGREGATES)
+    except Exception as e:
+        log(f"ERROR in refresh_continuous_aggregates(): {e}")
+        traceback.print_exc()
+        raise
+
+# Users created by the load test are named loadtest_<n> so they are easy to find and delete
+LOAD_TEST_USER_PREFIX = "loadtest_"
+
+# Load test: enroll `users` synthetic users and stream `days` of realistic data for every metric
+# at `resolution` into raw_data, INGEST_WORKERS series at a time.
+def run_load_test(users: int, days: float, resolution: str = "1m"):
+    try:
+        if resolution not in RESOLUTION_SECONDS:
+            raise ValueError(f"resolution must be one of {list(RESOLUTION_SECONDS)}")
+        end = get_current_la_time()
+        start = end - timedelta(days=days)
+        user_ids = [f"{LOAD_TEST_USER_PREFIX}{n}" for n in range(users)]
+        conn = psycopg2.connect(**DB_PARAMS)
+        cur = conn.cursor()
+        execute_values(cur, "INSERT INTO users (user_id, enrollment_date) VALUES %s ON CONFLICT (user_id) DO NOTHING",
+                       [(user_id, start.replace(tzinfo=None)) for user_id in user_ids])
+        conn.commit()
+        cur.close(); conn.close()
+
+        series = [(user_id, i, metric) for user_id in user_ids for i, metric in enumerate(METRICS)]
+        log(f"[LOAD_TEST] {len(series)} series, {start.isoformat()} → {end.isoformat()} at {resolution}")
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=max(1, INGEST_WORKERS), thread_name_prefix="load") as executor:
+            futures = [
+                executor.submit(save_series_chunks,
+                                synthetic_chunks(start, end, metric, SEED + i, RESOLUTION_SECONDS[resolution]),
+                                user_id, metric)
+                for user_id, i, metric in series
+            ]
+            inserted = sum(future.result() for future in futures)
+        elapsed = time.monotonic() - started
+        result = {"users": users, "series": len(series), "resolution": resolution, "inserted_points": inserted,
+                  "seconds": round(elapsed, 2), "points_per_second": round(inserted / elapsed, 1) if elapsed else None}
+        log(f"[LOAD_TEST] {result}")
+        return result
     except Exception as e:
-        log(f"ERROR in create_daily_aggregates(): {e}")
+        log(f"ERROR in run_load_test(): {e}")
         traceback.print_exc()
         raise
 
@@ -365,7 +929,6 @@ def generate_synthetic_data_for_api(start_time: datetime.datetime, end_time: dat
         if error_msg: raise ValueError(error_msg)
         rows = []
         for i, metric in enumerate(METRICS):
-            random.seed(SEED + i)
             rows.extend(synthetic_data(start_time, end_time, metric, SEED + i, user_id))
         log(f"[API] Generated {len(rows)} total records")
         return rows
@@ -381,41 +944,107 @@ def ingest_for_range(start_dt: datetime.datetime, end_dt: datetime.datetime, use
     error_msg = validate_date_constraints(start_dt, end_dt)
     if error_msg: raise ValueError(error_msg)
     log(f"[RANGE_INGEST] Starting ingestion for range: {start_dt.isoformat()} → {end_dt.isoformat()}")
-    data = fetch_fitbit_data(start_dt, end_dt, user_id)
+    windows, checkpoints = {}, []
+    if SYNTHETIC and SYNTHETIC_RESOLUTION:
+        total, saved_count = stream_synthetic_data({metric: start_dt for metric in METRICS}, end_dt, user_id, windows)
+        log(f"[RANGE_INGEST] Streamed {total} data points, saved {saved_count} new records")
+        return {"total_points": total, "saved_points": saved_count, "start_time": start_dt.isoformat(), "end_time": end_dt.isoformat()}
+    data = fetch_fitbit_data(start_dt, end_dt, user_id, windows=windows, checkpoints=checkpoints)
     log(f"[RANGE_INGEST] Fetched {len(data)} data points")
-    saved_count = save_data(data)
+    # Watermarks only advance if this range continues from them (see WATERMARK_UPSERT_SQL)
+    saved_count = save_data(data, windows, checkpoints=checkpoints)
     log(f"[RANGE_INGEST] Saved {saved_count} new records")
-    
-    # Add auto-aggregation
-    if saved_count > 0:
-        log("[RANGE_INGEST] Generating daily aggregates")
-        agg_count = create_daily_aggregates()
-        log(f"[RANGE_INGEST] Updated {agg_count} daily aggregates")
-    
-    update_last_run(end_dt)
-    log(f"[RANGE_INGEST] Updated last_run to {end_dt.isoformat()}")
     return {"total_points": len(data), "saved_points": saved_count, "start_time": start_dt.isoformat(), "end_time": end_dt.isoformat()}
 
-#Main ingestion process - runs from last_run to now.
+# Users to ingest: everyone enrolled in the users table, or USER_ID if nobody is enrolled.
+def get_enrolled_users():
+    try:
+        conn = psycopg2.connect(**DB_PARAMS)
+        cur = conn.cursor()
+        cur.execute("SELECT user_id FROM users ORDER BY user_id")
+        user_ids = [row[0] for row in cur.fetchall()]
+        cur.close(); conn.close()
+        if not user_ids:
+            log(f"No enrolled users, falling back to USER_ID={USER_ID}")
+            user_ids = [USER_ID]
+        log(f"Found {len(user_ids)} users to ingest")
+        return user_ids
+    except Exception as e:
+        log(f"ERROR in get_enrolled_users(): {e}")
+        traceback.print_exc()
+        raise
+
+# Fetch and save one user's data from each metric's start; runs in the main() worker pool.
+def ingest_user(user_id: str, metric_starts: dict, end_dt: datetime.datetime, deadline: float):
+    try:
+        if time.monotonic() >= deadline:
+            log(f"[USER_INGEST] Skipping {user_id}: time budget exhausted")
+            return {"user_id": user_id, "status": "skipped"}
+        rate_limiter = RateLimiter(FITBIT_REQUESTS_PER_HOUR)
+        windows, checkpoints = {}, []
+        if SYNTHETIC and SYNTHETIC_RESOLUTION:
+            total, saved_count = stream_synthetic_data(metric_starts, end_dt, user_id, windows)
+        else:
+            data = fetch_fitbit_data(min(metric_starts.values()), end_dt, user_id, rate_limiter, deadline,
+                                     metric_starts, windows, checkpoints)
+            total, saved_count = len(data), save_data(data, windows, checkpoints=checkpoints)
+        # Metrics missing from windows had chunks that gave up; they resume from checkpoints
+        status = "ok" if len(windows) == len(METRICS) else "partial"
+        log(f"[USER_INGEST] {user_id}: fetched {total}, saved {saved_count}, {status}")
+        return {"user_id": user_id, "status": status, "total_points": total, "saved_points": saved_count}
+    except TimeoutError as e:
+        log(f"[USER_INGEST] {user_id} stopped: {e}")
+        return {"user_id": user_id, "status": "skipped"}
+    except Exception as e:
+        log(f"ERROR in ingest_user({user_id}): {e}")
+        traceback.print_exc()
+        return {"user_id": user_id, "status": "failed", "error": str(e)}
+
+# Where each series of a user resumes: its watermark, else the legacy last_run timestamp,
+# never further back than MAX_DELTA_DAYS.
+def get_metric_starts(user_id: str, watermarks: dict, fallback: datetime.datetime, now: datetime.datetime):
+    earliest = now - timedelta(days=MAX_DELTA_DAYS)
+    metric_starts = {}
+    for metric in METRICS:
+        start = watermarks.get((user_id, metric), fallback)
+        if start < earliest:
+            log(f"[MAIN_INGEST] {user_id}/{metric} is behind by more than {MAX_DELTA_DAYS} days, fetching from {earliest.isoformat()}")
+            start = earliest
+        metric_starts[metric] = start
+    return metric_starts
+
+#Main ingestion process - runs every enrolled user's series from its watermark to now.
 def main():
     try:
         log("main() called")
+        started = time.monotonic()
+        deadline = started + INGEST_TIME_BUDGET_SECONDS
         now = get_current_la_time()
-        last_run = get_last_timestamp()
-        log(f"[MAIN_INGEST] Running automatic ingestion: {last_run.isoformat()} → {now.isoformat()}")
-        data = fetch_fitbit_data(last_run, now, USER_ID)
-        log(f"[MAIN_INGEST] Fetched {len(data)} data points")
-        saved_count = save_data(data)
-        log(f"[MAIN_INGEST] Saved {saved_count} new records")
-        
-        # Add auto-aggregation here
-        if saved_count > 0:
-            log("[MAIN_INGEST] Generating daily aggregates")
-            agg_count = create_daily_aggregates()
-            log(f"[MAIN_INGEST] Updated {agg_count} daily aggregates")
-            
-        update_last_run(now)
-        log(f"[MAIN_INGEST] Updated last_run to {now.isoformat()}")
+        user_ids = get_enrolled_users()
+        watermarks = get_watermarks(user_ids)
+        fallback = get_last_timestamp() if len(watermarks) < len(user_ids) * len(METRICS) else now
+        log(f"[MAIN_INGEST] Running automatic ingestion up to {now.isoformat()} "
+            f"for {len(user_ids)} users with {INGEST_WORKERS} workers")
+
+        with ThreadPoolExecutor(max_workers=max(1, min(INGEST_WORKERS, len(user_ids))), thread_name_prefix="ingest") as executor:
+            futures = [
+                executor.submit(ingest_user, user_id, get_metric_starts(user_id, watermarks, fallback, now), now, deadline)
+                for user_id in user_ids
+            ]
+            done, not_done = wait(futures, timeout=INGEST_TIME_BUDGET_SECONDS)
+            for future in not_done:
+                future.cancel()
+        results = [future.result() for future in futures if not future.cancelled()]
+        results += [{"user_id": user_id, "status": "skipped"} for user_id, future in zip(user_ids, futures) if future.cancelled()]
+
+        # Users that failed or ran out of budget keep their watermarks and resume next run
+        saved_count = sum(result.get("saved_points", 0) for result in results)
+        incomplete = [result["user_id"] for result in results if result["status"] != "ok"]
+        log(f"[MAIN_INGEST] Saved {saved_count} new records for {len(results) - len(incomplete)}/{len(user_ids)} users "
+            f"in {time.monotonic() - started:.1f}s")
+        if incomplete:
+            log(f"[MAIN_INGEST] Incomplete users, retried next run: {incomplete}")
+        return results
     except Exception as e:
         log(f"ERROR in main(): {e}")
         traceback.print_exc()
@@ -437,6 +1066,25 @@ if __name__ == "__main__":
             if end_dt.tzinfo is None: end_dt = end_dt.replace(tzinfo=LA_TIMEZONE)
             result = ingest_for_range(start_dt, end_dt)
             print(f"Range ingestion complete: {result}")
+        elif len(sys.argv) > 1 and sys.argv[1] == "--rebuild-aggregates":
+            log("Aggregate rebuild mode selected")
+            print(f"Refreshed {refresh_continuous_aggregates()} continuous aggregates")
+        elif len(sys.argv) > 1 and sys.argv[1] == "--rebuild-baselines":
+            log("Baseline rebuild mode selected")
+            print(f"Rebuilt {rebuild_baselines()} baseline rows")
+        elif len(sys.argv) > 1 and sys.argv[1] == "--rebuild-user-stats":
+            log("User stats rebuild mode selected")
+            print(f"Rebuilt stats of {rebuild_user_stats()} users")
+        elif len(sys.argv) > 1 and sys.argv[1] == "--load-test":
+            log("Load test mode selected")
+            if len(sys.argv) not in (4, 5):
+                print(f"Usage: python ingest.py --load-test USERS DAYS [{'|'.join(RESOLUTION_SECONDS)}]")
+                sys.exit(1)
+            resolution = sys.argv[4] if len(sys.argv) == 5 else "1m"
+            print(f"Load test complete: {run_load_test(int(sys.argv[2]), float(sys.argv[3]), resolution)}")
+        elif len(sys.argv) > 1 and sys.argv[1] == "--scan-gaps":
+            log("Gap scan mode selected")
+            print(f"Scanned gaps for {scan_all_gaps()} series")
         else:
             log("Normal mode selected")
             main()
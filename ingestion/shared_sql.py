@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# SQL and helpers shared by ingestion (ingest.py) and the backend (app.py, worker.py). Every
+# writer of raw_data keeps the derived tables (data_gaps, user_baselines, user_daily_stats,
+# user_stats) and the backend's /data cache in step through these, in its own transaction.
+# Only the standard library is imported, so the backend can load this without ingestion's
+# dependencies.
+import json
+
+# Gap tiers by duration in hours: short <= 2, medium <= 10, long beyond that
+SHORT_GAP_MAX_HOURS = 2
+MEDIUM_GAP_MAX_HOURS = 10
+# Steps between measured points longer than this are gaps (hourly data, 50% tolerance)
+MAX_STEP_HOURS = 1.5
+
+# Baseline profiles are keyed by weekday and hour of day in this timezone
+BASELINE_TIMEZONE = "America/Los_Angeles"
+
+# The backend LISTENs on this channel and drops cached /data responses for the series and
+# span named in each payload; an empty payload drops everything. NOTIFY is delivered when the
+# transaction commits, so readers never refill the cache from uncommitted rows.
+DATA_CHANGED_CHANNEL = "raw_data_changed"
+
+# Rescan one series around newly inserted points and sync data_gaps. The window is widened
+# to the neighbouring measured points so gaps split or closed by the new points are replaced;
+# stale gaps are deleted and existing ones keep their imputation_applied flag.
+REFRESH_DATA_GAPS_SQL = """
+    WITH bounds AS (
+        SELECT
+            COALESCE((SELECT MAX(timestamp) FROM raw_data
+                      WHERE user_id = %(user_id)s AND metric_type = %(metric_type)s
+                      AND timestamp < %(first_inserted)s AND COALESCE(is_imputed, FALSE) = FALSE),
+                     %(first_inserted)s) AS window_start,
+            COALESCE((SELECT MIN(timestamp) FROM raw_data
+                      WHERE user_id = %(user_id)s AND metric_type = %(metric_type)s
+                      AND timestamp > %(last_inserted)s AND COALESCE(is_imputed, FALSE) = FALSE),
+                     %(last_inserted)s) AS window_end
+    ),
+    steps AS (
+        SELECT r.timestamp AS gap_start, LEAD(r.timestamp) OVER (ORDER BY r.timestamp) AS gap_end
+        FROM raw_data r, bounds b
+        WHERE r.user_id = %(user_id)s AND r.metric_type = %(metric_type)s
+        AND r.timestamp BETWEEN b.window_start AND b.window_end
+        AND COALESCE(r.is_imputed, FALSE) = FALSE
+    ),
+    detected AS (
+        SELECT gap_start, gap_end, EXTRACT(EPOCH FROM gap_end - gap_start) / 3600 AS gap_hours
+        FROM steps
+        WHERE gap_end - gap_start > %(max_step_hours)s * INTERVAL '1 hour'
+    ),
+    stale AS (
+        DELETE FROM data_gaps g USING bounds b
+        WHERE g.user_id = %(user_id)s AND g.metric_type = %(metric_type)s
+        AND g.gap_start >= b.window_start AND g.gap_end <= b.window_end
+        AND NOT EXISTS (SELECT 1 FROM detected d WHERE d.gap_start = g.gap_start AND d.gap_end = g.gap_end)
+    )
+    INSERT INTO data_gaps (user_id, metric_type, gap_start, gap_end, gap_duration_hours, gap_type)
+    SELECT %(user_id)s, %(metric_type)s, gap_start, gap_end, FLOOR(gap_hours)::int,
+           CASE WHEN gap_hours <= %(short_max_hours)s THEN 'short'
+                WHEN gap_hours <= %(medium_max_hours)s THEN 'medium'
+                ELSE 'long' END
+    FROM detected
+    ON CONFLICT (user_id, metric_type, gap_start, gap_end) DO NOTHING
+"""
+
+# Merge measured points from a row source into user_baselines, keyed by weekday and hour of
+# day in BASELINE_TIMEZONE. Each batch contributes (count, mean, sum of squared deviations);
+# existing rows are combined with the parallel variance formula so no history is rescanned.
+BASELINE_UPSERT_SQL = """
+    INSERT INTO user_baselines (user_id, metric_type, day_of_week, hour_of_day, sample_count, mean_value, m2_value)
+    SELECT user_id, metric_type,
+           EXTRACT(DOW FROM timestamp AT TIME ZONE '{timezone}')::smallint,
+           EXTRACT(HOUR FROM timestamp AT TIME ZONE '{timezone}')::smallint,
+           COUNT(*), AVG(value), VAR_POP(value) * COUNT(*)
+    FROM {source}
+    WHERE value IS NOT NULL AND COALESCE(is_imputed, FALSE) = FALSE
+    GROUP BY 1, 2, 3, 4
+    ON CONFLICT (user_id, metric_type, day_of_week, hour_of_day) DO UPDATE SET
+        sample_count = user_baselines.sample_count + EXCLUDED.sample_count,
+        mean_value = user_baselines.mean_value
+            + (EXCLUDED.mean_value - user_baselines.mean_value) * EXCLUDED.sample_count
+              / (user_baselines.sample_count + EXCLUDED.sample_count)::float8,
+        m2_value = user_baselines.m2_value + EXCLUDED.m2_value
+            + (EXCLUDED.mean_value - user_baselines.mean_value) ^ 2
+              * user_baselines.sample_count * EXCLUDED.sample_count
+              / (user_baselines.sample_count + EXCLUDED.sample_count)::float8,
+        updated_at = NOW()
+"""
+
+# Per-day record counts of each series, merged additively from the rows a batch inserted.
+# user_stats is recomputed from these rows, so distinct metrics and days never need a
+# raw_data scan. Days are UTC dates.
+USER_DAILY_STATS_UPSERT_SQL = """
+    INSERT INTO user_daily_stats (user_id, metric_type, day, record_count, imputed_count, first_record, last_record)
+    SELECT user_id, metric_type, (timestamp AT TIME ZONE 'UTC')::date,
+           COUNT(*), COUNT(*) FILTER (WHERE COALESCE(is_imputed, FALSE)), MIN(timestamp), MAX(timestamp)
+    FROM {source}
+    GROUP BY 1, 2, 3
+    ON CONFLICT (user_id, metric_type, day) DO UPDATE SET
+        record_count = user_daily_stats.record_count + EXCLUDED.record_count,
+        imputed_count = user_daily_stats.imputed_count + EXCLUDED.imputed_count,
+        first_record = LEAST(user_daily_stats.first_record, EXCLUDED.first_record),
+        last_record = GREATEST(user_daily_stats.last_record, EXCLUDED.last_record)
+"""
+
+REFRESH_USER_STATS_SQL = """
+    INSERT INTO user_stats (user_id, total_records, imputed_records, first_record, last_record,
+                            metrics_count, days_with_data, updated_at)
+    SELECT user_id, SUM(record_count), SUM(imputed_count), MIN(first_record), MAX(last_record),
+           COUNT(DISTINCT metric_type), COUNT(DISTINCT day), NOW()
+    FROM user_daily_stats
+    WHERE user_id = ANY(%(user_ids)s)
+    GROUP BY user_id
+    ON CONFLICT (user_id) DO UPDATE SET
+        total_records = EXCLUDED.total_records,
+        imputed_records = EXCLUDED.imputed_records,
+        first_record = EXCLUDED.first_record,
+        last_record = EXCLUDED.last_record,
+        metrics_count = EXCLUDED.metrics_count,
+        days_with_data = EXCLUDED.days_with_data,
+        updated_at = NOW()
+"""
+
+# BASELINE_UPSERT_SQL reading from `source` (a CTE name, table or subquery)
+def baseline_upsert_sql(source: str) -> str:
+    return BASELINE_UPSERT_SQL.format(timezone=BASELINE_TIMEZONE, source=source)
+
+# USER_DAILY_STATS_UPSERT_SQL reading from `source` (a CTE name, table or subquery)
+def user_daily_stats_upsert_sql(source: str) -> str:
+    return USER_DAILY_STATS_UPSERT_SQL.format(source=source)
+
+# Re-detect data_gaps for newly inserted points; spans maps (user_id, metric_type) to the
+# (first, last) inserted timestamp. Returns the number of gaps inserted per series.
+def refresh_data_gaps(cur, spans: dict) -> dict:
+    inserted = {}
+    for (user_id, metric_type), (first_ts, last_ts) in spans.items():
+        cur.execute(REFRESH_DATA_GAPS_SQL, {
+            "user_id": user_id,
+            "metric_type": metric_type,
+            "first_inserted": first_ts,
+            "last_inserted": last_ts,
+            "max_step_hours": MAX_STEP_HOURS,
+            "short_max_hours": SHORT_GAP_MAX_HOURS,
+            "medium_max_hours": MEDIUM_GAP_MAX_HOURS,
+        })
+        inserted[(user_id, metric_type)] = cur.rowcount
+    return inserted
+
+# Recompute user_stats of the given users from user_daily_stats. The per-user lock orders
+# concurrent writers, so the last one to commit recomputes from everyone's daily counts.
+def refresh_user_stats(cur, user_ids):
+    user_ids = sorted(set(user_ids))
+    for user_id in user_ids:
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext('user_stats:' || %s))", (user_id,))
+    if user_ids:
+        cur.execute(REFRESH_USER_STATS_SQL, {"user_ids": user_ids})
+
+# Tell every API process (and its /data cache) that series changed; delivered on commit.
+# spans maps (user_id, metric_type) to the (first, last) changed timestamp. A None metric_type
+# covers all of the user's series, a None span the whole series.
+def notify_data_changed(cur, spans: dict):
+    for (user_id, metric_type), (first_ts, last_ts) in spans.items():
+        cur.execute("SELECT pg_notify(%s, %s)", (DATA_CHANGED_CHANNEL, json.dumps({
+            "user_id": user_id,
+            "metric_type": metric_type,
+            "start": first_ts.isoformat() if first_ts else None,
+            "end": last_ts.isoformat() if last_ts else None,
+        })))
+
+# Tell every API process that any series may have changed (e.g. aggregates were rebuilt)
+def notify_all_data_changed(cur):
+    cur.execute("SELECT pg_notify(%s, '')", (DATA_CHANGED_CHANNEL,))
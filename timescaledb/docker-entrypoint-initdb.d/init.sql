@@ -25,22 +25,88 @@ CREATE UNIQUE INDEX IF NOT EXISTS raw_data_unique_idx
 -- Add index for imputation queries
 CREATE INDEX IF NOT EXISTS raw_data_imputed_idx ON raw_data (user_id, metric_type, is_imputed, timestamp);
 
--- Add daily aggregate table
-CREATE TABLE IF NOT EXISTS data_1d (
-    date_day DATE NOT NULL,
-    user_id TEXT NOT NULL,
-    metric_type TEXT NOT NULL,
-    avg_value DOUBLE PRECISION,
-    min_value DOUBLE PRECISION,
-    max_value DOUBLE PRECISION,
-    count_points INTEGER,
-    real_points INTEGER DEFAULT 0,
-    imputed_points INTEGER DEFAULT 0,
-    PRIMARY KEY (date_day, user_id, metric_type)
-);
+-- Add index for per-series range scans and keyset pagination on timestamp
+CREATE INDEX IF NOT EXISTS raw_data_series_time_idx ON raw_data (user_id, metric_type, timestamp);
+
+-- Continuous aggregates (hourly, daily, weekly) maintained by TimescaleDB refresh policies.
+-- real_* columns exclude imputed points so callers can aggregate measurements only.
+-- materialized_only = false serves buckets newer than the last refresh straight from raw_data.
+CREATE MATERIALIZED VIEW IF NOT EXISTS data_1h
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+SELECT
+    time_bucket(INTERVAL '1 hour', timestamp) AS bucket,
+    user_id,
+    metric_type,
+    AVG(value) AS avg_value,
+    MIN(value) AS min_value,
+    MAX(value) AS max_value,
+    COUNT(*) AS count_points,
+    SUM(CASE WHEN COALESCE(is_imputed, FALSE) THEN 0 ELSE 1 END) AS real_points,
+    SUM(CASE WHEN COALESCE(is_imputed, FALSE) THEN 1 ELSE 0 END) AS imputed_points,
+    SUM(CASE WHEN COALESCE(is_imputed, FALSE) THEN NULL ELSE value END) AS real_value_sum,
+    MIN(CASE WHEN COALESCE(is_imputed, FALSE) THEN NULL ELSE value END) AS real_min_value,
+    MAX(CASE WHEN COALESCE(is_imputed, FALSE) THEN NULL ELSE value END) AS real_max_value
+FROM raw_data
+GROUP BY bucket, user_id, metric_type
+WITH NO DATA;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS data_1d
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+SELECT
+    time_bucket(INTERVAL '1 day', timestamp) AS bucket,
+    user_id,
+    metric_type,
+    AVG(value) AS avg_value,
+    MIN(value) AS min_value,
+    MAX(value) AS max_value,
+    COUNT(*) AS count_points,
+    SUM(CASE WHEN COALESCE(is_imputed, FALSE) THEN 0 ELSE 1 END) AS real_points,
+    SUM(CASE WHEN COALESCE(is_imputed, FALSE) THEN 1 ELSE 0 END) AS imputed_points,
+    SUM(CASE WHEN COALESCE(is_imputed, FALSE) THEN NULL ELSE value END) AS real_value_sum,
+    MIN(CASE WHEN COALESCE(is_imputed, FALSE) THEN NULL ELSE value END) AS real_min_value,
+    MAX(CASE WHEN COALESCE(is_imputed, FALSE) THEN NULL ELSE value END) AS real_max_value
+FROM raw_data
+GROUP BY bucket, user_id, metric_type
+WITH NO DATA;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS data_1w
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+SELECT
+    time_bucket(INTERVAL '1 week', timestamp) AS bucket,
+    user_id,
+    metric_type,
+    AVG(value) AS avg_value,
+    MIN(value) AS min_value,
+    MAX(value) AS max_value,
+    COUNT(*) AS count_points,
+    SUM(CASE WHEN COALESCE(is_imputed, FALSE) THEN 0 ELSE 1 END) AS real_points,
+    SUM(CASE WHEN COALESCE(is_imputed, FALSE) THEN 1 ELSE 0 END) AS imputed_points,
+    SUM(CASE WHEN COALESCE(is_imputed, FALSE) THEN NULL ELSE value END) AS real_value_sum,
+    MIN(CASE WHEN COALESCE(is_imputed, FALSE) THEN NULL ELSE value END) AS real_min_value,
+    MAX(CASE WHEN COALESCE(is_imputed, FALSE) THEN NULL ELSE value END) AS real_max_value
+FROM raw_data
+GROUP BY bucket, user_id, metric_type
+WITH NO DATA;
+
+-- Refresh policies. start_offset => NULL covers all history, so old backfills, imputation
+-- writes and deletes are picked up; only invalidated buckets are recomputed on each run.
+SELECT add_continuous_aggregate_policy('data_1h',
+    start_offset => NULL,
+    end_offset => INTERVAL '1 hour',
+    schedule_interval => INTERVAL '15 minutes',
+    if_not_exists => TRUE);
+
+SELECT add_continuous_aggregate_policy('data_1d',
+    start_offset => NULL,
+    end_offset => INTERVAL '1 hour',
+    schedule_interval => INTERVAL '1 hour',
+    if_not_exists => TRUE);
 
--- Convert aggregate table to hypertable
-SELECT create_hypertable('data_1d', 'date_day', if_not_exists => TRUE);
+SELECT add_continuous_aggregate_policy('data_1w',
+    start_offset => NULL,
+    end_offset => INTERVAL '1 hour',
+    schedule_interval => INTERVAL '6 hours',
+    if_not_exists => TRUE);
 
 -- Create users table
 CREATE TABLE IF NOT EXISTS users (
@@ -64,4 +130,99 @@ CREATE TABLE IF NOT EXISTS data_gaps (
 );
 
 -- Add index for gap queries
-CREATE INDEX IF NOT EXISTS data_gaps_user_metric_idx ON data_gaps (user_id, metric_type, gap_start);
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS data_gaps_user_metric_idx ON data_gaps (user_id, metric_type, gap_start);
+-- Per-user baseline profiles: measured values by weekday and hour of day (America/Los_Angeles).
+-- Maintained incrementally by ingestion; mean_value and m2_value (sum of squared deviations
+-- from the mean) are merged batch by batch, so variance never needs a rescan of raw_data.
+CREATE TABLE IF NOT EXISTS user_baselines (
+    user_id TEXT NOT NULL,
+    metric_type TEXT NOT NULL,
+    day_of_week SMALLINT NOT NULL CHECK (day_of_week BETWEEN 0 AND 6),  -- 0 = Sunday
+    hour_of_day SMALLINT NOT NULL CHECK (hour_of_day BETWEEN 0 AND 23),
+    sample_count BIGINT NOT NULL,
+    mean_value DOUBLE PRECISION NOT NULL,
+    m2_value DOUBLE PRECISION NOT NULL,
+    variance DOUBLE PRECISION GENERATED ALWAYS AS (
+        CASE WHEN sample_count > 1 THEN m2_value / (sample_count - 1) END
+    ) STORED,
+    updated_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (user_id, metric_type, day_of_week, hour_of_day)
+);
+
+-- Background job queue (imputation and other long-running work), polled by backend/worker.py.
+-- job_key makes enqueueing idempotent, e.g. one imputation job per (user, metric, range).
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id BIGSERIAL PRIMARY KEY,
+    job_key TEXT NOT NULL UNIQUE,
+    job_type TEXT NOT NULL,
+    params JSONB NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'succeeded', 'failed')),
+    result JSONB,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    started_at TIMESTAMPTZ,
+    -- Lease of a running job: its worker renews it while the job runs, and a job whose lease
+    -- has expired (worker crashed or was killed) is claimed again
+    lease_expires_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ
+);
+
+-- Workers claim the oldest queued job of their types
+CREATE INDEX IF NOT EXISTS jobs_runnable_idx ON jobs (job_type, created_at) WHERE status IN ('queued', 'running');
+
+-- Delta-load progress per series: ingestion fetches each (user, metric) from last_timestamp
+-- onwards and advances it in the same transaction that inserts the fetched rows.
+CREATE TABLE IF NOT EXISTS ingestion_watermarks (
+    user_id TEXT NOT NULL,
+    metric_type TEXT NOT NULL,
+    last_timestamp TIMESTAMPTZ NOT NULL,
+    updated_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (user_id, metric_type)
+);
+
+-- Real-mode Fitbit fetch progress: day chunks (by LA date) fetched and saved per series, so an
+-- interrupted backfill only refetches the chunks that are missing.
+CREATE TABLE IF NOT EXISTS fetch_checkpoints (
+    user_id TEXT NOT NULL,
+    metric_type TEXT NOT NULL,
+    chunk_start DATE NOT NULL,
+    chunk_end DATE NOT NULL,
+    fetched_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (user_id, metric_type, chunk_start, chunk_end)
+);
+
+-- Log lines written by a running job (e.g. /generate-data), streamed back to the client
+CREATE TABLE IF NOT EXISTS job_logs (
+    log_id BIGSERIAL PRIMARY KEY,
+    job_id BIGINT NOT NULL REFERENCES jobs (job_id) ON DELETE CASCADE,
+    logged_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    message TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS job_logs_job_idx ON job_logs (job_id, log_id);
+
+-- Per-user statistics for /users and /enrolled-users, kept current by every writer of raw_data
+-- so listing users never scans raw_data. user_daily_stats holds additive counts per series
+-- and UTC day; user_stats is recomputed from it for the users a write touched.
+CREATE TABLE IF NOT EXISTS user_daily_stats (
+    user_id TEXT NOT NULL,
+    metric_type TEXT NOT NULL,
+    day DATE NOT NULL,
+    record_count BIGINT NOT NULL,
+    imputed_count BIGINT NOT NULL,
+    first_record TIMESTAMPTZ NOT NULL,
+    last_record TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (user_id, metric_type, day)
+);
+
+CREATE TABLE IF NOT EXISTS user_stats (
+    user_id TEXT PRIMARY KEY,
+    total_records BIGINT NOT NULL,
+    imputed_records BIGINT NOT NULL,
+    first_record TIMESTAMPTZ,
+    last_record TIMESTAMPTZ,
+    metrics_count INTEGER NOT NULL,
+    days_with_data INTEGER NOT NULL,
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);